@@ -0,0 +1,119 @@
+'''
+Aggregated view of the network, for large graphs.
+
+The nodes of every color category are collapsed into one super-node and the edges between two categories
+into one super-edge with the summed weight. A super-edge is two-way when the categories are connected in both
+directions. Expanding a category replaces its super-node with its nodes, placed around the position of the
+super-node, while the other categories stay collapsed.
+'''
+import numpy as np
+import pandas as pd
+
+from figures import create_figure_2d
+from metrics import timed
+from network_data import build_network
+
+SUPER_NODE_SIZE = (20, 60) # marker size of the smallest and of the largest super-node
+MEMBER_RADIUS = 0.5 # radius of the circle of the nodes of an expanded category, relative to the outer circle
+UNKNOWN_COLOR = 'lightgrey' # category of the nodes without a node_color
+
+
+def node_colors(network):
+    '''
+    -network: the Network of the dataset
+
+    Returns:
+    -an array with the color category of every node, in the order of the index nodes
+    -the list of the categories in the order of their first appearance
+    '''
+    colors = network.nodes.set_index('node_id')['node_color'].reindex(network.edge_index.node_ids)
+    colors = colors.fillna(UNKNOWN_COLOR).astype(str).to_numpy(dtype=object)
+    return colors, list(pd.unique(colors))
+
+
+@timed('aggregate_network')
+def aggregate_network(network, expanded=frozenset(), colors=None):
+    '''
+    -network: the Network of the dataset
+    -expanded: the color categories that are shown node by node
+    -colors: the result of node_colors(network), computed if not given
+
+    Returns:
+    -the aggregated Network. Its nodes are 'color:<category>' for the collapsed categories and
+    'node:<node_id>' for the nodes of the expanded ones, with the columns node_label, node_color,
+    node_size and category. The edges have the summed weights, with the inner edges of the
+    categories left out.
+    All the operations are grouped numpy/pandas operations over the edge index.
+    '''
+    index = network.edge_index
+    color, categories = colors if colors is not None else node_colors(network)
+    is_expanded = np.isin(color, list(expanded))
+    keys = np.where(is_expanded, 'node:' + index.node_ids.astype(str).astype(object), 'color:' + color)
+    group_code, group_ids = pd.factorize(keys)
+    source, target = group_code[index.source_code], group_code[index.target_code]
+    inner = source == target
+
+    members = np.bincount(group_code, minlength=len(group_ids))
+    first = np.unique(group_code, return_index=True)[1] #a representative node of every group
+    labels = pd.Series(network.node_labels[first]).astype(str).to_numpy(dtype=object)
+    collapsed = ~is_expanded[first]
+    super_labels = color[first] + ' (' + members.astype(str).astype(object) + ' nodes)'
+    sizes = np.full(len(group_ids), float(SUPER_NODE_SIZE[0]))
+    if collapsed.any():
+        share = np.sqrt(members/members[collapsed].max())
+        sizes = np.where(collapsed, SUPER_NODE_SIZE[0] + share*(SUPER_NODE_SIZE[1] - SUPER_NODE_SIZE[0]), sizes)
+    nodes = pd.DataFrame({'node_id': np.asarray(group_ids, dtype=object),
+                          'node_label': np.where(collapsed, super_labels, labels),
+                          'node_color': color[first],
+                          'node_size': sizes,
+                          'category': color[first]})
+
+    edges = pd.DataFrame({'source_id': np.asarray(group_ids, dtype=object)[source[~inner]],
+                          'target_id': np.asarray(group_ids, dtype=object)[target[~inner]],
+                          'weights': index.weight[~inner]})
+    edges = edges.groupby(['source_id', 'target_id'], sort=False, as_index=False)['weights'].sum()
+    return build_network(edges, nodes, include_isolated=True)
+
+
+def aggregate_positions(aggregated, categories, scale=2):
+    '''
+    -aggregated: the aggregated Network
+    -categories: all the color categories, in a fixed order so that the view doesn't move when expanding
+    -scale: the radius of the circle of the categories
+
+    Returns:
+    -a dictionary with key the node_id of the aggregated network and value its 2-d position. The super-nodes
+    are on a circle and the nodes of an expanded category on a smaller circle around the place of their super-node.
+    '''
+    angles = 2*np.pi*np.arange(len(categories))/max(len(categories), 1)
+    anchors = dict(zip(categories, scale*np.column_stack([np.cos(angles), np.sin(angles)])))
+    nodes = aggregated.nodes
+    pos = {}
+    for category, group in nodes.groupby('category', sort=False):
+        ids = group['node_id'].tolist()
+        if len(ids) == 1 and ids[0].startswith('color:'):
+            pos[ids[0]] = anchors[category]
+            continue
+        circle = 2*np.pi*np.arange(len(ids))/len(ids)
+        offsets = MEMBER_RADIUS*scale*np.column_stack([np.cos(circle), np.sin(circle)])
+        pos.update(zip(ids, anchors[category] + offsets))
+    return pos
+
+
+def create_aggregated_figure(network, expanded=frozenset(), colors=None, render_mode='svg'):
+    '''
+    -network: the Network of the dataset
+    -expanded: the color categories that are shown node by node
+    -colors: the result of node_colors(network), computed if not given
+    -render_mode: 'svg', 'webgl' or 'auto'
+
+    Returns:
+    -the 2-d figure of the aggregated network. The node traces carry the aggregated node ids as customdata,
+    so that a click on a super-node can expand it.
+    '''
+    colors = colors if colors is not None else node_colors(network)
+    aggregated = aggregate_network(network, expanded, colors)
+    pos = aggregate_positions(aggregated, colors[1])
+    fig = create_figure_2d(aggregated, pos, render_mode=render_mode, hover='embedded', with_ids=True)
+    fig.update_layout(title='Aggregated network: click on a category to expand it, on one of its nodes to collapse it')
+    return fig
@@ -0,0 +1,169 @@
+'''
+Graph analytics of the network on a sparse adjacency matrix.
+
+The weighted adjacency matrix is built in the CSR format from the arrays of the edge index (the columnar copy of
+the edges frame), and the analytics use numpy and scipy.sparse.csgraph instead of the networkx graph, so they stay
+fast with hundreds of thousands of edges: the in/out degrees and weighted degrees, the weighted PageRank, the
+strongly connected components and the shortest paths between two nodes, computed on demand.
+'''
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from metrics import span, timed
+
+DAMPING = 0.85 # the damping factor of the PageRank
+PAGERANK_TOL = 1.0e-10 # the PageRank stops when the L1 change of the ranks is below n_nodes*PAGERANK_TOL
+PAGERANK_MAX_ITER = 200
+TOP_NODES = 20 # number of nodes in the table of the analytics tab
+HIGHLIGHT_COLOR = 'darkorange'
+
+
+def node_codes(codes, n_nodes):
+    '''
+    -codes: the codes of nodes sent by the browser
+    -n_nodes: the number of nodes of the index
+
+    Returns:
+    -the list of the codes that are nodes of the index. The codes selected in a previous version of the dataset
+    (or sent by a malformed request) are left out.
+    '''
+    return [int(code) for code in codes if isinstance(code, (int, np.integer)) and not isinstance(code, bool) and 0 <= code < n_nodes]
+
+
+def adjacency_matrix(edge_index):
+    '''
+    -edge_index: the columnar edge index of the graph
+
+    Returns:
+    -the n_nodes x n_nodes CSR matrix with the weight of the edge from the row node to the column node
+    '''
+    n_nodes = len(edge_index.node_ids)
+    return sparse.csr_matrix((np.asarray(edge_index.weight, dtype=float), (edge_index.source_code, edge_index.target_code)),
+                             shape=(n_nodes, n_nodes))
+
+
+def pagerank(matrix, damping=DAMPING, tol=PAGERANK_TOL, max_iter=PAGERANK_MAX_ITER):
+    '''
+    -matrix: the CSR adjacency matrix with the edge weights
+    -damping: the probability to follow an edge rather than to jump to a random node
+    -tol: the tolerance of the power iteration, per node
+    -max_iter: the maximum number of iterations
+
+    Returns:
+    -array with the PageRank of every node, summing to 1. An edge is followed with a probability proportional
+    to its weight, and the nodes without outgoing edges jump to any node, as in networkx.pagerank.
+    '''
+    n_nodes = matrix.shape[0]
+    if n_nodes == 0:
+        return np.zeros(0)
+    out_weight = np.asarray(matrix.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    #the transposed transition matrix, so one iteration is a single sparse product
+    transition = (sparse.diags(np.divide(1.0, out_weight, out=np.zeros(n_nodes), where=~dangling)) @ matrix).T.tocsr()
+    ranks = np.full(n_nodes, 1.0/n_nodes)
+    for _ in range(max_iter):
+        previous = ranks
+        ranks = damping*(transition @ previous) + (damping*previous[dangling].sum() + 1 - damping)/n_nodes
+        if np.abs(ranks - previous).sum() < n_nodes*tol:
+            break
+    return ranks/ranks.sum()
+
+
+class GraphAnalytics:
+    '''
+    Analytics of the directed graph, computed once per dataset.
+
+    Attributes:
+    -matrix: the CSR adjacency matrix with the edge weights
+    -in_degree, out_degree: arrays with the number of incoming and outgoing edges of every node
+    -in_weight, out_weight: arrays with the summed weights of the incoming and outgoing edges of every node
+    -pagerank: array with the weighted PageRank of every node
+    -n_components: the number of strongly connected components
+    -component: array with the strongly connected component of every node, numbered from the largest one
+    -component_size: array with the size of the component of every node
+    The arrays are in the order of the index nodes.
+    '''
+
+    @timed('analytics')
+    def __init__(self, edge_index):
+        n_nodes = len(edge_index.node_ids)
+        self.matrix = adjacency_matrix(edge_index)
+        self.out_degree = np.bincount(edge_index.source_code, minlength=n_nodes)
+        self.in_degree = np.bincount(edge_index.target_code, minlength=n_nodes)
+        self.out_weight = np.bincount(edge_index.source_code, weights=edge_index.weight, minlength=n_nodes)
+        self.in_weight = np.bincount(edge_index.target_code, weights=edge_index.weight, minlength=n_nodes)
+        with span('pagerank'):
+            self.pagerank = pagerank(self.matrix)
+        with span('strong_components'):
+            self.n_components, labels = csgraph.connected_components(self.matrix, directed=True, connection='strong')
+        sizes = np.bincount(labels, minlength=self.n_components)
+        order = np.argsort(-sizes, kind='stable') #the components numbered by decreasing size
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.component = rank[labels]
+        self.component_size = sizes[labels]
+
+    def top_nodes(self, n=TOP_NODES):
+        '''
+        -n: the number of nodes
+
+        Returns:
+        -the codes of the n nodes with the highest PageRank, from the highest
+        '''
+        n = min(n, len(self.pagerank))
+        top = np.argpartition(-self.pagerank, n - 1)[:n] if n else np.zeros(0, dtype=int)
+        return top[np.argsort(-self.pagerank[top], kind='stable')]
+
+    @timed('shortest_path')
+    def shortest_path(self, source, target, weighted=False):
+        '''
+        -source, target: the codes of the nodes
+        -weighted: False for the path with the fewest edges, True for the path with the lowest total weight
+
+        Returns:
+        -the list with the codes of the nodes of the path, from source to target, empty if target is not reachable
+        or one of the codes is not a node
+        -the length of the path, the number of edges or the total weight
+        Only the distances from source are computed (a single Dijkstra search).
+        '''
+        if len(node_codes((source, target), self.matrix.shape[0])) < 2:
+            return [], np.inf
+        distances, predecessors = csgraph.dijkstra(self.matrix, directed=True, indices=source,
+                                                   unweighted=not weighted, return_predecessors=True)
+        if not np.isfinite(distances[target]):
+            return [], np.inf
+        path = [target]
+        while path[-1] != source:
+            path.append(predecessors[path[-1]])
+        return [int(node) for node in reversed(path)], float(distances[target])
+
+
+def highlight_traces(kind, pos, labels, nodes=(), path=()):
+    '''
+    -kind: '2d' or '3d'
+    -pos: array with the positions of the nodes, in the order of the index nodes
+    -labels: array with the labels of the nodes
+    -nodes: the codes of the selected nodes
+    -path: the codes of the nodes of a path
+
+    Returns:
+    -the specs of the traces drawn over a figure: the path as a thick line and a ring around every selected node.
+    The codes that are not nodes are not highlighted, and a path with such a code is not drawn.
+    '''
+    traces = []
+    path = path if len(node_codes(path, len(pos))) == len(path) else ()
+    axes = ('x', 'y') if kind == '2d' else ('x', 'y', 'z')
+    trace_type = 'scattergl' if kind == '2d' else 'scatter3d' #the WebGL traces are drawn over the svg ones
+    if len(path) > 1:
+        coords = pos[list(path)]
+        traces.append(dict({axis: coords[:, i] for i, axis in enumerate(axes)}, type=trace_type, mode='lines',
+                           line={'width': 6, 'color': HIGHLIGHT_COLOR}, name='Shortest path', hoverinfo='skip', showlegend=True))
+    nodes = node_codes(nodes, len(pos))
+    if nodes:
+        coords = pos[nodes]
+        traces.append(dict({axis: coords[:, i] for i, axis in enumerate(axes)}, type=trace_type, mode='markers',
+                           marker={'symbol': 'circle-open', 'size': 30 if kind == '2d' else 14, 'color': HIGHLIGHT_COLOR,
+                                   'line': {'width': 4}},
+                           text=np.asarray(labels, dtype=object)[nodes], hoverinfo='text', name='Selected nodes', showlegend=True))
+    return traces
@@ -0,0 +1,282 @@
+'''
+Precomputed artifact of the app, shared by the worker processes of the server.
+
+The artifact is a single file written by a precompute step (python artifacts.py) with everything the 2D and 3D
+tabs need: the arrays of the edge index, the labels, colors and 2d/3d positions of the nodes, the figures serialized
+as JSON and the html exports. The file is
+
+    MAGIC | length of the header (uint64, little endian) | JSON header | sections
+
+and every section (an array or a blob of bytes) starts at a multiple of ALIGNMENT after the header.
+
+The app opens the artifact with create_app(artifact_path=...). The file is memory-mapped read-only, so the arrays
+are numpy views over the mapping and all the workers of the server share the same pages of the page cache:
+the memory and the boot time of a worker don't grow with the size of the network, and nothing is computed when
+a worker starts. With gunicorn --preload the mapping is opened once in the master, before the workers are forked.
+'''
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from aggregation import node_colors
+from bundling import cached_bundles
+from downloads import PLOTLYJS_VARIANTS
+from edge_index import EDGE_ARRAYS, EdgeIndex
+from figures import HOVER_MODE, RENDER_MODE, WEIGHT_BUCKETS, figure_html, figure_json, figure_spec_2d, figure_spec_3d
+from layouts import LAYOUT_CACHE_DIR, compute_layout
+from metrics import span, timed
+from network_data import DATASET_PATH, dataset_hash, load_network
+
+MAGIC = b'NETWORK-ARTIFACT-1\n'
+ALIGNMENT = 64 # the sections start at multiples of 64 bytes, so the arrays are aligned for numpy
+ARTIFACT_PATH = 'network.artifact'
+
+logger = logging.getLogger('artifacts')
+
+
+def aligned(offset):
+    '''
+    -offset: a position in the file
+
+    Returns:
+    -the first multiple of ALIGNMENT at or after the offset
+    '''
+    return -(-offset//ALIGNMENT)*ALIGNMENT
+
+
+def write_artifact(path, header, arrays, blobs):
+    '''
+    -path: the path of the artifact
+    -header: dictionary with the options of the artifact, stored in the JSON header
+    -arrays: dictionary with the numpy arrays of the artifact, with fixed-size dtypes (no objects)
+    -blobs: dictionary with the bytes of the artifact
+
+    The file is written to a temporary file first and then renamed, so the workers never map half a file.
+    '''
+    sections, offset = [], 0
+    header = dict(header, arrays={}, blobs={})
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError('the array %r of the artifact has objects, they can not be memory-mapped' % name)
+        offset = aligned(offset)
+        header['arrays'][name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        sections.append((offset, array.tobytes()))
+        offset += array.nbytes
+    for name, blob in blobs.items():
+        offset = aligned(offset)
+        header['blobs'][name] = {'offset': offset, 'length': len(blob)}
+        sections.append((offset, blob))
+        offset += len(blob)
+
+    header_bytes = json.dumps(header).encode()
+    start = aligned(len(MAGIC) + 8 + len(header_bytes))
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.artifact')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes)
+        for section_offset, data in sections:
+            f.write(b'\0'*(start + section_offset - f.tell()))
+            f.write(data)
+    os.replace(tmp, path)
+
+
+@timed('build_artifact')
+def build_artifact(dataset_path=DATASET_PATH, path=ARTIFACT_PATH, render_mode=RENDER_MODE, layout_2d='auto',
+                   layout_3d='auto', hover_mode=HOVER_MODE, layout_cache_dir=LAYOUT_CACHE_DIR, edge_bundling=False,
+                   weight_buckets=WEIGHT_BUCKETS):
+    '''
+    -dataset_path: the path of the dataset
+    -path: the path of the artifact
+    -render_mode, layout_2d, layout_3d, hover_mode, edge_bundling, weight_buckets: the options of the figures, as in final_app.create_app
+    -layout_cache_dir: the folder of the cached layouts and bundles, None to disable it
+
+    Builds the network, the layouts, the figures and the html exports of the dataset and writes them to the artifact.
+    '''
+    digest = dataset_hash(dataset_path)
+    network = load_network(dataset_path)
+    index = network.edge_index
+    positions = {'2d': compute_layout(network.graph, 2, layout_2d, layout_cache_dir, dataset_path),
+                 '3d': compute_layout(network.graph, 3, layout_3d, layout_cache_dir, dataset_path)}
+    bundles = {kind: cached_bundles(index, positions[kind], cache_dir=layout_cache_dir, dataset=dataset_path) if edge_bundling else None
+               for kind in positions}
+
+    def figure(kind, hover):
+        if kind == '2d':
+            return figure_json(figure_spec_2d(network, positions['2d'], render_mode=render_mode, hover=hover, bundles=bundles['2d'],
+                                              n_buckets=weight_buckets))
+        return figure_json(figure_spec_3d(network, positions['3d'], hover=hover, bundles=bundles['3d'], n_buckets=weight_buckets))
+
+    arrays = {name: getattr(index, name) for name in ('node_ids', 'reverse') + EDGE_ARRAYS}
+    if arrays['node_ids'].dtype.hasobject:
+        arrays['node_ids'] = arrays['node_ids'].astype(str)
+    arrays['node_labels'] = np.asarray(network.node_labels).astype(str)
+    arrays['node_colors'] = node_colors(network)[0].astype(str)
+    blobs = {}
+    for kind in ('2d', '3d'):
+        arrays['positions_' + kind] = index.positions(positions[kind])
+        blobs['figure_' + kind] = figure(kind, hover_mode)
+        #the exported files have no server behind them, so the hover text is embedded
+        export = blobs['figure_' + kind] if hover_mode == 'embedded' else figure(kind, 'embedded')
+        for variant, include_plotlyjs in PLOTLYJS_VARIANTS.items():
+            blobs['export_%s_%s' % (kind, variant)] = figure_html(export, include_plotlyjs=include_plotlyjs)
+
+    header = {'dataset_hash': digest, 'options': artifact_options(render_mode, layout_2d, layout_3d, hover_mode, edge_bundling, weight_buckets)}
+    with span('write_artifact'):
+        write_artifact(path, header, arrays, blobs)
+
+
+def artifact_options(render_mode, layout_2d, layout_3d, hover_mode, edge_bundling=False, weight_buckets=WEIGHT_BUCKETS):
+    '''
+    -render_mode, layout_2d, layout_3d, hover_mode, edge_bundling, weight_buckets: the options of the figures
+
+    Returns:
+    -the options as stored in the header, compared by the app with its own options
+    '''
+    return {'render_mode': render_mode, 'layout_2d': layout_2d, 'layout_3d': layout_3d, 'hover_mode': hover_mode,
+            'edge_bundling': bool(edge_bundling), 'weight_buckets': int(weight_buckets)}
+
+
+class Artifact:
+    '''
+    Read-only memory mapping of an artifact file.
+
+    Attributes:
+    -path: the path of the artifact
+    -header: the JSON header, with the dataset_hash, the options and the offsets of the sections
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a network artifact' % path)
+        (length,) = struct.unpack_from('<Q', self._buffer, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._buffer[start:start + length])
+        self._start = aligned(start + length)
+
+    @property
+    def dataset_hash(self):
+        return self.header['dataset_hash']
+
+    @property
+    def options(self):
+        return self.header['options']
+
+    def array(self, name):
+        '''
+        -name: the name of the array
+
+        Returns:
+        -a read-only numpy view of the array over the mapping, nothing is copied
+        '''
+        spec = self.header['arrays'][name]
+        dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.frombuffer(self._buffer, dtype=dtype, count=count, offset=self._start + spec['offset']).reshape(shape)
+
+    def blob(self, name):
+        '''
+        -name: the name of the blob
+
+        Returns:
+        -a read-only memoryview of the bytes over the mapping
+        '''
+        spec = self.header['blobs'][name]
+        start = self._start + spec['offset']
+        return memoryview(self._buffer)[start:start + spec['length']]
+
+    def figure(self, kind):
+        '''
+        -kind: '2d' or '3d'
+
+        Returns:
+        -the figure as a dictionary, parsed from the mapping on every call so no worker keeps its own copy
+        '''
+        return json.loads(self.blob('figure_' + kind).tobytes())
+
+    def export(self, kind, variant):
+        '''
+        -kind: '2d' or '3d'
+        -variant: a key of downloads.PLOTLYJS_VARIANTS
+
+        Returns:
+        -the html export, as a memoryview over the mapping
+        '''
+        return self.blob('export_%s_%s' % (kind, variant))
+
+    def edge_index(self):
+        '''
+        Returns:
+        -the EdgeIndex of the network, over the arrays of the mapping
+        '''
+        return EdgeIndex.from_arrays({name: self.array(name) for name in ('node_ids', 'reverse') + EDGE_ARRAYS})
+
+    def node_labels(self):
+        '''
+        Returns:
+        -the labels of the nodes, in the order of the edge index nodes
+        '''
+        return self.array('node_labels')
+
+    def positions(self, kind):
+        '''
+        -kind: '2d' or '3d'
+
+        Returns:
+        -array with the position of every node, in the order of the edge index nodes
+        '''
+        return self.array('positions_' + kind)
+
+
+def open_artifact(path, dataset_path, options):
+    '''
+    -path: the path of the artifact
+    -dataset_path: the path of the dataset of the app
+    -options: the options of the figures of the app, see artifact_options
+
+    Returns:
+    -the Artifact, or None if it was built with other options or from another version of the dataset
+    (a warning is logged and the app builds the figures itself)
+    '''
+    artifact = Artifact(path)
+    if artifact.options != options:
+        logger.warning('the artifact %s was built with the options %s, the app has %s: it is not used', path, artifact.options, options)
+        return None
+    if os.path.exists(dataset_path) and dataset_hash(dataset_path) != artifact.dataset_hash:
+        logger.warning('the artifact %s was built from another version of %s: it is not used', path, dataset_path)
+        return None
+    return artifact
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute the figures, layouts and edge arrays of the app into one artifact file.')
+    parser.add_argument('--dataset', default=DATASET_PATH, help='the path of the dataset')
+    parser.add_argument('--output', default=ARTIFACT_PATH, help='the path of the artifact')
+    parser.add_argument('--render-mode', default=RENDER_MODE, choices=['svg', 'webgl', 'auto'])
+    parser.add_argument('--layout-2d', default='auto')
+    parser.add_argument('--layout-3d', default='auto')
+    parser.add_argument('--hover-mode', default=HOVER_MODE, choices=['callback', 'embedded'])
+    parser.add_argument('--layout-cache-dir', default=LAYOUT_CACHE_DIR)
+    parser.add_argument('--edge-bundling', action='store_true', help='draw the edges of the figures bundled')
+    parser.add_argument('--weight-buckets', type=int, default=WEIGHT_BUCKETS,
+                        help='the maximum number of width/opacity levels of the edges')
+    args = parser.parse_args(argv)
+    build_artifact(args.dataset, args.output, args.render_mode, args.layout_2d, args.layout_3d, args.hover_mode,
+                   args.layout_cache_dir, args.edge_bundling, args.weight_buckets)
+    print('artifact written to %s (%.1f MB)' % (args.output, os.path.getsize(args.output)/2**20))
+
+
+if __name__ == '__main__':
+    main()
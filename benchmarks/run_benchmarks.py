@@ -0,0 +1,222 @@
+'''
+Benchmarks of the stages of the app on synthetic datasets.
+
+Every stage is timed separately on datasets of increasing size, with the peak of the memory allocated during
+the stage and the size of the payloads sent to the browser. The memory is measured by running the stage a second
+time under tracemalloc, which slows down the allocations, so the timings are taken without it. The results are written as JSON, and
+a previous result file can be given with --compare to print the change of every stage.
+
+The figures of the app are built as specs and serialized by figures.figure_json, without the plotly objects. Every
+run checks that the bytes of figure_json parse to the same figure as the serialization of plotly, and stops with an
+error otherwise. This only checks the serializer, since the plotly figures are built from the same specs: that the
+specs draw the figures of the original app is tested by tests/test_golden_figures.py.
+
+Usage, from the root of the repository:
+
+    python benchmarks/run_benchmarks.py --sizes 100 1000 10000 100000
+    python benchmarks/run_benchmarks.py --sizes 100 1000 --compare benchmarks/results/<previous>.json
+'''
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) #the modules of the app
+
+import numpy as np
+import plotly
+from plotly.utils import PlotlyJSONEncoder
+
+from bundling import bundle_edges
+from edge_index import reciprocal_edges
+from figures import create_figure_2d, create_figure_3d, figure_html, figure_json, figure_spec_2d, figure_spec_3d
+from layouts import layout_2d, layout_3d
+from network_data import build_network, read_dataset
+from synthetic import synthetic_dataset, write_dataset
+
+SIZES = [100, 1000, 10000, 100000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+class Stages:
+    '''
+    Collects the time and the peak memory of the stages of one benchmark run.
+    The time is measured without tracemalloc, and the peak memory in a second run of the stage under tracemalloc.
+    '''
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.results = {}
+
+    def run(self, name, func, *args, **kwargs):
+        '''
+        -name: the name of the stage
+        -func: the function of the stage, called with args and kwargs
+
+        Returns:
+        -the result of the function, from the timed run
+        '''
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        peak = None
+        if self.memory:
+            tracemalloc.start()
+            try:
+                func(*args, **kwargs)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        self.results[name] = {'seconds': round(seconds, 6), 'peak_bytes': peak}
+        print('  %-24s %10.3f s  %s' % (name, seconds, '' if peak is None else '%8.1f MB' % (peak/2**20)), flush=True)
+        return result
+
+
+def plotly_response(fig, graph_id):
+    '''
+    -fig: the plotly figure returned by a callback
+    -graph_id: the id of the graph
+
+    Returns:
+    -the body of the response of a callback that returns the plotly figure, serialized with the encoder of plotly
+    as dash does. The app sends the cached figure_json instead, so this is the cost the app avoids.
+    '''
+    return json.dumps({'response': {graph_id: {'figure': fig}}, 'multi': True}, cls=PlotlyJSONEncoder)
+
+
+def decoded(obj):
+    '''
+    -obj: a figure parsed from JSON
+
+    Returns:
+    -the figure with the typed arrays of plotly ({'dtype': ..., 'bdata': ...}, written by the recent versions 
+    of plotly for the numpy arrays) decoded as lists, so figures serialized in both ways can be compared
+    '''
+    if isinstance(obj, dict):
+        if 'bdata' in obj and 'dtype' in obj:
+            array = np.frombuffer(base64.b64decode(obj['bdata']), dtype=obj['dtype'])
+            return array.reshape(obj['shape']).tolist() if 'shape' in obj else array.tolist()
+        return {key: decoded(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [decoded(value) for value in obj]
+    return obj
+
+
+def same_serialization(fig, serialized):
+    '''
+    -fig: a plotly figure
+    -serialized: the bytes written by figure_json for the spec of the same figure
+
+    Returns:
+    -True if the serializations of plotly and of figure_json are the same figure once parsed
+    '''
+    return decoded(json.loads(json.dumps(fig, cls=PlotlyJSONEncoder))) == json.loads(serialized)
+
+
+def benchmark(n_nodes, seed=0, memory=True, data_format='.csv'):
+    '''
+    -n_nodes: the number of nodes of the synthetic dataset
+    -seed: the seed of the synthetic dataset
+    -memory: False to skip the memory measurements, which run every stage a second time
+    -data_format: the format of the dataset files, '.csv' or '.parquet'
+
+    Returns:
+    -a dictionary with the size of the dataset, the time and peak memory of every stage and the payload sizes
+    The stages *_spec_*, figure_json_* and write_html_* are the path of the app, plotly_figure_* and plotly_response_* 
+    the plotly figures and the callback responses that return them, for comparison.
+    '''
+    edges, nodes = synthetic_dataset(n_nodes, seed=seed)
+    print('%d nodes, %d edges' % (len(nodes), len(edges)), flush=True)
+    stages = Stages(memory)
+    with tempfile.TemporaryDirectory() as folder:
+        write_dataset(folder, edges, nodes, data_format)
+        edges, nodes = stages.run('load', read_dataset, folder)
+    network = stages.run('graph_build', build_network, edges, nodes)
+    index = network.edge_index
+    stages.run('bidirectional', reciprocal_edges, index.source_code, index.target_code, len(index.node_ids))
+    pos = stages.run('layout_2d', layout_2d, network.graph, cache_dir=None)
+    pos3d = stages.run('layout_3d', layout_3d, network.graph, cache_dir=None)
+    stages.run('bundle_edges_2d', bundle_edges, index, pos)
+    stages.run('bundle_edges_3d', bundle_edges, index, pos3d)
+    spec_2d = stages.run('traces_spec_2d', figure_spec_2d, network, pos)
+    spec_3d = stages.run('traces_spec_3d', figure_spec_3d, network, pos3d)
+    serialized_2d = stages.run('figure_json_2d', figure_json, spec_2d)
+    serialized_3d = stages.run('figure_json_3d', figure_json, spec_3d)
+    html_2d = stages.run('write_html_2d', figure_html, serialized_2d)
+    html_3d = stages.run('write_html_3d', figure_html, serialized_3d)
+    fig_2d = stages.run('plotly_figure_2d', create_figure_2d, network, pos)
+    fig_3d = stages.run('plotly_figure_3d', create_figure_3d, network, pos3d)
+    json_2d = stages.run('plotly_response_2d', plotly_response, fig_2d, 'graph-2d')
+    json_3d = stages.run('plotly_response_3d', plotly_response, fig_3d, 'graph-3d')
+    for kind, fig, serialized in (('2d', fig_2d, serialized_2d), ('3d', fig_3d, serialized_3d)):
+        if not same_serialization(fig, serialized):
+            raise AssertionError('figure_json and plotly serialize the %s figure differently' % kind)
+    return {'n_nodes': len(nodes),
+            'n_edges': len(edges),
+            'n_bidirectional': int(index.is_bidirectional.sum()),
+            'stages': stages.results,
+            'payload_bytes': {'html_2d': len(html_2d), 'html_3d': len(html_3d),
+                              'figure_json_2d': len(serialized_2d), 'figure_json_3d': len(serialized_3d),
+                              'plotly_response_2d': len(json_2d.encode()), 'plotly_response_3d': len(json_3d.encode())}}
+
+
+def environment():
+    '''
+    Returns:
+    -the versions of python and of the main libraries, stored with the results
+    '''
+    import networkx
+    import pandas
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'numpy': np.__version__, 'pandas': pandas.__version__,
+            'networkx': networkx.__version__, 'plotly': plotly.__version__}
+
+
+def compare(results, previous):
+    '''
+    -results: the results of this run
+    -previous: the results of a previous run
+
+    Prints the ratio of the time of every stage to the time of the previous run, for the sizes found in both.
+    '''
+    before = {run['n_nodes']: run for run in previous['runs']}
+    for run in results['runs']:
+        if run['n_nodes'] not in before:
+            continue
+        print('%d nodes, compared with %s' % (run['n_nodes'], previous['created']))
+        for name, stage in run['stages'].items():
+            old = before[run['n_nodes']]['stages'].get(name)
+            if old and old['seconds'] > 0:
+                print('  %-24s %10.3f s -> %10.3f s  x%.2f' % (name, old['seconds'], stage['seconds'], stage['seconds']/old['seconds']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the app on synthetic datasets.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='the numbers of nodes of the datasets')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=['.csv', '.parquet'], default='.csv', help='the format of the dataset files')
+    parser.add_argument('--no-memory', action='store_true', help='skip the memory measurements')
+    parser.add_argument('--output', help='the result file, by default benchmarks/results/benchmark-<time>.json')
+    parser.add_argument('--compare', help='a previous result file to compare with')
+    args = parser.parse_args(argv)
+
+    created = time.strftime('%Y-%m-%dT%H:%M:%S')
+    results = {'created': created, 'environment': environment(), 'seed': args.seed, 'format': args.format,
+               'runs': [benchmark(n_nodes, args.seed, not args.no_memory, args.format) for n_nodes in args.sizes]}
+    output = args.output or os.path.join(RESULTS_DIR, 'benchmark-%s.json' % created.replace(':', ''))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('results written to %s' % output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''
+Synthetic datasets in the schema of the case study, for the benchmarks.
+
+The case study network is a hub-and-spoke graph: almost every edge has node 966 as source or target, some of them
+in both directions, and the nodes belong to 6 color categories. synthetic_dataset reproduces this structure at
+any size, with a few hubs for the large graphs and some edges between the spokes.
+'''
+import os
+
+import numpy as np
+import pandas as pd
+
+from network_data import EDGE_SCHEMA, NODE_SCHEMA, apply_schema
+
+COLORS = ['grey', 'orange', 'green', 'red', 'purple', 'blue'] # the categories of the case study
+FIRST_NODE_ID = 950 # the node ids of the case study start at 950
+RECIPROCAL_FRACTION = 0.3 # fraction of the spokes that are connected to their hub in both directions
+EXTRA_EDGE_FRACTION = 0.05 # edges between two spokes, per node
+MAX_WEIGHT = 9
+
+
+def synthetic_dataset(n_nodes, n_hubs=None, reciprocal_fraction=RECIPROCAL_FRACTION,
+                      extra_edge_fraction=EXTRA_EDGE_FRACTION, seed=0):
+    '''
+    -n_nodes: the number of nodes
+    -n_hubs: the number of hub nodes, by default one per 10000 nodes (at least one)
+    -reciprocal_fraction: fraction of the spokes connected to their hub in both directions
+    -extra_edge_fraction: number of edges between two spokes, relative to the number of nodes
+    -seed: the seed of the random generator, the same seed gives the same dataset
+
+    Returns:
+    -the edges dataframe, with the columns and dtypes of EDGE_SCHEMA
+    -the nodes dataframe, with the columns and dtypes of NODE_SCHEMA
+    Every spoke is connected to one hub, to it or from it, and in both directions with probability reciprocal_fraction.
+    '''
+    rng = np.random.default_rng(seed)
+    n_hubs = max(1, n_nodes//10000) if n_hubs is None else n_hubs
+    node_ids = FIRST_NODE_ID + np.arange(n_nodes)
+    hubs = node_ids[rng.choice(n_nodes, n_hubs, replace=False)]
+    spokes = np.setdiff1d(node_ids, hubs)
+    hub_of = hubs[rng.integers(0, n_hubs, len(spokes))]
+
+    outgoing = rng.random(len(spokes)) < 0.5
+    reciprocal = rng.random(len(spokes)) < reciprocal_fraction
+    sources = [np.where(outgoing, hub_of, spokes), hub_of[reciprocal & ~outgoing], spokes[reciprocal & outgoing]]
+    targets = [np.where(outgoing, spokes, hub_of), spokes[reciprocal & ~outgoing], hub_of[reciprocal & outgoing]]
+    n_extra = int(extra_edge_fraction*n_nodes)
+    if len(spokes) > 1 and n_extra:
+        sources.append(rng.choice(spokes, n_extra))
+        targets.append(rng.choice(spokes, n_extra))
+    if n_hubs > 1: #the hubs are connected in a ring, so the graph stays connected
+        sources.append(hubs)
+        targets.append(np.roll(hubs, 1))
+
+    edges = pd.DataFrame({'source_id': np.concatenate(sources), 'target_id': np.concatenate(targets)})
+    edges = edges[edges['source_id'] != edges['target_id']].drop_duplicates(ignore_index=True)
+    edges['weights'] = rng.integers(1, MAX_WEIGHT + 1, len(edges)).astype(float)
+    nodes = pd.DataFrame({'node_id': node_ids,
+                          'node_label': ['N%d' % node_id for node_id in node_ids],
+                          'node_color': rng.choice(COLORS, n_nodes)})
+    return apply_schema(edges, EDGE_SCHEMA, 'synthetic edges'), apply_schema(nodes, NODE_SCHEMA, 'synthetic nodes')
+
+
+def write_dataset(folder, edges, nodes, extension='.csv'):
+    '''
+    -folder: the folder of the dataset, created if needed
+    -edges: the edges dataframe
+    -nodes: the nodes dataframe
+    -extension: '.csv' or '.parquet'
+
+    Writes the dataset as a folder with an edges and a nodes file, the format read by network_data.read_dataset.
+    '''
+    os.makedirs(folder, exist_ok=True)
+    for name, frame in (('edges', edges), ('nodes', nodes)):
+        path = os.path.join(folder, name + extension)
+        if extension == '.csv':
+            frame.to_csv(path, index=False)
+        else:
+            frame.to_parquet(path, index=False)
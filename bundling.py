@@ -0,0 +1,194 @@
+'''
+Hierarchical edge bundling of the 2-d and 3-d figures on nested grids.
+
+The space of the layout is divided into nested grids, from a fine grid to a coarse one (BUNDLE_LEVELS cells per
+axis, every coarse cell holds whole fine cells), and every node is attached to the centroid of its cell at every level.
+An edge is routed up the grids from its source to the first level where both ends share a cell, across to the
+other end at the level below, and down to its target:
+
+    source -> fine centroid -> coarse centroid -> ... -> coarse centroid -> fine centroid -> target
+
+The edges of the same cells share the pieces of their routes, so the routes are merged into segments with the
+summed weight of the edges going through them: one segment per node and edge class to its fine cell, one per cell
+to its parent cell and one per pair of cells linked by some edges. The edges between the nodes of the same fine cell
+stay straight. A hub like node 966, with edges to every other node, is drawn as one trunk per cell instead of one
+line per edge, so both the clutter and the number of points drawn by the browser shrink from O(E) to about
+O(N + cells^2). Every step is vectorized with numpy over all the edges at once.
+
+The width and opacity of a segment come from its summed weight, relative to the heaviest segment of the same piece
+of the routes (node to cell, cell to cell at every level, and the straight edges which keep the normalized weights of
+the whole graph). The bundles are cached on disk next to the layouts, keyed by the dataset and a hash of the positions,
+the edges and the grids.
+'''
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from layouts import LAYOUT_CACHE_DIR, dataset_key, params_hash, remove_old_files, write_arrays
+from metrics import timed
+
+#cells per axis of the nested grids, from the finest to the coarsest, in 2d and 3d
+BUNDLE_LEVELS = {2: (16, 4), 3: (8, 2)}
+
+#the pieces of the routes, whose weights are normalized separately
+DIRECT, FAN, UP, TRUNK = range(4)
+
+EdgeBundles = namedtuple('EdgeBundles', ['start', 'end', 'norm_weight', 'is_bidirectional'])
+
+
+def grid_cells(coords, levels):
+    '''
+    -coords: array with the positions of the nodes
+    -levels: the number of cells per axis of every grid, from the finest, every number divides the previous one
+
+    Returns:
+    -list with the array of the cell of every node, one per grid
+    -list with the array of the parent cell (in the next grid) of every cell, one per grid but the coarsest
+    '''
+    n_nodes, dim = coords.shape
+    low = coords.min(axis=0) if n_nodes else np.zeros(dim)
+    extent = np.maximum(np.ptp(coords, axis=0), 1e-9) if n_nodes else np.ones(dim)
+    unit = np.clip((coords - low)/extent, 0, 1)
+    cells, parents = [], []
+    for i, per_axis in enumerate(levels):
+        grid = np.minimum((unit*per_axis).astype(np.int64), per_axis - 1)
+        cells.append(np.ravel_multi_index(tuple(grid.T), (per_axis,)*dim))
+        if i + 1 < len(levels):
+            all_cells = np.column_stack(np.unravel_index(np.arange(per_axis**dim), (per_axis,)*dim))
+            parents.append(np.ravel_multi_index(tuple((all_cells*levels[i + 1]//per_axis).T), (levels[i + 1],)*dim))
+    return cells, parents
+
+
+def cell_centroids(coords, cells, n_cells):
+    '''
+    -coords: array with the positions of the nodes
+    -cells: array with the cell of every node
+    -n_cells: the number of cells of the grid
+
+    Returns:
+    -array with the mean position of the nodes of every cell, 0 for the empty cells (never used)
+    '''
+    counts = np.bincount(cells, minlength=n_cells)
+    sums = np.column_stack([np.bincount(cells, weights=coords[:, d], minlength=n_cells) for d in range(coords.shape[1])])
+    return sums/np.maximum(counts, 1)[:, None]
+
+
+@timed('bundle_edges')
+def bundle_edges(edge_index, pos, levels=None):
+    '''
+    -edge_index: the columnar edge index of the edges to bundle
+    -pos: the positions of the nodes, a dictionary or an array in the order of the index nodes
+    -levels: the number of cells per axis of the nested grids, from the finest, BUNDLE_LEVELS by default
+
+    Returns:
+    -the EdgeBundles: the start and end positions of the merged segments, their normalized summed weights and
+    their edge class (True for the segments of the bidirectional edges)
+    '''
+    coords = edge_index.positions(pos)
+    dim = coords.shape[1]
+    levels = tuple(levels or BUNDLE_LEVELS[dim])
+    cells, parents = grid_cells(coords, levels)
+    centroids = [cell_centroids(coords, level_cells, per_axis**dim) for level_cells, per_axis in zip(cells, levels)]
+    source, target = edge_index.source_code, edge_index.target_code
+    weight = edge_index.weight.astype(float)
+    edge_class = edge_index.is_bidirectional.astype(np.int64)
+
+    #the first grid where both ends share a cell, len(levels) if they never do
+    shared = np.array([level_cells[source] == level_cells[target] for level_cells in cells]).reshape(len(levels), -1)
+    top = np.where(shared.any(axis=0), shared.argmax(axis=0), len(levels))
+
+    #every piece of a route is a key (piece, level, a, b, edge class) with the weight of its edge
+    size = max(len(coords), len(source), max(per_axis**dim for per_axis in levels)) + 1
+    pieces = []
+
+    def add(piece, level, a, b, rows):
+        key = (((piece*(len(levels) + 1) + level)*size + a)*size + b)*2 + edge_class[rows]
+        pieces.append((key, weight[rows]))
+
+    direct = np.flatnonzero(top == 0)
+    add(DIRECT, 0, direct, 0, direct)
+    routed = np.flatnonzero(top > 0)
+    for ends in (source, target):
+        add(FAN, 0, ends[routed], 0, routed)
+    for level in range(len(levels) - 1):
+        rows = routed[top[routed] > level + 1]
+        for ends in (source, target):
+            add(UP, level, cells[level][ends[rows]], 0, rows)
+    for level in range(len(levels)):
+        rows = routed[top[routed] == level + 1]
+        a, b = cells[level][source[rows]], cells[level][target[rows]]
+        add(TRUNK, level, np.minimum(a, b), np.maximum(a, b), rows)
+
+    keys, inverse = np.unique(np.concatenate([key for key, _ in pieces]), return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=np.concatenate([w for _, w in pieces]), minlength=len(keys))
+    keys, is_bidirectional = keys//2, (keys % 2).astype(bool)
+    keys, b = np.divmod(keys, size)
+    keys, a = np.divmod(keys, size)
+    piece, level = np.divmod(keys, len(levels) + 1)
+
+    start, end = np.zeros((len(keys), dim)), np.zeros((len(keys), dim))
+    norm_weight = np.zeros(len(keys))
+    for kind in (DIRECT, FAN, UP, TRUNK):
+        for lvl in np.unique(level[piece == kind]):
+            rows = np.flatnonzero((piece == kind) & (level == lvl))
+            if kind == DIRECT:
+                start[rows], end[rows] = coords[source[a[rows]]], coords[target[a[rows]]]
+                norm_weight[rows] = edge_index.norm_weight[a[rows]]
+                continue
+            if kind == FAN:
+                start[rows], end[rows] = coords[a[rows]], centroids[0][cells[0][a[rows]]]
+            elif kind == UP:
+                start[rows], end[rows] = centroids[lvl][a[rows]], centroids[lvl + 1][parents[lvl][a[rows]]]
+            else:
+                start[rows], end[rows] = centroids[lvl][a[rows]], centroids[lvl][b[rows]]
+            norm_weight[rows] = sums[rows]/max(sums[rows].max(), 1e-12)
+    #a node alone in its cell is its centroid
+    keep = np.any(start != end, axis=1)
+    return EdgeBundles(start[keep], end[keep], norm_weight[keep], is_bidirectional[keep])
+
+
+def bundles_hash(edge_index, coords, levels):
+    '''
+    -edge_index: the columnar edge index of the edges to bundle
+    -coords: array with the positions of the nodes, in the order of the index nodes
+    -levels: the number of cells per axis of the nested grids
+
+    Returns:
+    -a hash of the positions, the weighted edges and the grids
+    '''
+    digest = hashlib.sha256(repr(levels).encode())
+    for array in (coords.astype(float), edge_index.source_code, edge_index.target_code,
+                  edge_index.weight.astype(float), edge_index.is_bidirectional):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def cached_bundles(edge_index, pos, levels=None, cache_dir=LAYOUT_CACHE_DIR, dataset=None):
+    '''
+    -edge_index: the columnar edge index of the edges to bundle
+    -pos: the positions of the nodes, a dictionary or an array in the order of the index nodes
+    -levels: the number of cells per axis of the nested grids, BUNDLE_LEVELS by default
+    -cache_dir: the folder of the cached layouts, None to disable the cache
+    -dataset: the path of the dataset of the edges, so its old bundles are removed apart from those of the other datasets
+
+    Returns:
+    -the EdgeBundles of bundle_edges, read from the cache when the positions and the edges have been bundled before
+    '''
+    coords = edge_index.positions(pos)
+    levels = tuple(levels or BUNDLE_LEVELS[coords.shape[1]])
+    if cache_dir is None:
+        return bundle_edges(edge_index, coords, levels)
+    params = params_hash('bundles', {'levels': levels, 'dim': coords.shape[1]})
+    prefix = os.path.join(cache_dir, 'bundles-%s-%s-' % (params, dataset_key(dataset)))
+    path = prefix + bundles_hash(edge_index, coords, levels) + '.npz'
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return EdgeBundles(*(data[name] for name in EdgeBundles._fields))
+    except FileNotFoundError:
+        pass
+    bundles = bundle_edges(edge_index, coords, levels)
+    write_arrays(path, **bundles._asdict())
+    remove_old_files(prefix)
+    return bundles
@@ -0,0 +1,49 @@
+'''
+Small in-memory LRU cache shared by the callbacks of the app.
+'''
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''
+    Thread safe least recently used cache.
+    The values are built on the first request of a key with get_or_build and served from memory afterwards.
+    '''
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        '''
+        -key: a hashable key
+        -build: a function without arguments that creates the value when the key is not cached
+
+        Returns:
+        -the cached or newly built value
+        '''
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = build() #built outside the lock, so slow builds don't block the other keys
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
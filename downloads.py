@@ -0,0 +1,117 @@
+'''
+Download endpoint for the html exports of the figures.
+
+The exports are generated on the first request, cached, compressed with brotli or gzip depending on the
+Accept-Encoding of the request and streamed in chunks. Every representation has an ETag, derived from the cache
+key of the export (the content hash of the dataset and the options), so browsers that already have the file get
+a 304 response without a body and without the export being built.
+'''
+import gzip
+import hashlib
+
+import plotly
+from flask import Response, abort, request
+
+from metrics import span
+
+try:
+    import brotli
+except ImportError: #brotli is optional, gzip is used without it
+    brotli = None
+
+CHUNK_SIZE = 64*1024 # bytes sent per chunk of the streamed response
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 6
+
+#the variants of the export: the plotly.js bundle embedded in the file or loaded from the plotly CDN
+PLOTLYJS_VARIANTS = {'full': True, 'cdn': 'cdn'}
+EXPORT_FILENAMES = {'2d': '2dvisualization.html', '3d': '3dvisualization.html'}
+
+
+def choose_encoding(accept_encoding):
+    '''
+    -accept_encoding: the parsed Accept-Encoding header of the request
+
+    Returns:
+    -'br', 'gzip' or 'identity', the best encoding accepted by the client
+    '''
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+def encode(body, encoding):
+    '''
+    -body: the bytes of the export
+    -encoding: 'br', 'gzip' or 'identity'
+
+    Returns:
+    -the encoded bytes
+    '''
+    with span('download_encode', encoding=encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=BROTLI_QUALITY)
+        if encoding == 'gzip':
+            return gzip.compress(body, compresslevel=GZIP_LEVEL)
+        return body
+
+
+def export_etag(key, encoding):
+    '''
+    -key: the cache key of the export
+    -encoding: 'br', 'gzip' or 'identity'
+
+    Returns:
+    -the ETag of the encoded export. The plotly version is part of it, since the exports embed plotly.js.
+    '''
+    return '%s-%s' % (hashlib.sha1(repr((key, plotly.__version__)).encode()).hexdigest(), encoding)
+
+
+def stream(body):
+    '''
+    -body: the bytes to send, or a memoryview over them
+
+    Returns:
+    -a generator over the chunks of the body, as bytes
+    '''
+    for start in range(0, len(body), CHUNK_SIZE):
+        yield bytes(body[start:start + CHUNK_SIZE])
+
+
+def register_download_routes(server, get_export, cache, url_prefix='/download'):
+    '''
+    -server: the flask server of the dash app
+    -get_export: a function (kind, variant) -> (cache key, function returning the bytes or memoryview of the html export).
+    The key identifies the content of the export, the export is built only when a body is sent.
+    -cache: the LRUCache where the encoded exports are kept
+    -url_prefix: the url under which the exports are served
+
+    The exports are served at <url_prefix>/<kind>.html, with kind '2d' or '3d' and the optional
+    query parameter plotlyjs=full|cdn (default full).
+    '''
+    @server.route(url_prefix + '/<kind>.html')
+    def download_figure(kind):
+        variant = request.args.get('plotlyjs', 'full')
+        if kind not in EXPORT_FILENAMES or variant not in PLOTLYJS_VARIANTS:
+            abort(404)
+        key, build = get_export(kind, variant)
+        encoding = choose_encoding(request.accept_encodings)
+        etag = export_etag(key, encoding)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            encoded = cache.get_or_build((key, encoding), lambda: encode(build(), encoding))
+            response = Response(stream(encoded), mimetype='text/html')
+            response.headers['Content-Length'] = str(len(encoded))
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+            filename = EXPORT_FILENAMES[kind] if variant == 'full' else EXPORT_FILENAMES[kind].replace('.html', '_cdn.html')
+            response.headers['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache' #revalidate with the ETag, the dataset may change
+        return response
+
+    return download_figure
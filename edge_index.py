@@ -0,0 +1,151 @@
+'''
+Columnar index of the edges of the network.
+
+The index is built once from the edges dataframe and holds the edge attributes in numpy arrays,
+so that the rendering stages (2D, 3D, middle nodes, annotations) don't need to query the
+attribute dictionaries of the networkx graph for every edge.
+'''
+import numpy as np
+import pandas as pd
+
+#the arrays with one value per edge, kept by take
+EDGE_ARRAYS = ('source_code', 'target_code', 'weight', 'source', 'target', 'norm_weight',
+               'is_bidirectional', 'reverse_weight', 'ids')
+
+class EdgeIndex:
+    '''
+    Columnar view of the edges of the directed graph.
+
+    Attributes:
+    -node_ids: array with the ids of the nodes, the codes below are positions in this array
+    -source, target: arrays with the node ids of the beginning and the ending of every edge
+    -source_code, target_code: arrays with the codes of the beginning and the ending of every edge
+    -weight: array with the weight of every edge, with the dtype of the weights column
+    -norm_weight: array with the weight of every edge normalized between 0 and 1
+    -reverse: array with the position of the reverse edge in the index, -1 if the edge is one-way
+    -is_bidirectional: boolean array, True for the edges that are bidirectional
+    -reverse_weight: array with the weight of the reverse edge, 0 if the edge is one-way
+    -ids: array with the position of every edge in the index of the whole graph (see take)
+    '''
+
+    def __init__(self, node_ids, source_code, target_code, weight):
+        self.node_ids = np.asarray(node_ids)
+        self.source_code = np.asarray(source_code, dtype=np.int64)
+        self.target_code = np.asarray(target_code, dtype=np.int64)
+        self.weight = np.asarray(weight)
+        self.source = self.node_ids[self.source_code]
+        self.target = self.node_ids[self.target_code]
+        max_weight = self.weight.max() if len(self.weight) else 1.0
+        self.norm_weight = self.weight.astype(float)/max_weight #normalize between 0 and 1
+        self.reverse = reciprocal_edges(self.source_code, self.target_code, len(self.node_ids))
+        self.is_bidirectional = self.reverse >= 0
+        self.reverse_weight = np.where(self.is_bidirectional, self.weight[self.reverse], 0).astype(self.weight.dtype)
+        self.ids = np.arange(len(self.weight))
+
+    @classmethod
+    def from_frame(cls, edges, node_ids=None):
+        '''
+        -edges: dataframe with the columns source_id, target_id and weights
+        -node_ids: the ids of the nodes of the graph (optional), the ids found only in the edges are appended
+
+        Returns:
+        -the edge index
+        Repeated (source, target) pairs keep the last weight, as networkx.from_pandas_edgelist does for a DiGraph.
+        '''
+        edges = edges.drop_duplicates(subset=['source_id', 'target_id'], keep='last')
+        known = pd.Index([] if node_ids is None else node_ids)
+        ends = pd.Index(pd.concat([edges['source_id'], edges['target_id']], ignore_index=True).unique())
+        all_ids = known.append(ends.difference(known, sort=False))
+        source_code = all_ids.get_indexer(edges['source_id'])
+        target_code = all_ids.get_indexer(edges['target_id'])
+        return cls(all_ids.to_numpy(), source_code, target_code, edges['weights'].to_numpy())
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''
+        -arrays: mapping with the node_ids, the reverse and the EDGE_ARRAYS of an index, for example read from an artifact
+
+        Returns:
+        -the edge index over these arrays, which are used as they are (not copied nor computed again)
+        '''
+        index = object.__new__(cls)
+        for name in ('node_ids', 'reverse') + EDGE_ARRAYS:
+            setattr(index, name, arrays[name])
+        return index
+
+    def __len__(self):
+        return len(self.weight)
+
+    def take(self, rows):
+        '''
+        -rows: sorted array with the positions of the edges to keep
+
+        Returns:
+        -the index of these edges, over the same nodes. The normalized weights, is_bidirectional, reverse_weight 
+        and ids keep the values of the whole graph, so the subset is drawn exactly like in the full figure. 
+        reverse points inside the subset and is -1 when the reverse edge was left out.
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        subset = object.__new__(EdgeIndex)
+        subset.node_ids = self.node_ids
+        for name in EDGE_ARRAYS:
+            setattr(subset, name, getattr(self, name)[rows])
+        reverse = self.reverse[rows]
+        subset.reverse = np.full(len(rows), -1, dtype=np.int64)
+        if len(rows):
+            found = np.minimum(np.searchsorted(rows, reverse), len(rows) - 1)
+            subset.reverse = np.where(rows[found] == reverse, found, -1)
+        return subset
+
+    def positions(self, pos):
+        '''
+        -pos: a dictionary with key the node_id and value the array of positions of the node, 
+        or an array with the positions already in the order of node_ids
+
+        Returns:
+        -an array with the position of every node of the index, in the order of node_ids
+        '''
+        if isinstance(pos, np.ndarray):
+            return pos
+        return np.array([pos[node] for node in self.node_ids], dtype=float).reshape(len(self.node_ids), -1)
+
+    def endpoints(self, pos):
+        '''
+        -pos: a dictionary with key the node_id and value the array of positions of the node
+
+        Returns:
+        -the positions of the beginning and the ending of every edge
+        '''
+        coords = self.positions(pos)
+        return coords[self.source_code], coords[self.target_code]
+
+    def midpoints(self, pos):
+        '''
+        -pos: a dictionary with key the node_id and value the array of positions of the node
+
+        Returns:
+        -the position of the middle of every edge
+        '''
+        start, end = self.endpoints(pos)
+        return (start + end)/2
+
+
+def reciprocal_edges(source_code, target_code, n_nodes):
+    '''
+    -source_code, target_code: arrays with the codes of the beginning and the ending of every edge
+    -n_nodes: the number of node codes
+
+    Returns:
+    -an array with the position of the reverse edge of every edge, -1 if there is no reverse edge
+    The edges are matched with a sorted search over the (source, target) keys, so no python loop over the edges is needed.
+    '''
+    if len(source_code) == 0:
+        return np.zeros(0, dtype=np.int64)
+    keys = source_code*n_nodes + target_code
+    reverse_keys = target_code*n_nodes + source_code
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    found = np.searchsorted(sorted_keys, reverse_keys)
+    found = np.minimum(found, len(keys) - 1)
+    matched = sorted_keys[found] == reverse_keys
+    return np.where(matched, order[found], -1)
@@ -0,0 +1,317 @@
+'''
+Batch export of the 2D and 3D figures of many datasets, without the app.
+
+    python export.py data/network_a.xlsx data/network_b --output exports --layouts-2d radial force --weight-ranges 0-1 0.5-1
+
+Every dataset is exported for every combination of the figures, the layouts and the filters given on the command
+line (a view). The views are built in a pool of processes, one task per dataset, figure and layout, so the network
+is read and the layout computed once per task. The cached layouts and bundles are keyed by the dataset path, so the
+tasks of different datasets never warm-start from or remove each other's files. The files of a dataset are written
+in the folder <output>/<dataset>/.
+
+The html files load one shared plotly.js file, plotly-<version>.min.js in the output folder, instead of embedding
+its 3 MB in every file. The manifest.json of the output folder keeps for every file the hash of its inputs (the
+content hash of the dataset, the options of the view and the plotly version), the sha256 and size of the file and the
+seconds it took. The views with unchanged inputs are skipped, so a nightly run only exports the changed datasets.
+
+Static images (--images png svg ...) are exported with the optional kaleido package.
+'''
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import plotly
+import plotly.io as pio
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+try:
+    import kaleido
+except ImportError: #optional, only the html files are exported without it
+    kaleido = None
+
+from aggregation import node_colors
+from bundling import cached_bundles
+from figures import RENDER_MODE, WEIGHT_BUCKETS, figure_html, figure_json, figure_spec_2d, figure_spec_3d
+from filters import DIRECTIONS, FilteredNetwork
+from layouts import LAYOUT_CACHE_DIR, compute_layout
+from network_data import dataset_hash, load_network
+
+EXPORT_DIR = 'exports'
+MANIFEST = 'manifest.json'
+IMAGE_FORMATS = ['png', 'jpeg', 'webp', 'svg', 'pdf']
+
+View = namedtuple('View', ['kind', 'layout', 'weight_range', 'direction', 'edge_bundling'])
+
+
+def weight_range(text):
+    '''
+    -text: a range of weights relative to the heaviest edge, as low-high (e.g. 0.5-1)
+
+    Returns:
+    -the (low, high) range
+    '''
+    try:
+        low, high = (float(value) for value in text.split('-'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('%r is not a weight range low-high, e.g. 0.5-1' % text)
+    if not 0 <= low <= high <= 1:
+        raise argparse.ArgumentTypeError('the weight range %r must be within 0-1' % text)
+    return low, high
+
+
+def view_name(view):
+    '''
+    -view: the View
+
+    Returns:
+    -the name of the files of the view, without the extension
+    '''
+    name = '%s-%s' % (view.kind, view.layout)
+    if tuple(view.weight_range) != (0.0, 1.0):
+        name += '-weight%g-%g' % tuple(view.weight_range)
+    if view.direction != 'all':
+        name += '-' + view.direction
+    if view.edge_bundling:
+        name += '-bundled'
+    return name
+
+
+def view_hash(digest, view, render_mode, weight_buckets=WEIGHT_BUCKETS):
+    '''
+    -digest: the content hash of the dataset
+    -view: the View
+    -render_mode: the render mode of the 2d figures
+    -weight_buckets: the maximum number of width/opacity levels of the edges
+
+    Returns:
+    -the hash of everything the files of the view are built from
+    '''
+    inputs = {'dataset': digest, 'view': view._asdict(), 'render_mode': render_mode, 'weight_buckets': weight_buckets,
+              'plotly': plotly.__version__}
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def write_file(path, data):
+    '''
+    -path: the path of the file
+    -data: the bytes of the file
+
+    The file is written to a temporary file first and then renamed, so a file is never left half written.
+    '''
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_plotlyjs(output):
+    '''
+    -output: the output folder
+
+    Returns:
+    -the path of the plotly.js file shared by the html exports, written if it is missing.
+    The version is in the name of the file, so the exports of another plotly version don't load the wrong bundle.
+    '''
+    path = os.path.join(output, 'plotly-%s.min.js' % get_plotlyjs_version())
+    if not os.path.exists(path):
+        write_file(path, get_plotlyjs().encode())
+    return path
+
+
+def read_manifest(output):
+    '''
+    -output: the output folder
+
+    Returns:
+    -the manifest of the previous exports, with the files by their path relative to the output folder
+    '''
+    path = os.path.join(output, MANIFEST)
+    if not os.path.exists(path):
+        return {'files': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def up_to_date(manifest, output, paths, inputs):
+    '''
+    -manifest: the manifest of the previous exports
+    -output: the output folder
+    -paths: the paths of the files of a view, relative to the output folder
+    -inputs: the hash of the inputs of the view
+
+    Returns:
+    -True if all the files exist and were exported from the same inputs
+    '''
+    return all(manifest['files'].get(path, {}).get('inputs') == inputs and os.path.exists(os.path.join(output, path))
+               for path in paths)
+
+
+def view_spec(network, view, pos, filtered, render_mode, layout_cache_dir, weight_buckets=WEIGHT_BUCKETS, dataset=None):
+    '''
+    -network: the Network of the dataset
+    -view: the View
+    -pos: the positions of the nodes in the layout of the view
+    -filtered: function edge_bundling -> the FilteredNetwork of the layout
+    -render_mode: the render mode of the 2d figures
+    -layout_cache_dir: the folder of the cached layouts and bundles, None to disable it
+    -weight_buckets: the maximum number of width/opacity levels of the edges
+    -dataset: the path of the dataset, part of the cache key of the bundles
+
+    Returns:
+    -the spec of the figure of the view, with the hover text embedded since there is no app behind the files
+    '''
+    network_filtered = filtered(view.edge_bundling)
+    filters = network_filtered.filters(view.weight_range, None, view.direction)
+    if not network_filtered.is_default(filters):
+        return network_filtered.figure_spec(view.kind, filters)
+    bundles = cached_bundles(network.edge_index, pos, cache_dir=layout_cache_dir, dataset=dataset) if view.edge_bundling else None
+    if view.kind == '2d':
+        return figure_spec_2d(network, pos, render_mode=render_mode, hover='embedded', bundles=bundles, n_buckets=weight_buckets)
+    return figure_spec_3d(network, pos, hover='embedded', bundles=bundles, n_buckets=weight_buckets)
+
+
+def export_views(dataset_path, folder, kind, layout, views, output, plotlyjs, render_mode=RENDER_MODE, images=(),
+                 layout_cache_dir=LAYOUT_CACHE_DIR, weight_buckets=WEIGHT_BUCKETS):
+    '''
+    -dataset_path: the path of the dataset
+    -folder: the folder of the files of the dataset, relative to the output folder
+    -kind: '2d' or '3d'
+    -layout: the name of the layout of the views
+    -views: list of (View, hash of its inputs) of the kind and layout
+    -output: the output folder
+    -plotlyjs: the path of the shared plotly.js file
+    -render_mode: the render mode of the 2d figures
+    -images: the formats of the static images exported with the html files
+    -layout_cache_dir: the folder of the cached layouts and bundles, None to disable it
+    -weight_buckets: the maximum number of width/opacity levels of the edges
+
+    Returns:
+    -list of (path relative to the output folder, manifest entry) of the written files.
+    Runs in the worker processes: the network is read and the layout computed once for all the views.
+    '''
+    start = time.perf_counter()
+    network = load_network(dataset_path)
+    pos = compute_layout(network.graph, int(kind[0]), layout, layout_cache_dir, dataset_path)
+    coords = network.edge_index.positions(pos)
+    colors = node_colors(network)[0]
+    filtered_networks = {}
+
+    def filtered(edge_bundling):
+        if edge_bundling not in filtered_networks:
+            filtered_networks[edge_bundling] = FilteredNetwork(network.edge_index, network.node_labels, colors, lambda _: coords,
+                                                               render_mode, 'embedded', edge_bundling=edge_bundling,
+                                                               n_buckets=weight_buckets)
+        return filtered_networks[edge_bundling]
+
+    setup = time.perf_counter() - start
+    results = []
+    for view, inputs in views:
+        start = time.perf_counter()
+        serialized = figure_json(view_spec(network, view, pos, filtered, render_mode, layout_cache_dir, weight_buckets, dataset_path))
+        base = os.path.join(folder, view_name(view))
+        html_folder = os.path.dirname(os.path.join(output, base))
+        script = os.path.relpath(plotlyjs, html_folder).replace(os.sep, '/')
+        files = [(base + '.html', lambda: figure_html(serialized, include_plotlyjs=script))]
+        files += [(base + '.' + image_format, lambda image_format=image_format: pio.to_image(
+            json.loads(serialized), format=image_format, validate=False)) for image_format in images]
+        for path, build in files:
+            data = build()
+            write_file(os.path.join(output, path), data)
+            #the time of the figure and of reading the network and the layout are counted in the first file
+            seconds = time.perf_counter() - start + setup
+            results.append((path, {'inputs': inputs, 'dataset': dataset_path, 'view': view._asdict(),
+                                   'sha256': hashlib.sha256(data).hexdigest(), 'bytes': len(data), 'seconds': round(seconds, 4)}))
+            start, setup = time.perf_counter(), 0
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the 2d and 3d figures of many datasets as html files (and images), in parallel.')
+    parser.add_argument('datasets', nargs='+', help='the datasets, workbooks or folders with an edges and a nodes file')
+    parser.add_argument('--output', default=EXPORT_DIR, help='the output folder')
+    parser.add_argument('--kinds', nargs='+', default=['2d', '3d'], choices=['2d', '3d'])
+    parser.add_argument('--layouts-2d', nargs='+', default=['auto'], help='the layouts of the 2d figures')
+    parser.add_argument('--layouts-3d', nargs='+', default=['auto'], help='the layouts of the 3d figures')
+    parser.add_argument('--weight-ranges', nargs='+', type=weight_range, default=[(0.0, 1.0)],
+                        help='the ranges of the edge weights, relative to the heaviest edge, as low-high')
+    parser.add_argument('--directions', nargs='+', default=['all'], choices=list(DIRECTIONS))
+    parser.add_argument('--edge-bundling', default='off', choices=['off', 'on', 'both'], help='draw the edges bundled')
+    parser.add_argument('--render-mode', default=RENDER_MODE, choices=['svg', 'webgl', 'auto'])
+    parser.add_argument('--weight-buckets', type=int, default=WEIGHT_BUCKETS,
+                        help='the maximum number of width/opacity levels of the edges')
+    parser.add_argument('--images', nargs='+', default=[], choices=IMAGE_FORMATS, help='export static images too (needs kaleido)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='the number of worker processes')
+    parser.add_argument('--layout-cache-dir', default=LAYOUT_CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help='export also the views with unchanged inputs')
+    args = parser.parse_args(argv)
+    if args.images and kaleido is None:
+        parser.error('the static images need the kaleido package (pip install kaleido)')
+    folders = [os.path.splitext(os.path.basename(os.path.normpath(path)))[0] for path in args.datasets]
+    if len(set(folders)) < len(folders):
+        parser.error('the datasets must have different names, their files are written in folders named after them')
+
+    run_start = time.perf_counter()
+    os.makedirs(args.output, exist_ok=True)
+    plotlyjs = write_plotlyjs(args.output)
+    manifest = read_manifest(args.output)
+    manifest['plotlyjs'] = os.path.basename(plotlyjs)
+    bundling = {'off': [False], 'on': [True], 'both': [False, True]}[args.edge_bundling]
+    layouts = {'2d': args.layouts_2d, '3d': args.layouts_3d}
+    tasks, unchanged, failed = [], 0, 0
+    for path, folder in zip(args.datasets, folders):
+        try:
+            digest = dataset_hash(path)
+        except (OSError, ValueError) as error:
+            print('%s: %s' % (path, error), file=sys.stderr)
+            failed += 1
+            continue
+        for kind in args.kinds:
+            for layout in layouts[kind]:
+                views = []
+                for weights in args.weight_ranges:
+                    for direction in args.directions:
+                        for edge_bundling in bundling:
+                            view = View(kind, layout, weights, direction, edge_bundling)
+                            inputs = view_hash(digest, view, args.render_mode, args.weight_buckets)
+                            base = os.path.join(folder, view_name(view))
+                            paths = [base + '.html'] + [base + '.' + image_format for image_format in args.images]
+                            if not args.force and up_to_date(manifest, args.output, paths, inputs):
+                                unchanged += 1
+                                continue
+                            views.append((view, inputs))
+                if views:
+                    tasks.append((path, folder, kind, layout, views))
+
+    exported = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(export_views, path, folder, kind, layout, views, args.output, plotlyjs, args.render_mode,
+                               args.images, args.layout_cache_dir, args.weight_buckets): (path, kind, layout)
+                   for path, folder, kind, layout, views in tasks}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as error:
+                print('%s %s %s: failed, %r' % (futures[future] + (error,)), file=sys.stderr)
+                failed += 1
+                continue
+            for path, entry in results:
+                manifest['files'][path] = entry
+                print('%9.3f s %12d bytes  %s' % (entry['seconds'], entry['bytes'], path))
+            exported += len(results)
+            #written after every task, so an interrupted run keeps what it exported
+            write_file(os.path.join(args.output, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    write_file(os.path.join(args.output, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    print('%d files exported, %d views unchanged, %d failed, in %.1f s' % (exported, unchanged, failed, time.perf_counter() - run_start))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,788 @@
+'''
+Creation of the 2-d and 3-d plotly figures of the network.
+
+The edges are drawn with one trace per edge class (two-way/one-way) and weight level and the nodes with 
+one trace per node color, so the number of traces doesn't grow with the size of the graph. A trace has a single 
+line width and opacity: with up to WEIGHT_BUCKETS distinct weights every weight has its own trace and the edges look 
+as with one trace per edge, with more distinct weights the edges of a bucket share its mean weight (see weight_buckets).
+
+The traces and the layouts are built as plain dictionaries (specs) straight from the numpy arrays. The figures 
+of the app are kept as specs and serialized once by figure_json, without the validation of the plotly objects; 
+the create_* functions wrap the same specs in plotly objects for the code that needs them. 
+With edge bundling the edges are drawn as the merged segments of the bundling module instead.
+'''
+import functools
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+try:
+    import orjson
+except ImportError: #optional, the figures are serialized with the json module
+    orjson = None
+
+from bundling import cached_bundles
+from layouts import LAYOUT_CACHE_DIR, layout_2d, layout_3d
+from metrics import timed
+
+
+WEIGHT_BUCKETS = 10 # maximum number of width/opacity levels used when drawing the edges, see weight_buckets
+LARGE_GRAPH_EDGE_THRESHOLD = 2000 # above this number of edges the 2-d plot is drawn with WebGL
+RENDER_MODE = 'auto' # 'svg', 'webgl' or 'auto' to choose from the number of edges
+HOVER_MODE = 'callback' # 'callback' to look up the edge details in the app, 'embedded' to put the text in the figure
+
+def choose_render_mode(n_edges, render_mode=RENDER_MODE):
+    '''
+    -n_edges: the number of edges of the graph
+    -render_mode: 'svg', 'webgl' or 'auto'
+    
+    Returns: 
+    -'webgl' if the 2-d plot should be drawn with Scattergl traces, 'svg' otherwise
+    In 'auto' mode, WebGL is used for graphs with more than LARGE_GRAPH_EDGE_THRESHOLD edges, 
+    since the SVG annotations used for the arrows make pan/zoom unusable for large graphs. 
+    '''
+    if render_mode == 'auto':
+        return 'webgl' if n_edges > LARGE_GRAPH_EDGE_THRESHOLD else 'svg'
+    return render_mode
+
+
+TRACE_TYPES = {'scatter': go.Scatter, 'scattergl': go.Scattergl, 'scatter3d': go.Scatter3d}
+
+def trace_object(spec):
+    '''
+    -spec: a trace as a dictionary, with its type
+    
+    Returns: 
+    -the plotly trace object of the spec
+    '''
+    spec = dict(spec)
+    return TRACE_TYPES[spec.pop('type')](**spec)
+
+
+#the two edge classes: (is_bidirectional, color, legendgroup, legend name)
+EDGE_CLASSES = [(True, 'red', 'red', 'Two-way Edge'),
+                (False, 'cornflowerblue', 'blue', 'One-way Edge')]
+
+def line_segments(start, end):
+    '''
+    -start: array with the coordinates of the beginning of every edge
+    -end: array with the coordinates of the ending of every edge
+    
+    Returns: 
+    -an array of the form [start_0, end_0, None, start_1, end_1, None, ...] that plotly draws as separate lines
+    '''
+    coords = np.empty(3*len(start), dtype=object)
+    coords[0::3] = start
+    coords[1::3] = end
+    coords[2::3] = None
+    return coords
+
+
+def bucket_of(norm_weights, n_buckets=WEIGHT_BUCKETS):
+    '''
+    -norm_weights: array with the weights of the edges normalized between 0 and 1
+    -n_buckets: the number of width/opacity levels
+    
+    Returns: 
+    -an array with the bucket of every edge, between 0 and n_buckets - 1
+    '''
+    return np.clip(np.ceil(np.asarray(norm_weights)*n_buckets).astype(int) - 1, 0, n_buckets - 1)
+
+
+def weight_buckets(norm_weights, n_buckets=WEIGHT_BUCKETS):
+    '''
+    -norm_weights: array with the weights of the edges normalized between 0 and 1
+    -n_buckets: the maximum number of width/opacity levels
+    
+    Returns: 
+    -an array with the level of every edge
+    -an array with the normalized weight drawn for every level
+    When there are at most n_buckets distinct weights (the integer weights of the case study), every distinct weight is 
+    its own level and the edges are drawn exactly as with one trace per edge. Otherwise the weights are cut in n_buckets 
+    equal ranges and every edge is drawn with the mean weight of its range, which changes the width and opacity of an 
+    edge by less than 1/n_buckets of the heaviest edge; a larger n_buckets gives a closer picture with more traces.
+    '''
+    norm_weights = np.asarray(norm_weights, dtype=float)
+    values, inverse = np.unique(norm_weights, return_inverse=True)
+    if len(values) <= n_buckets:
+        return inverse.ravel(), values
+    buckets = bucket_of(norm_weights, n_buckets)
+    counts = np.bincount(buckets, minlength=n_buckets)
+    sums = np.bincount(buckets, weights=norm_weights, minlength=n_buckets)
+    levels = np.divide(sums, counts, out=np.zeros(n_buckets), where=counts > 0)
+    return buckets, levels
+
+
+def edge_trace_groups(norm_weights, is_bidirectional, n_buckets=WEIGHT_BUCKETS, buckets=None):
+    '''
+    -norm_weights: array with the weights of the edges normalized between 0 and 1
+    -is_bidirectional: boolean array, True for the edges that are bidirectional
+    -n_buckets: the maximum number of width/opacity levels, see weight_buckets
+    -buckets: the (level of every edge, normalized weight of every level) of weight_buckets, computed on a larger set
+    of edges to draw these edges with its levels; None to compute them from norm_weights
+    
+    Returns: 
+    -a list with one entry per edge class and weight level. Every entry is a tuple 
+    (indices of the edges, normalized weight of the level, color, legendgroup, name, showlegend)
+    Only the first trace of every edge class is shown in the legend. 
+    '''
+    buckets, levels = weight_buckets(norm_weights, n_buckets) if buckets is None else buckets
+    groups = []
+    for bidirectional, color, legendgroup, name in EDGE_CLASSES:
+        in_class = is_bidirectional == bidirectional
+        keys = buckets[in_class]
+        order = np.argsort(keys, kind='stable')
+        members = np.flatnonzero(in_class)[order]
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for i, group in enumerate(np.split(members, bounds)):
+            if len(group) == 0:
+                continue
+            groups.append((group, float(levels[buckets[group[0]]]), color, legendgroup, name, i == 0))
+    return groups
+
+
+def edge_trace_specs(edge_index, pos, n_buckets=WEIGHT_BUCKETS, render_mode='svg', buckets=None):
+    '''
+    -edge_index: the columnar edge index of the graph
+    -pos: the 2-d or 3-d positions of the nodes, a dictionary with key the node_id or an array in the order of the index nodes
+    -n_buckets: the maximum number of width/opacity levels, see weight_buckets
+    -render_mode: 'webgl' for Scattergl traces (drawn as straight lines), 'svg' otherwise, unused by the 3-d plot
+    -buckets: the weight levels of the edges, see edge_trace_groups
+    
+    Returns: 
+    -a list with the specs of the edge traces of the 2-d or 3-d plot (as the positions), one per edge class and weight bucket
+    The opacity and width of the edges are relative to the edge weight
+    The bidirected edges are coloured in red while the one-way relations are blue. 
+    '''
+    start, end = edge_index.endpoints(pos)
+    dim = start.shape[1]
+    trace_type = 'scatter3d' if dim == 3 else 'scattergl' if render_mode == 'webgl' else 'scatter'
+    line_shape = {'shape': 'spline'} if trace_type == 'scatter' else {} #splines are only supported by Scatter
+    traces = []
+    for group, level, color, legendgroup, name, showlegend in edge_trace_groups(edge_index.norm_weight, edge_index.is_bidirectional, n_buckets,
+                                                                                buckets):
+        trace = {'type': trace_type}
+        for d, axis in enumerate(('x', 'y', 'z')[:dim]):
+            trace[axis] = line_segments(start[group, d], end[group, d])
+        trace.update({'mode': 'lines',
+                      'line': dict(line_shape, width=10*level, color=color),
+                      'legendgroup': legendgroup,
+                      'name': name,
+                      'opacity': level, 'showlegend': showlegend})
+        traces.append(trace)
+    return traces
+
+
+def create_edge_traces(edge_index, pos, n_buckets=WEIGHT_BUCKETS, render_mode='svg'):
+    '''
+    -edge_index, pos, n_buckets, render_mode: see edge_trace_specs
+    
+    Returns: 
+    -a list with the plotly edge traces of the 2-d plot
+    '''
+    return [trace_object(spec) for spec in edge_trace_specs(edge_index, pos, n_buckets, render_mode)]
+
+
+def bundle_trace_specs(bundles, n_buckets=WEIGHT_BUCKETS, render_mode='svg'):
+    '''
+    -bundles: the EdgeBundles of the edges, see the bundling module
+    -n_buckets: the maximum number of width/opacity levels, see weight_buckets
+    -render_mode: 'webgl' for Scattergl traces, 'svg' otherwise, unused by the 3-d bundles
+    
+    Returns: 
+    -a list with the specs of the traces of the bundled edges, one per edge class and weight bucket as in edge_trace_specs. 
+    The width and opacity of a segment are relative to the summed weight of the edges going through it. 
+    '''
+    dim = bundles.start.shape[1]
+    axes = ('x', 'y', 'z')[:dim]
+    trace_type = 'scatter3d' if dim == 3 else 'scattergl' if render_mode == 'webgl' else 'scatter'
+    traces = []
+    for group, level, color, legendgroup, name, showlegend in edge_trace_groups(bundles.norm_weight, bundles.is_bidirectional, n_buckets):
+        trace = {'type': trace_type, 'mode': 'lines',
+                 'line': {'width': 10*level, 'color': color},
+                 'legendgroup': legendgroup,
+                 'name': name,
+                 'opacity': level, 'showlegend': showlegend, 'hoverinfo': 'skip'}
+        for d, axis in enumerate(axes):
+            trace[axis] = line_segments(bundles.start[group, d], bundles.end[group, d])
+        traces.append(trace)
+    return traces
+
+
+def arrow_trace_spec(edge_index, pos, render_mode='webgl'):
+    '''
+    -edge_index: the columnar edge index of the graph
+    -pos: a dictionary with key the node_id and value the array of 2-d positions of the node
+    -render_mode: 'webgl' for a Scattergl trace, 'svg' otherwise
+    
+    Returns: 
+    -the spec of a single marker trace with one triangle per edge, placed where the annotation arrows point to 
+    (3/4 of the way to the target) and rotated by the exact angle of the edge. 
+    It replaces the per-edge layout annotations in the WebGL render mode.
+    '''
+    start, end = edge_index.endpoints(pos)
+    tips = (end*3 + start)/4
+    #marker.angle is in degrees clockwise from the up direction of the triangle
+    angles = 90 - np.degrees(np.arctan2(end[:, 1] - start[:, 1], end[:, 0] - start[:, 0]))
+    marker = {'symbol': 'triangle-up', 'angle': angles, 'size': 12,
+              'color': np.where(edge_index.is_bidirectional, 'red', 'cornflowerblue')}
+    if render_mode != 'webgl':
+        marker['angleref'] = 'up' #Scattergl has no angleref, its angles are always from the up direction
+    return {'type': 'scattergl' if render_mode == 'webgl' else 'scatter',
+            'x': tips[:, 0], 'y': tips[:, 1],
+            'mode': 'markers',
+            'marker': marker,
+            'opacity': 0.7,
+            'hoverinfo': 'skip', 'showlegend': False}
+
+
+def create_arrow_trace(edge_index, pos, render_mode='webgl'):
+    '''
+    -edge_index, pos, render_mode: see arrow_trace_spec
+    
+    Returns: 
+    -the plotly trace of the arrows
+    '''
+    return trace_object(arrow_trace_spec(edge_index, pos, render_mode))
+
+
+def node_trace_specs(Gr_dir, pos, render_mode='svg', with_ids=False):
+    '''
+    -Gr_dir: the directed graph
+    -pos: a dictionary with key the node_id and value the array of 2-d or 3-d positions of the node
+    -render_mode: 'webgl' for Scattergl traces, 'svg' otherwise, unused by the 3-d plot
+    -with_ids: True to add the node ids as customdata and to size the nodes by their 'node_size' attribute
+    
+    Returns: 
+    -a list with the specs of the node traces to be used in the figure, one per node color 
+    '''
+    node_list = list(Gr_dir.nodes)
+    coords = np.array([pos[node] for node in node_list], dtype=float)
+    labels = np.array([Gr_dir.nodes[node]['node_label'] for node in node_list], dtype=object)
+    colors = np.array([Gr_dir.nodes[node]['node_color'] for node in node_list], dtype=object)
+    if not with_ids:
+        return node_marker_specs(coords, labels, colors, render_mode=render_mode)
+    sizes = np.array([Gr_dir.nodes[node].get('node_size', 20) for node in node_list], dtype=float)
+    return node_marker_specs(coords, labels, colors, render_mode=render_mode, ids=np.array(node_list, dtype=object), sizes=sizes)
+
+
+def node_marker_specs(coords, labels, colors, render_mode='svg', ids=None, sizes=None):
+    '''
+    -coords: array with the 2-d or 3-d positions of the nodes
+    -labels: array with the labels of the nodes
+    -colors: array with the colors of the nodes
+    -render_mode: 'webgl' for Scattergl traces, 'svg' otherwise, unused by the 3-d plot
+    -ids: array with the node ids, added as customdata (optional)
+    -sizes: array with the marker sizes of the nodes (optional, 20 by default)
+    
+    Returns: 
+    -a list with the specs of the node traces of the 2-d or 3-d plot (as the positions), one per node color 
+    '''
+    dim = coords.shape[1]
+    codes, unique_colors = pd.factorize(pd.Series(colors, dtype=object))
+    traces = []
+    for i, color in enumerate(unique_colors):
+        group = np.flatnonzero(codes == i)
+        trace = {'type': 'scatter3d' if dim == 3 else 'scattergl' if render_mode == 'webgl' else 'scatter'}
+        for d, axis in enumerate(('x', 'y', 'z')[:dim]):
+            trace[axis] = coords[group, d]
+        trace.update({'mode': 'markers',
+                      'marker': {'symbol': 'circle', 'size': 20 if sizes is None else sizes[group], 'color': color}, #color the nodes according to their community
+                      'legendgroup': str(color),
+                      'name': str(color),
+                      'showlegend': True,
+                      'text': labels[group], #label according to the node label
+                      'hoverinfo': 'text'})
+        if ids is not None:
+            trace['customdata'] = ids[group]
+        traces.append(trace)
+    return traces
+
+
+def node_marker_traces(coords, labels, colors, render_mode='svg', ids=None, sizes=None):
+    '''
+    -coords, labels, colors, render_mode, ids, sizes: see node_marker_specs
+    
+    Returns: 
+    -a list with the plotly node traces, one per node color 
+    '''
+    return [trace_object(spec) for spec in node_marker_specs(coords, labels, colors, render_mode, ids, sizes)]
+
+
+def format_weight(weight):
+    '''
+    -weight: the weight of an edge
+    
+    Returns: 
+    -the weight as text, without a trailing .0 for whole numbers (the weights are read as floats)
+    '''
+    return np.format_float_positional(weight, trim='-')
+
+
+def format_weights(weights):
+    '''
+    -weights: array with weights
+    
+    Returns: 
+    -an object array with the weights as text. Only the distinct weights are formatted.
+    '''
+    values, inverse = np.unique(weights, return_inverse=True)
+    return np.array([format_weight(value) for value in values], dtype=object)[inverse.ravel()]
+
+
+def edge_hovertexts(edge_index, node_labels):
+    '''
+    -edge_index: the columnar edge index of the graph
+    -node_labels: array with the labels of the nodes, in the order of the index nodes
+    
+    Returns: 
+    -an object array with the text shown when hovering over the middle of every edge, 
+    built with vectorized string operations over all the edges at once
+    '''
+    labels = np.asarray(node_labels).astype(str).astype(object)
+    source = labels[edge_index.source_code]
+    target = labels[edge_index.target_code]
+    weight = format_weights(edge_index.weight)
+    one_way = "From: " + source + " To: " + target + ", weight: " + weight
+    if not edge_index.is_bidirectional.any():
+        return one_way
+    reverse_weight = np.where(edge_index.is_bidirectional, format_weights(edge_index.reverse_weight), '')
+    two_way = ("Bidirectional edge:" + "<br>" + source + " To: " + target + ", weight: " + weight
+               + "<br>" + target + " To: " + source + ", weight: " + reverse_weight)
+    return np.where(edge_index.is_bidirectional, two_way, one_way)
+
+
+def edge_details(edge_index, node_labels, i):
+    '''
+    -edge_index: the columnar edge index of the graph
+    -node_labels: array with the labels of the nodes, in the order of the index nodes
+    -i: the position of the edge in the index
+    
+    Returns: 
+    -a list with the lines describing the edge, shown in the side panel of the app
+    '''
+    source = str(node_labels[edge_index.source_code[i]])
+    target = str(node_labels[edge_index.target_code[i]])
+    if edge_index.is_bidirectional[i]:
+        return ["Bidirectional edge:",
+                source + " To: " + target + ", weight: " + format_weight(edge_index.weight[i]),
+                target + " To: " + source + ", weight: " + format_weight(edge_index.reverse_weight[i])]
+    return ["From: " + source + " To: " + target + ", weight: " + format_weight(edge_index.weight[i])]
+
+
+def hovered_edge(point, edge_index, coords):
+    '''
+    -point: a point of the hoverData or clickData of a graph
+    -edge_index: the columnar edge index of the graph
+    -coords: array with the positions of the nodes the figure was built with, in the order of the index nodes
+
+    Returns:
+    -the position in the index of the edge of the point, None if the point is not the middle node of an edge.
+    The customdata of a middle node is checked against the middle of its edge in the layout arrays, so a point
+    of a figure built before the dataset changed is not taken for another edge.
+    '''
+    i = point.get('customdata')
+    if not isinstance(i, (int, float)) or isinstance(i, bool) or not 0 <= i < len(edge_index.source_code) or i != int(i):
+        return None
+    i = int(i)
+    axes = ('x', 'y', 'z')[:coords.shape[1]]
+    if any(not isinstance(point.get(axis), (int, float)) for axis in axes):
+        return None
+    middle = (coords[edge_index.source_code[i]] + coords[edge_index.target_code[i]])/2
+    return i if np.allclose([point[axis] for axis in axes], middle, rtol=1e-6, atol=1e-9) else None
+
+
+def middle_trace_text(edge_index, node_labels, hover):
+    '''
+    -edge_index: the columnar edge index of the graph
+    -node_labels: array with the labels of the nodes, in the order of the index nodes
+    -hover: 'callback' or 'embedded'
+    
+    Returns: 
+    -the hover arguments of the middle node trace. Every middle node carries the position of its edge in 
+    the index of the whole graph as customdata. In the 'callback' mode no text is embedded in the figure and the plotly tooltip 
+    is disabled, the details are looked up by the app. In the 'embedded' mode the text is shown as tooltip.
+    '''
+    if hover == 'callback':
+        return dict(customdata=edge_index.ids, hoverinfo='none')
+    return dict(customdata=edge_index.ids, hovertext=edge_hovertexts(edge_index, node_labels), hoverinfo='text')
+
+
+def middle_trace_spec(edge_index, node_labels, pos, render_mode='svg', hover=HOVER_MODE):
+    '''
+    -edge_index: the columnar edge index of the graph
+    -node_labels: array with the labels of the nodes, in the order of the index nodes
+    -pos: a dictionary with key the node_id and value the array of 2-d positions of the node
+    -render_mode: 'webgl' for a Scattergl trace, 'svg' otherwise
+    -hover: 'callback' or 'embedded', see middle_trace_text
+    
+    Returns: 
+    -the spec of the trace of the middle nodes
+
+    Since plotly doesn't allow for text annotation in the edges, 
+    create nodes that are invisible in the middle of the edges where we can find the information about the edges.
+    '''
+    midpoints = edge_index.midpoints(pos)
+    return dict({'type': 'scattergl' if render_mode == 'webgl' else 'scatter',
+                 'x': midpoints[:, 0], 'y': midpoints[:, 1], 'mode': 'markers',
+                 'marker': {'size': 20, 'color': 'LightSkyBlue'},
+                 'opacity': 0, 'showlegend': False}, **middle_trace_text(edge_index, node_labels, hover))
+
+
+def create_middle_trace(edge_index, node_labels, pos, render_mode='svg', hover=HOVER_MODE):
+    '''
+    -edge_index, node_labels, pos, render_mode, hover: see middle_trace_spec
+    
+    Returns: 
+    -the plotly trace of the middle nodes
+    '''
+    return trace_object(middle_trace_spec(edge_index, node_labels, pos, render_mode, hover))
+
+
+def create_arrow_annotations(edge_index, pos):
+    '''
+    -edge_index: the columnar edge index of the graph
+    -pos: a dictionary with key the node_id and value the array of 2-d positions of the node
+    
+    Returns: 
+    -a list with one layout annotation per edge, an arrow from the middle of the edge towards its target
+    '''
+    start, end = edge_index.endpoints(pos)
+    return [dict(
+                ax=(s[0] + e[0]) / 2,
+                ay=(s[1] + e[1]) / 2, axref='x', ayref='y',
+                x=(e[0] * 3 + s[0]) / 4,
+                y=(e[1] * 3 + s[1]) / 4, xref='x', yref='y',
+                showarrow=True,
+                arrowhead=3,
+                arrowsize=4,
+                arrowwidth=1,
+                arrowcolor='red' if bidirectional else 'cornflowerblue',
+                opacity=0.7
+            ) for s, e, bidirectional in zip(start, end, edge_index.is_bidirectional)]
+
+
+def figure_spec_2d(network, pos, render_mode=RENDER_MODE, hover=HOVER_MODE, with_ids=False, template=True, bundles=None,
+                   n_buckets=WEIGHT_BUCKETS):
+    '''
+    -network: the Network of the dataset
+    -pos: a dictionary with key the node_id and value the array of 2-d positions of the node
+    -render_mode: 'svg', 'webgl' or 'auto'
+    -hover: 'callback' or 'embedded', see middle_trace_text
+    -with_ids: True to add the node ids as customdata of the node traces, see node_trace_specs
+    -template: True to add the default plotly template to the layout, as plotly does when a figure is serialized
+    -bundles: the EdgeBundles of the edges to draw them bundled (see assemble_spec_2d), None for straight edges
+    -n_buckets: the maximum number of width/opacity levels of the edges, see weight_buckets
+    
+    Returns: 
+    -the spec of the 2-d figure of the network, a dictionary with the data and the layout
+    The arrows are drawn as layout annotations in the svg mode and as a marker trace in the webgl mode.
+    '''
+    Gr_dir, edge_index = network.graph, network.edge_index
+    render_mode = choose_render_mode(len(edge_index), render_mode)
+    node_specs = node_trace_specs(Gr_dir, pos, render_mode=render_mode, with_ids=with_ids)
+    spec = assemble_spec_2d(edge_index, network.node_labels, pos, node_specs, render_mode=render_mode, hover=hover, bundles=bundles,
+                            n_buckets=n_buckets)
+    return with_template(spec) if template else spec
+
+
+@timed('figure_2d')
+def create_figure_2d(network, pos, render_mode=RENDER_MODE, hover=HOVER_MODE, with_ids=False):
+    '''
+    -network, pos, render_mode, hover, with_ids: see figure_spec_2d
+    
+    Returns: 
+    -the 2-d figure of the network, as a plotly figure
+    '''
+    return go.Figure(figure_spec_2d(network, pos, render_mode, hover, with_ids, template=False))
+
+
+def assemble_spec_2d(edge_index, node_labels, pos, node_specs, render_mode='svg', hover=HOVER_MODE, middle_index=None, bundles=None,
+                     n_buckets=WEIGHT_BUCKETS, buckets=None):
+    '''
+    -edge_index: the columnar edge index of the edges to draw
+    -node_labels: array with the labels of the nodes, in the order of the index nodes
+    -pos: the 2-d positions of the nodes, a dictionary or an array in the order of the index nodes
+    -node_specs: the specs of the node traces of the figure
+    -render_mode: 'svg' or 'webgl'
+    -hover: 'callback' or 'embedded', see middle_trace_text
+    -middle_index: the edge index of the edges that get a middle node, all the edges by default
+    -bundles: the EdgeBundles of the edges, None to draw every edge as a straight line
+    -n_buckets: the maximum number of width/opacity levels of the edges, see weight_buckets
+    -buckets: the weight levels of the straight edges, see edge_trace_groups
+    
+    Returns: 
+    -the spec of the 2-d figure with the edge traces, the arrows, the node traces and the middle nodes. 
+    The bundled edges have no arrows, since the segments are shared by edges of both directions; the middle nodes 
+    stay in the middle of the straight edges, so the details of an edge are still shown there.
+    '''
+    if bundles is None:
+        data = edge_trace_specs(edge_index, pos, n_buckets, render_mode=render_mode, buckets=buckets)
+    else:
+        data = bundle_trace_specs(bundles, n_buckets, render_mode=render_mode)
+    if render_mode == 'webgl' and bundles is None:
+        data.append(arrow_trace_spec(edge_index, pos))
+    data += node_specs
+    middle_index = edge_index if middle_index is None else middle_index
+    data.append(middle_trace_spec(middle_index, node_labels, pos, render_mode=render_mode, hover=hover))
+    layout = layout_spec_2d([] if render_mode == 'webgl' or bundles is not None else create_arrow_annotations(edge_index, pos))
+    layout['legend'] = {'itemclick': False, 'itemdoubleclick': False}
+    return {'data': data, 'layout': layout}
+
+
+def layout_spec_2d(annotations=()):
+    '''
+    -annotations: the layout annotations, the arrows of the edges in the svg mode
+    
+    Returns: 
+    -the spec of the layout of the 2-d figure
+    '''
+    layout = {'title': {'text': 'Network 2-d visualization'}, 'showlegend': True, 'hovermode': 'closest',
+              'margin': {'b': 60, 'l': 60, 'r': 60, 't': 60},
+              'xaxis': {'showgrid': False, 'zeroline': False, 'showticklabels': False},
+              'yaxis': {'showgrid': False, 'zeroline': False, 'showticklabels': False},
+              'height': 600,
+              'clickmode': 'event+select'}
+    if len(annotations): #plotly leaves out an empty list
+        layout['annotations'] = list(annotations)
+    return layout
+
+
+def create_layout_2d(annotations=()):
+    '''
+    -annotations: the layout annotations, the arrows of the edges in the svg mode
+    
+    Returns: 
+    -the layout of the 2-d figure
+    '''
+    return go.Layout(layout_spec_2d(annotations))
+
+
+def middle_trace_spec3d(edge_index, node_labels, pos, hover=HOVER_MODE):
+    '''
+    -edge_index: the columnar edge index of the graph
+    -node_labels: array with the labels of the nodes, in the order of the index nodes
+    -pos: a dictionary with key the node_id and value the array of 3-d positions of the node
+    -hover: 'callback' or 'embedded', see middle_trace_text
+    
+    Returns: 
+    -the spec of the trace of the invisible middle nodes that carry the information about the edges
+    '''
+    midpoints3d = edge_index.midpoints(pos)
+    return dict({'type': 'scatter3d', 'x': midpoints3d[:, 0], 'y': midpoints3d[:, 1], 'z': midpoints3d[:, 2], 'mode': 'markers',
+                 'marker': {'size': 20, 'color': 'LightSkyBlue'},
+                 'opacity': 0, 'showlegend': False}, **middle_trace_text(edge_index, node_labels, hover))
+
+
+def layout_spec_3d():
+    '''
+    Returns: 
+    -the spec of the layout of the 3-d figure
+    '''
+    axis = dict(showbackground=False,
+                showline=False,
+                zeroline=False,
+                showgrid=False,
+                showticklabels=False,
+                title={'text': ''})
+    return {'title': {'text': "The network 3-d visualization"},
+            'margin': {'b': 60, 'l': 60, 'r': 60, 't': 60},
+            'height': 600,
+            'showlegend': True,
+            'scene': {'xaxis': dict(axis), 'yaxis': dict(axis), 'zaxis': dict(axis)},
+            'hovermode': 'closest',
+            'legend': {'itemclick': False, 'itemdoubleclick': False}}
+
+
+def figure_spec_3d(network, pos3d, hover=HOVER_MODE, template=True, bundles=None, n_buckets=WEIGHT_BUCKETS):
+    '''
+    -network: the Network of the dataset
+    -pos3d: a dictionary with key the node_id and value the array of 3-d positions of the node
+    -hover: 'callback' or 'embedded', see middle_trace_text
+    -template: True to add the default plotly template to the layout, see figure_spec_2d
+    -bundles: the EdgeBundles of the edges to draw them bundled, None for straight edges
+    -n_buckets: the maximum number of width/opacity levels of the edges, see weight_buckets
+    
+    Returns: 
+    -the spec of the 3-d figure of the network
+    '''
+    Gr_dir, edge_index = network.graph, network.edge_index
+    spec = assemble_spec_3d(edge_index, network.node_labels, pos3d, node_trace_specs(Gr_dir, pos3d), hover=hover, bundles=bundles,
+                            n_buckets=n_buckets)
+    return with_template(spec) if template else spec
+
+
+def assemble_spec_3d(edge_index, node_labels, pos, node_specs, hover=HOVER_MODE, bundles=None, n_buckets=WEIGHT_BUCKETS, buckets=None):
+    '''
+    -edge_index: the columnar edge index of the edges to draw
+    -node_labels: array with the labels of the nodes, in the order of the index nodes
+    -pos: the 3-d positions of the nodes, a dictionary or an array in the order of the index nodes
+    -node_specs: the specs of the node traces of the figure
+    -hover: 'callback' or 'embedded', see middle_trace_text
+    -bundles: the EdgeBundles of the edges, None to draw every edge as a straight line
+    -n_buckets: the maximum number of width/opacity levels of the edges, see weight_buckets
+    -buckets: the weight levels of the straight edges, see edge_trace_groups
+    
+    Returns: 
+    -the spec of the 3-d figure with the edge traces, the node traces and the middle nodes
+    '''
+    edge_specs = edge_trace_specs(edge_index, pos, n_buckets, buckets=buckets) if bundles is None else bundle_trace_specs(bundles, n_buckets)
+    data = edge_specs + list(node_specs)
+    data.append(middle_trace_spec3d(edge_index, node_labels, pos, hover=hover))
+    return {'data': data, 'layout': layout_spec_3d()}
+
+
+@timed('figure_3d')
+def create_figure_3d(network, pos3d, hover=HOVER_MODE):
+    '''
+    -network, pos3d, hover: see figure_spec_3d
+    
+    Returns: 
+    -the 3-d figure of the network, as a plotly figure
+    '''
+    return go.Figure(figure_spec_3d(network, pos3d, hover, template=False))
+
+
+@functools.lru_cache(maxsize=None)
+def default_template():
+    '''
+    Returns: 
+    -the default plotly template as a dictionary, computed once
+    '''
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+def with_template(spec):
+    '''
+    -spec: the spec of a figure
+    
+    Returns: 
+    -the spec with the default plotly template in the layout, which plotly adds to the figures it serializes
+    '''
+    return {'data': spec['data'], 'layout': dict(spec['layout'], template=default_template())}
+
+
+def json_default(obj):
+    '''
+    -obj: an object that the json encoder doesn't support
+    
+    Returns: 
+    -the object converted to the json types, for the numpy arrays (of objects or not contiguous) and scalars
+    '''
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError('%r is not JSON serializable' % type(obj))
+
+
+@timed('figure_json')
+def figure_json(fig):
+    '''
+    -fig: the spec of a figure, or a plotly figure
+    
+    Returns: 
+    -the figure serialized as JSON, as bytes. The numpy arrays are written by orjson when it is installed, 
+    the json module is used otherwise. The bytes are what the app caches and sends, to the graphs and in the html exports.
+    '''
+    if isinstance(fig, go.Figure):
+        fig = fig.to_plotly_json()
+    if orjson is not None:
+        return orjson.dumps(fig, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(fig, default=json_default, separators=(',', ':')).encode()
+
+
+def append_traces(figure, traces):
+    '''
+    -figure: a figure serialized by figure_json
+    -traces: the specs of the traces to add
+    
+    Returns: 
+    -the serialized figure with the traces drawn over the others, without parsing the figure again. The data of the 
+    figure is the first key of its JSON, so it ends at the first '],"layout":' (a quote inside a string is escaped).
+    '''
+    if not traces:
+        return figure
+    figure = bytes(figure)
+    end = figure.index(b'],"layout":')
+    separator = b'' if figure[end - 1:end] == b'[' else b','
+    return b''.join([figure[:end], separator, figure_json(list(traces))[1:-1], figure[end:]])
+
+
+HTML_DIV_ID = 'network-figure' # a fixed id, so the same figure always gives the same html export
+
+HTML_TEMPLATE = '''<html>
+<head><meta charset="utf-8" /></head>
+<body>
+    <div>
+        <script type="text/javascript">window.PlotlyConfig = {MathJaxConfig: 'local'};</script>
+        %(plotlyjs)s
+        <div id="%(id)s" class="plotly-graph-div" style="height:%(height)s; width:100%%;"></div>
+        <script type="text/javascript">
+            window.PLOTLYENV = window.PLOTLYENV || {};
+            if (document.getElementById("%(id)s")) {
+                var figure = %(figure)s;
+                Plotly.newPlot("%(id)s", figure.data, figure.layout, {"responsive": true});
+            };
+        </script>
+    </div>
+</body>
+</html>'''
+
+
+@timed('write_html')
+def figure_html(fig, include_plotlyjs=True, height='600px'):
+    '''
+    -fig: the figure serialized by figure_json (bytes), or a spec or plotly figure that is serialized first
+    -include_plotlyjs: True to embed the plotly.js bundle in the file, 'cdn' to load it from the plotly CDN, or the path 
+    or url of a plotly.js file ending in '.js' (relative to the html file), shared by several exports
+    -height: the height of the div of the figure
+    
+    Returns: 
+    -the html export of the figure, as bytes. The page is the one of plotly's write_html, 
+    filled with the serialized figure instead of serializing the figure again.
+    '''
+    figure = fig if isinstance(fig, (bytes, bytearray, memoryview)) else figure_json(fig)
+    if include_plotlyjs == 'cdn':
+        plotlyjs = '<script src="https://cdn.plot.ly/plotly-%s.min.js" charset="utf-8"></script>' % get_plotlyjs_version()
+    elif isinstance(include_plotlyjs, str) and include_plotlyjs.endswith('.js'):
+        plotlyjs = '<script src="%s" charset="utf-8"></script>' % include_plotlyjs
+    else:
+        plotlyjs = '<script type="text/javascript">%s</script>' % get_plotlyjs()
+    page = HTML_TEMPLATE % {'plotlyjs': plotlyjs, 'id': HTML_DIV_ID, 'height': height, 'figure': '%(figure)s'}
+    head, tail = page.encode().split(b'%(figure)s')
+    #a closing tag inside a label would end the script
+    return b''.join([head, bytes(figure).replace(b'</', b'<\\/'), tail])
+
+
+@timed('figure_spec')
+def build_figure(network, kind, render_mode=RENDER_MODE, layout_cache_dir=LAYOUT_CACHE_DIR, layout='auto', hover=HOVER_MODE,
+                 edge_bundling=False, n_buckets=WEIGHT_BUCKETS, pos=None, dataset=None):
+    '''
+    -network: the Network of the dataset
+    -kind: '2d' or '3d'
+    -render_mode: 'svg', 'webgl' or 'auto', used by the 2-d figure
+    -layout_cache_dir: the folder of the cached layouts and bundles, None to disable the cache
+    -layout: the name of the layout of the figure (see the layouts module) or 'auto'
+    -hover: 'callback' or 'embedded', see middle_trace_text. The html exports need 'embedded', since there is no app to look up the details.
+    -edge_bundling: True to draw the edges bundled, see the bundling module
+    -n_buckets: the maximum number of width/opacity levels of the edges, see weight_buckets
+    -pos: the positions of the nodes by node_id, None to compute them with the layouts module
+    -dataset: the path of the dataset, which keeps its cached layouts and bundles apart from those of the other datasets
+    
+    Returns: 
+    -the spec of the figure of the network, with the positions of the nodes computed by the layouts module. 
+    It is serialized by figure_json without building the plotly figure.
+    '''
+    if kind not in ('2d', '3d'):
+        raise ValueError("kind must be '2d' or '3d', got %r" % (kind,))
+    if pos is None:
+        pos = (layout_2d if kind == '2d' else layout_3d)(network.graph, layout, cache_dir=layout_cache_dir, dataset=dataset)
+    bundles = cached_bundles(network.edge_index, pos, cache_dir=layout_cache_dir, dataset=dataset) if edge_bundling else None
+    if kind == '2d':
+        return figure_spec_2d(network, pos, render_mode=render_mode, hover=hover, bundles=bundles, n_buckets=n_buckets)
+    return figure_spec_3d(network, pos, hover=hover, bundles=bundles, n_buckets=n_buckets)
@@ -0,0 +1,192 @@
+'''
+Filtering of the 2D and 3D figures by edge weight, node color category and edge direction.
+
+The filters are boolean masks over the arrays of the edge index, the networkx graph is never built again.
+The mask of every control (weight range, colors, direction) is memoized on its own, and the edges and the
+serialized figure of every combination of the controls, so moving a slider back to a previous value is served
+from memory. The positions of the nodes are kept apart from these entries, so they are never evicted by them. The filtered edges keep the normalized weights of the whole graph (see EdgeIndex.take)
+and are drawn with the weight levels of the whole graph (see figures.weight_buckets), so a straight edge has the same
+width and opacity in every filtered figure. The bundled segments are merged from the filtered edges only, so their
+widths follow the sums of the edges kept.
+'''
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from bundling import bundle_edges
+from cache import LRUCache
+from figures import (HOVER_MODE, RENDER_MODE, WEIGHT_BUCKETS, assemble_spec_2d, assemble_spec_3d, choose_render_mode, figure_json,
+                     node_marker_specs, weight_buckets, with_template)
+from metrics import span
+
+FILTER_CACHE_SIZE = 64 # number of masks and filtered figures kept in memory
+WEIGHT_STEP = 0.05 # step of the weight slider, the weights are relative to the heaviest edge
+
+#the values of the direction control: the edges kept, by their is_bidirectional value
+DIRECTIONS = {'all': (True, False), 'two-way': (True,), 'one-way': (False,)}
+
+Filters = namedtuple('Filters', ['weight_range', 'colors', 'direction'])
+
+
+class FilteredNetwork:
+    '''
+    The arrays of the network needed to filter its figures, with the memoized masks and filtered figures.
+
+    Attributes:
+    -edge_index: the columnar edge index of the whole graph
+    -node_labels: array with the labels of the nodes, in the order of the index nodes
+    -node_colors: array with the color category of every node, in the order of the index nodes
+    -categories: the list of the color categories, in the order of their first appearance
+    -buckets: the (level of every edge, normalized weight of every level) of the whole graph, see figures.weight_buckets
+    '''
+
+    def __init__(self, edge_index, node_labels, node_colors, get_positions, render_mode=RENDER_MODE,
+                 hover=HOVER_MODE, cache_size=FILTER_CACHE_SIZE, edge_bundling=False, n_buckets=WEIGHT_BUCKETS):
+        '''
+        -edge_index, node_labels, node_colors: see the attributes
+        -get_positions: a function kind -> array with the 2d or 3d positions of the nodes, in the order of the index nodes.
+        It is called the first time a figure of the kind is filtered.
+        -render_mode, hover: the options of the figures, see figures.figure_spec_2d
+        -cache_size: the number of masks and figures kept in memory
+        -edge_bundling: True to bundle the edges kept by the filters, see the bundling module
+        -n_buckets: the maximum number of width/opacity levels of the edges, see figures.weight_buckets
+        '''
+        self.edge_index = edge_index
+        self.node_labels = np.asarray(node_labels, dtype=object)
+        self.node_colors = np.asarray(node_colors, dtype=object)
+        self.color_codes, categories = pd.factorize(pd.Series(self.node_colors, dtype=object))
+        self.categories = [str(category) for category in categories]
+        self.get_positions = get_positions
+        self.render_mode = render_mode
+        self.hover = hover
+        self.edge_bundling = edge_bundling
+        self.n_buckets = n_buckets
+        self.buckets = weight_buckets(edge_index.norm_weight, n_buckets)
+        self._cache = LRUCache(cache_size)
+        self._positions = {}
+
+    def filters(self, weight_range=None, colors=None, direction=None):
+        '''
+        -weight_range: the [low, high] values of the weight slider, relative to the heaviest edge, None for all weights
+        -colors: the checked color categories, None for all of them
+        -direction: a key of DIRECTIONS, None for 'all'
+
+        Returns:
+        -the Filters of the values of the controls, in a canonical form used as key of the memoized results
+        '''
+        low, high = weight_range if weight_range else (0.0, 1.0)
+        checked = set(self.categories if colors is None else colors)
+        return Filters((float(low), float(high)),
+                       tuple(category for category in self.categories if category in checked),
+                       direction if direction in DIRECTIONS else 'all')
+
+    def is_default(self, filters):
+        '''
+        -filters: Filters
+
+        Returns:
+        -True if the filters keep every edge and node, the figure is then the one of the whole graph
+        '''
+        return filters == self.filters()
+
+    def weight_mask(self, weight_range):
+        '''
+        -weight_range: the (low, high) weights relative to the heaviest edge
+
+        Returns:
+        -boolean array, True for the edges with the normalized weight in the range
+        '''
+        low, high = weight_range
+        #the slider steps are rounded, so the edges on the bounds are kept
+        tolerance = WEIGHT_STEP/1000
+        norm_weight = self.edge_index.norm_weight
+        return self._cache.get_or_build(('weight', weight_range), lambda: (norm_weight >= low - tolerance) & (norm_weight <= high + tolerance))
+
+    def color_masks(self, colors):
+        '''
+        -colors: tuple with the checked color categories
+
+        Returns:
+        -boolean array, True for the nodes of the checked categories
+        -boolean array, True for the edges with both ends in the checked categories
+        '''
+        def build():
+            checked = np.isin(np.arange(len(self.categories)), [self.categories.index(color) for color in colors])
+            nodes = checked[self.color_codes]
+            return nodes, nodes[self.edge_index.source_code] & nodes[self.edge_index.target_code]
+        return self._cache.get_or_build(('colors', colors), build)
+
+    def direction_mask(self, direction):
+        '''
+        -direction: a key of DIRECTIONS
+
+        Returns:
+        -boolean array, True for the edges of the direction
+        '''
+        return self._cache.get_or_build(('direction', direction), lambda: np.isin(self.edge_index.is_bidirectional, DIRECTIONS[direction]))
+
+    def selection(self, filters):
+        '''
+        -filters: Filters
+
+        Returns:
+        -the positions of the edges kept by the filters, in the index of the whole graph
+        -the codes of the nodes kept by the filters
+        '''
+        def build():
+            node_mask, edge_mask = self.color_masks(filters.colors)
+            edge_mask = edge_mask & self.weight_mask(filters.weight_range) & self.direction_mask(filters.direction)
+            return np.flatnonzero(edge_mask), np.flatnonzero(node_mask)
+        return self._cache.get_or_build(('selection', filters), build)
+
+    def positions(self, kind):
+        '''
+        -kind: '2d' or '3d'
+
+        Returns:
+        -the positions of the nodes, computed once by get_positions
+        '''
+        if kind not in self._positions:
+            #two requests may both call get_positions, they get the same positions
+            self._positions[kind] = np.asarray(self.get_positions(kind), dtype=float)
+        return self._positions[kind]
+
+    def figure_spec(self, kind, filters):
+        '''
+        -kind: '2d' or '3d'
+        -filters: Filters
+
+        Returns:
+        -the spec of the figure of the edges and nodes kept by the filters, with the number of edges in the title
+        '''
+        rows, nodes = self.selection(filters)
+        shown = self.edge_index.take(rows)
+        pos = self.positions(kind)
+        labels, colors = self.node_labels[nodes], self.node_colors[nodes]
+        bundles = bundle_edges(shown, pos) if self.edge_bundling else None
+        buckets = (self.buckets[0][rows], self.buckets[1])
+        if kind == '2d':
+            render_mode = choose_render_mode(len(shown), self.render_mode)
+            spec = assemble_spec_2d(shown, self.node_labels, pos, node_marker_specs(pos[nodes], labels, colors, render_mode=render_mode),
+                                    render_mode=render_mode, hover=self.hover, bundles=bundles, n_buckets=self.n_buckets,
+                                    buckets=buckets)
+        else:
+            spec = assemble_spec_3d(shown, self.node_labels, pos, node_marker_specs(pos[nodes], labels, colors), hover=self.hover,
+                                    bundles=bundles, n_buckets=self.n_buckets, buckets=buckets)
+        title = spec['layout']['title']['text']
+        spec['layout']['title'] = {'text': '%s: %d of the %d edges' % (title, len(shown), len(self.edge_index))}
+        return with_template(spec)
+
+    def figure_json(self, kind, filters):
+        '''
+        -kind: '2d' or '3d'
+        -filters: Filters
+
+        Returns:
+        -the filtered figure serialized by figures.figure_json, memoized for every combination of the filters
+        '''
+        def build():
+            with span('filter_figure', kind=kind):
+                return figure_json(self.figure_spec(kind, filters))
+        return self._cache.get_or_build(('figure', kind, filters), build)
@@ -8,380 +8,52 @@ networkx for the creation of the network
 plotly for the visualization of the network
 dash for creating the interactive dashboard that is deployed in the heroku cloud application platform.
 
+The app is created by create_app. Nothing is read or computed when the module is imported: 
+the 2-d and 3-d figures are built the first time their tab is selected and are then kept in an LRU cache 
+(one per kind of entry, see CACHE_SIZES) keyed by the content hash of the dataset and the render options.
+When the environment variable NETWORK_ARTIFACT gives the path of an artifact written by artifacts.py, 
+the figures are served from it instead (see the artifacts module).
 '''
-import dash #1.16.0
-import dash_core_components as dcc
-import dash_html_components as html
-from dash.dependencies import Input, Output
-import pandas as pd 
-import numpy as np
-import networkx as nx
-import plotly.graph_objects as go
-from base64 import b64encode
-import io
-
-buffer2d = io.StringIO() 
-buffer3d=io.StringIO()
-
-#### Importing the data ####
-edges = pd.read_excel (r'raan_case_study interns.xlsx', sheet_name='edges')
-nodes=pd.read_excel (r'raan_case_study interns.xlsx', sheet_name='nodes')
-nodes=nodes.drop(columns="Unnamed: 3")
-
-node_ids=list(set(nodes.node_id.values)) # the unique node_ids that are going to be used for creating the graph
-#the number of unique nodes are:29
-node_label=list(set(nodes.node_label.values)) 
-#the number of unique label names are:29
-node_colors=list(set(nodes.node_color.values)) 
-#the number of unique color categories are:6
-
-
-#### Creating the network ####
-Gr_dir=nx.from_pandas_edgelist(edges, 'source_id', 'target_id', edge_attr=True, create_using=nx.DiGraph()) #directed graph 
-
-atribs=nodes.set_index('node_id').to_dict('index') 
-nx.set_node_attributes(Gr_dir, atribs)
-
-### Define the edges that are bidirectional ###
-double_edges=[]
-for edge in Gr_dir.edges: 
-    if Gr_dir.has_edge(edge[1], edge[0]):
-        double_edges.append(edge)
-
-'''
-We observe that not all relations between the nodes are two-way, 
-the network is not symmetric and therefore the direction will play an important role, 
-since it gives information that we don't want to lose in our visualization.
-'''
-
-##### Create the 2-d visualization #####
-#pos=nx.shell_layout(Gr_dir, scale=2)
-pos=nx.circular_layout(Gr_dir, scale=2)
-pos[966]=np.array([0,0])
-
-'''
-Since the node with id 966 has connections with all the nodes apart from one, it is manually added in the center. 
-In that way this information is easily depicted and the plot looks better.
-'''
-
-for node in Gr_dir.nodes:
-        Gr_dir.nodes[node]['pos'] = list(pos[node])
-
-def create_edge_trace(edge, pos, is_bidirectional, showlegend=True):
-    '''
-    -edge: a tuple that contains the beginning and the ending of the edge of the graph 
-    -pos: a dictionary with key the node_id and value the array of 2-d positions of the node
-    -is bidirectional: True if the edge is bidirectional False otherwise 
-    -showlegend: True if we want the trace to be shown in the legend
-    
-    Returns: 
-    -an edge trace to be used in the 2-d plot
-    The opacity and width of the edge are relative to the edge weight
-    The bidirected edges are coloured in red while the one-way relations are blue. 
-    -the color of the edge 
-    '''
-    x0, y0 = Gr_dir.nodes[edge[0]]['pos']
-    x1, y1 = Gr_dir.nodes[edge[1]]['pos']
-    weight = Gr_dir[edge[0]][edge[1]]['weights']
-    opacity= weight/np.max(list(nx.get_edge_attributes(Gr_dir,'weights').values())) #normalize between 0 and 1
-    if is_bidirectional==True: 
-        color='red'
-        legendgroup='red'
-        name='Two-way Edge'
-    else: 
-        color='cornflowerblue'
-        legendgroup='blue'
-        name= 'One-way Edge'
-    return go.Scatter(x=tuple([x0, x1, None]), y=tuple([y0, y1, None]),
-                        mode='lines',
-                        line={'width': 10*weight/np.max(list(nx.get_edge_attributes(Gr_dir,'weights').values())), 'color': color},
-                        line_shape='spline',
-                        legendgroup=legendgroup,
-                        name=name,
-                        hoverinfo=None,
-                        opacity=opacity, showlegend= showlegend), color
-
-
-
-
-edge_trace=[]
-edge_col=[]
-for edge in Gr_dir.edges:
-    if edge in double_edges: 
-        if 'red' in edge_col: #we only want to create one legend signal for each edge
-            trace,_= create_edge_trace(edge, pos, is_bidirectional = True, showlegend=False)
-            edge_trace.append(trace)
-        else: 
-            trace,col= create_edge_trace(edge, pos, is_bidirectional = True, showlegend=True) 
-            edge_col.append(col)
-            edge_trace.append(trace)
-    else:
-        if 'cornflowerblue' in edge_col:
-            trace,_= create_edge_trace(edge, pos, is_bidirectional = False, showlegend=False)
-            edge_trace.append(trace)
-        else:
-            trace,col= create_edge_trace(edge, pos, is_bidirectional = False, showlegend=True) 
-            edge_col.append(col)
-            edge_trace.append(trace)
-
-
-
-def create_node_trace(node, pos, showlegend= True):
-    '''
-    -node: the node id
-    -pos: the position coordinates of the node in the plot
-    -showlegend: True if we want to the trace to take part in the legend False otherwise
-    
-    Returns: 
-    -trace of the node to be used in the figure
-    -color of the node 
-    '''
-    x_node=pos[node][0]
-    y_node=pos[node][1]
-    color=Gr_dir.nodes[node]['node_color']
-    label=Gr_dir.nodes[node]['node_label']
-    return go.Scatter(x=[x_node,None],
-                      y=[y_node,None],
-                      mode='markers',
-                      marker=dict(symbol='circle',size=20,color=color),#color the nodes according to their community
-                      legendgroup=str(color),
-                      name=str(color),
-                      showlegend= showlegend,
-                      text=label, #label according to the node label
-                      hoverinfo='text'), color
-
-
-
-node_trace=[]
-colors_used=[]
-for node in Gr_dir.nodes:
-    if Gr_dir.nodes[node]['node_color'] in colors_used: #if already used before don't show it in the legend, just group it with it
-        trace,_ = create_node_trace(node, pos, False)
-        node_trace.append(trace)
-    else: 
-        trace, color = create_node_trace(node, pos, True)
-        node_trace.append(trace)
-        colors_used.append(color)
-
-### Create the middle nodes for adding the edge annotations ### 
-'''
-Since plotly doesn't allow for text annotation in the edges, 
-create nodes that are invisible in the middle of the edges where we can find the text providing information about the edges.
-'''
-middle_trace = go.Scatter(x=[], y=[], hovertext=[], mode='markers', hoverinfo="text",
-                                    marker={'size': 20, 'color': 'LightSkyBlue'},
-                                    opacity=0, showlegend= False)
-
-
-for edge in Gr_dir.edges:
-    x0, y0 = Gr_dir.nodes[edge[0]]['pos']
-    x1, y1 = Gr_dir.nodes[edge[1]]['pos']
-    if edge in double_edges:
-        edge_text = "Bidirectional edge:" + "<br>" + str(Gr_dir.nodes[edge[0]]['node_label']) + " To: " + str(Gr_dir.nodes[edge[1]]['node_label'])  + ", weight: " + str(Gr_dir.edges[edge]['weights'])+"<br>" + str(Gr_dir.nodes[edge[1]]['node_label']) + " To: " + str(Gr_dir.nodes[edge[0]]['node_label'])  + ", weight: " + str(Gr_dir.edges[(edge[1], edge[0])]['weights'])
-    else:
-        edge_text="From: " + str(Gr_dir.nodes[edge[0]]['node_label']) + " To: " + str(Gr_dir.nodes[edge[1]]['node_label']) + ", weight: " + str(Gr_dir.edges[edge]['weights'])
-    hovertext= edge_text
-    middle_trace['x'] += tuple([(x0 + x1) / 2])
-    middle_trace['y'] += tuple([(y0 + y1) / 2])
-    middle_trace['hovertext'] += tuple([hovertext])
-   
-#the layout of the plot 
-layout=go.Layout(title='Network 2-d visualization', showlegend=True, hovermode='closest',
-                            margin={'b': 60, 'l': 60, 'r': 60, 't': 60},
-                            xaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
-                            yaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
-                            height=600,
-                            clickmode='event+select',
-                            annotations=[
-                                dict(
-                                    ax=(Gr_dir.nodes[edge[0]]['pos'][0] + Gr_dir.nodes[edge[1]]['pos'][0]) / 2,
-                                    ay=(Gr_dir.nodes[edge[0]]['pos'][1] + Gr_dir.nodes[edge[1]]['pos'][1]) / 2, axref='x', ayref='y',
-                                    x=(Gr_dir.nodes[edge[1]]['pos'][0] * 3 + Gr_dir.nodes[edge[0]]['pos'][0]) / 4,
-                                    y=(Gr_dir.nodes[edge[1]]['pos'][1] * 3 + Gr_dir.nodes[edge[0]]['pos'][1]) / 4, xref='x', yref='y',
-                                    showarrow=True,
-                                    arrowhead=3,
-                                    arrowsize=4,
-                                    arrowwidth=1,
-                                    arrowcolor='red' if edge in double_edges else 'cornflowerblue',
-                                    opacity=0.7
-                                ) for edge in Gr_dir.edges]
-                            )
-
-
-fig_2d = go.Figure(layout=layout)
-
-for trace in edge_trace:
-    fig_2d.add_trace(trace)
-
-for trace in node_trace:
-    fig_2d.add_trace(trace)
-
-fig_2d.add_trace(middle_trace)
-fig_2d.update_layout(legend_itemclick=False)
-fig_2d.update_layout(legend_itemdoubleclick=False)
-fig_2d.write_html(buffer2d)
-
-###Start with the 3-d visualization###
-pos3d = nx.kamada_kawai_layout(Gr_dir,dim=3, weight= 'weights')
-
-for node in Gr_dir.nodes:
-        Gr_dir.nodes[node]['pos3d'] = list(pos3d[node])
-
-def create_edge_trace3d(edge, pos, is_bidirectional, showlegend=True):
-    '''
-    -edge: a tuple that contains the beginning and the ending of the edge of the graph 
-    -pos: a dictionary with key the node_id and value the array of 3-d positions of the node
-    -is bidirectional: True if the edge is bidirectional False otherwise 
-    -showlegend: True if we want the trace to be shown in the legend
-    
-    Returns: 
-    -an edge trace to be used in the 3-d plot
-    The opacity and width of the edge are relative to the edge weight
-    The bidirected edges are coloured in red while the one-way relations are blue. 
-    -the color of the edge 
-    '''
-    x0, y0, z0 = Gr_dir.nodes[edge[0]]['pos3d']
-    x1, y1, z1 = Gr_dir.nodes[edge[1]]['pos3d']
-    weight = Gr_dir[edge[0]][edge[1]]['weights']
-    opacity= weight/np.max(list(nx.get_edge_attributes(Gr_dir,'weights').values())) #normalize between 0 and 1
-    if is_bidirectional==True: 
-        color='red'
-        legendgroup='red'
-        name='Two-way Edge'
-    else: 
-        color='cornflowerblue'
-        legendgroup='blue'
-        name= 'One-way Edge'
-    return go.Scatter3d(x=tuple([x0, x1, None]), y=tuple([y0, y1, None]), z=tuple([z0,z1,None]),
-                        mode='lines',
-                        line={'width': 10*weight/np.max(list(nx.get_edge_attributes(Gr_dir,'weights').values())), 'color': color},
-                        legendgroup=legendgroup,
-                        name=name,
-                        hoverinfo=None,
-                        opacity=opacity, showlegend= showlegend), color
-
-
-edge_trace3d=[]
-edge_col=[]
-for edge in Gr_dir.edges:
-    if edge in double_edges: 
-        if 'red' in edge_col:
-            trace,_= create_edge_trace3d(edge, pos3d, is_bidirectional = True, showlegend=False)
-            edge_trace3d.append(trace)
-        else: 
-            trace,col= create_edge_trace3d(edge, pos3d, is_bidirectional = True, showlegend=True) 
-            edge_col.append(col)
-            edge_trace3d.append(trace)
-    else:
-        if 'cornflowerblue' in edge_col:
-            trace,_= create_edge_trace3d(edge, pos3d, is_bidirectional = False, showlegend=False)
-            edge_trace3d.append(trace)
-        else:
-            trace,col= create_edge_trace3d(edge, pos, is_bidirectional = False, showlegend=True) 
-            edge_col.append(col)
-            edge_trace3d.append(trace)
-
-
-def create_node_trace3d(node, pos, showlegend= True):
-    '''
-    -node: the node id
-    -pos: the position coordinates of the node in the plot
-    -showlegend: True if we want to the trace to take part in the legend False otherwise
-    
-    Returns: 
-    -trace of the node to be used in the figure
-    -color of the node 
-    '''
-    x_node=pos[node][0]
-    y_node=pos[node][1]
-    z_node=pos[node][2]
-    color=Gr_dir.nodes[node]['node_color']
-    label=Gr_dir.nodes[node]['node_label']
-    return go.Scatter3d(x=[x_node,None],
-                      y=[y_node,None],
-                      z=[z_node,None],
-                      mode='markers',
-                      marker=dict(symbol='circle',size=20,color=color),#color the nodes according to their community
-                      legendgroup=str(color),
-                      name=str(color),
-                      showlegend= showlegend,
-                      text=label, #label according to the node label
-                      hoverinfo='text'), color
-
-
-node_trace3d=[]
-colors_used=[]
-for node in Gr_dir.nodes:
-    if Gr_dir.nodes[node]['node_color'] in colors_used: #if already used before don't show it in the legend, just group it with it
-        trace,_ = create_node_trace3d(node, pos3d, False)
-        node_trace3d.append(trace)
-    else: 
-        trace, color = create_node_trace3d(node, pos3d, True)
-        node_trace3d.append(trace)
-        colors_used.append(color)
-
-middle_trace3d = go.Scatter3d(x=[], y=[],z=[], hovertext=[], mode='markers', hoverinfo="text",
-                                    marker={'size': 20, 'color': 'LightSkyBlue'},
-                                    opacity=0, showlegend= False)
-
-
-for edge in Gr_dir.edges:
-    x0, y0,z0 = Gr_dir.nodes[edge[0]]['pos3d']
-    x1, y1,z1 = Gr_dir.nodes[edge[1]]['pos3d']
-    
-    if edge in double_edges:
-        edge_text = "Bidirectional edge:" + "<br>" + str(Gr_dir.nodes[edge[0]]['node_label']) + " To: " + str(Gr_dir.nodes[edge[1]]['node_label'])  + ", weight: " + str(Gr_dir.edges[edge]['weights'])+"<br>" + str(Gr_dir.nodes[edge[1]]['node_label']) + " To: " + str(Gr_dir.nodes[edge[0]]['node_label'])  + ", weight: " + str(Gr_dir.edges[(edge[1], edge[0])]['weights'])
-    else:
-        edge_text="From: " + str(Gr_dir.nodes[edge[0]]['node_label']) + " To: " + str(Gr_dir.nodes[edge[1]]['node_label']) + ", weight: " + str(Gr_dir.edges[edge]['weights'])
-    hovertext= edge_text
-    middle_trace3d['x'] += tuple([(x0 + x1) / 2])
-    middle_trace3d['y'] += tuple([(y0 + y1) / 2])
-    middle_trace3d['z'] += tuple([(z0 + z1) / 2])
-    middle_trace3d['hovertext'] += tuple([hovertext])
-
-axis = dict(showbackground=False,
-            showline=False,
-            zeroline=False,
-            showgrid=False,
-            showticklabels=False,
-            title='')
-#the layout of the plot: 
-layout3d = go.Layout(title="The network 3-d visualization",
-                margin={'b': 60, 'l': 60, 'r': 60, 't': 60},
-                #width=1000,
-                height=600,
-                #clickmode='event+select',
-                showlegend=True,
-                scene=dict(xaxis=dict(axis),
-                yaxis=dict(axis),
-                zaxis=dict(axis)),
-                #margin=dict(t=100),
-                hovermode='closest')
-
-fig3d = go.Figure(layout=layout3d)
-
-for trace in edge_trace3d:
-    fig3d.add_trace(trace)
-
-for trace in node_trace3d:
-    fig3d.add_trace(trace)
-    
-fig3d.add_trace(middle_trace3d)
-fig3d.update_layout(legend_itemclick=False)
-fig3d.update_layout(legend_itemdoubleclick=False)
-
-fig3d.write_html(buffer3d)
-
+import logging
+import os
+import threading
+import uuid
 
-
-
-
-##used for creating the different buttons for downloading the plots 
-html_bytes2d = buffer2d.getvalue().encode()
-encoded2d = b64encode(html_bytes2d).decode()
-
-html_bytes3d = buffer3d.getvalue().encode()
-encoded3d = b64encode(html_bytes3d).decode()
+import dash #2.18.2
+from dash import dcc, html
+import numpy as np
+import pandas as pd
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import g
+
+from aggregation import create_aggregated_figure, node_colors
+from analytics import TOP_NODES, GraphAnalytics, highlight_traces, node_codes
+from artifacts import artifact_options, open_artifact
+from cache import LRUCache
+from downloads import PLOTLYJS_VARIANTS, register_download_routes
+from filters import WEIGHT_STEP, FilteredNetwork
+from figures import (HOVER_MODE, RENDER_MODE, WEIGHT_BUCKETS, append_traces, build_figure, edge_details, figure_html, figure_json, format_weight,
+                     hovered_edge)
+from layouts import LAYOUT_CACHE_DIR, compute_layout
+from live_updates import LIVE_INTERVAL_MS, ChangeFeed, LiveNetwork
+from metrics import PROFILE_DIR, register_metrics_routes, timed
+from network_data import DATASET_PATH, dataset_hash, load_network
+from viewport import build_viewport, create_viewport_figure, visible_range
+
+#the number of entries kept in memory by each cache of the app. Every kind of entry has its own LRU cache, so the
+#figures and the exports never evict the network or the state of the other tabs
+CACHE_SIZES = {'network': 2, # the networks of the last versions of the dataset
+               'layout': 4, # the 2d and 3d positions of the nodes, shared by the figures, the filters, the viewport and live modes
+               'figure': 8, # the serialized 2d and 3d figures, per dataset version and render options
+               'export': 4, # the html exports, 2d and 3d with plotly.js embedded or from the CDN
+               'download': 16, # the brotli/gzip/identity bodies of every export
+               'filtered': 2, # the FilteredNetwork of the dataset, with its memoized masks and filtered figures
+               'viewport': 2, # the grid indexes of the viewport culling
+               'colors': 4, # the node colors and the category of every node
+               'aggregate': 16, # the aggregated figures, per set of expanded categories
+               'analytics': 2} # the GraphAnalytics of the dataset
+MAX_NODE_OPTIONS = 50 # number of nodes found by a search in the node dropdowns
 
 markdown_text = '''
 **Export the plot in HTML format**
@@ -408,8 +80,8 @@ correspond to different hypothetical categories)
 For the shake of better visualization of the relation types different color is used for edges that present one-way or two-way relations. 
 
 - It is worth observing that all edges apart from one have as source or target node the node with id 966 (Antony). This led in the choice of 
-circular layout when creating the 2D- plot. In that way all these nodes are equidistant from the central node (manually chosen to be node 966), 
-and therefore distances do not present useful information in this plot. 
+circular layout when creating the 2D- plot. In that way all these nodes are equidistant from the central node (the node with the most 
+connections, node 966), and therefore distances do not present useful information in this plot. 
 
 - Different edges have different width and opacity in their presentation in the plot. These parameters are relative to the weights of the edges.
 
@@ -432,16 +104,84 @@ relations between the nodes and the different types of the edges. What is nice o
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
-
 colors = {
     'background': '#FBFCFC',
     'text': '#641E16'
 }
 
-app.layout = html.Div([
-    dcc.Tabs([
-        dcc.Tab(label='Introduction', children=[
+
+def download_links(app, kind, filename):
+    '''
+    -app: the dash app
+    -kind: '2d' or '3d'
+    -filename: the name of the downloaded file
+    
+    Returns: 
+    -the buttons for downloading the html export of the figure, with the embedded plotly.js or with plotly.js loaded from the CDN
+    '''
+    return html.Div([
+        html.A(html.Button("Download HTML"),
+               id="download_html" if kind == '2d' else "download_html3d",
+               href=app.get_relative_path('/download/%s.html' % kind),
+               download=filename),
+        html.A(html.Button("Download HTML (plotly.js from CDN)"),
+               href=app.get_relative_path('/download/%s.html?plotlyjs=cdn' % kind),
+               download=filename.replace('.html', '_cdn.html'))])
+
+
+def graph_with_details(kind):
+    '''
+    -kind: '2d' or '3d'
+    
+    Returns: 
+    -the graph of the figure and, next to it, the panel where the details of the hovered or clicked edge are shown
+    '''
+    return html.Div([
+        dcc.Graph(id='graph-' + kind, style={'flex': '1'}),
+        html.Div(id='edge-details-' + kind,
+                 style={'width': '25%', 'paddingLeft': '20px', 'color': colors['text']})],
+        style={'display': 'flex'})
+
+
+def filter_controls(kind):
+    '''
+    -kind: '2d' or '3d'
+    
+    Returns: 
+    -the controls filtering the figure: the range of the edge weights, the checklist of the node colors 
+    (filled when the tab is first selected) and the direction of the edges
+    '''
+    label_style = {'color': colors['text'], 'fontWeight': 'bold'}
+    return html.Div([
+        html.Div([html.Label('Edge weight, relative to the heaviest edge', style=label_style),
+                  dcc.RangeSlider(id='filter-weight-' + kind, min=0, max=1, step=WEIGHT_STEP, value=[0, 1],
+                                  marks={0: '0', 0.25: '0.25', 0.5: '0.5', 0.75: '0.75', 1: '1'})],
+                 style={'flex': '2', 'paddingRight': '20px'}),
+        html.Div([html.Label('Node colors', style=label_style),
+                  dcc.Checklist(id='filter-colors-' + kind, options=[], inputStyle={'marginRight': '5px'},
+                                labelStyle={'display': 'inline-block', 'marginRight': '10px'})],
+                 style={'flex': '2', 'paddingRight': '20px'}),
+        html.Div([html.Label('Edges', style=label_style),
+                  dcc.RadioItems(id='filter-direction-' + kind, value='all',
+                                 options=[{'label': 'All', 'value': 'all'}, {'label': 'Two-way', 'value': 'two-way'},
+                                          {'label': 'One-way', 'value': 'one-way'}],
+                                 labelStyle={'display': 'inline-block', 'marginRight': '10px'})],
+                 style={'flex': '1'})],
+        style={'display': 'flex', 'padding': '10px 0'})
+
+
+def create_layout(app, live_interval=None, filters_2d=True):
+    '''
+    -app: the dash app
+    -live_interval: the interval in milliseconds of the polling for live updates of the 2D graph, None without live updates
+    -filters_2d: False to leave out the filters of the 2D graph, which are not available with the live updates and the viewport culling
+    
+    Returns: 
+    -the layout of the app. The graphs are empty, their figures are filled in by the callbacks when the tab is selected
+    '''
+    return html.Div([
+    dcc.Tabs(id='tabs', value='tab-intro', children=[
+        dcc.Tab(label='Introduction', value='tab-intro', children=[
         html.H1(children='RAAN Internship Program Case Study',
                  style={'textAlign': 'center',
                         'color': colors['text']}),
@@ -454,7 +194,7 @@ app.layout = html.Div([
         dcc.Markdown(children=markdown_description)]),
 
 
-        dcc.Tab(label='2D plot', children=[
+        dcc.Tab(label='2D plot', value='tab-2d', children=[
         html.H1(children='2D visualization of the Network',
                  style={'textAlign': 'center',
                         'color': colors['text']}),
@@ -467,17 +207,15 @@ app.layout = html.Div([
         html.P(children='Edges can be bidirected or not',
                style={'textAlign': 'left',
                       'color': colors['text']} ),
-        dcc.Graph(
-            figure=fig_2d), 
+        filter_controls('2d') if filters_2d else html.Div(),
+        graph_with_details('2d'), 
+        dcc.Interval(id='live-interval', interval=live_interval or LIVE_INTERVAL_MS, disabled=live_interval is None),
+        dcc.Store(id='live-version'),
        # download the html file of the plot
         dcc.Markdown(children=markdown_text),
-        html.A(
-        html.Button("Download HTML"), 
-        id="download_html",
-        href="data:text/html;base64," + encoded2d,
-        download="2dvisualization.html")] ),
+        download_links(app, '2d', "2dvisualization.html")] ),
 
-        dcc.Tab(label='3D-plot', children=[
+        dcc.Tab(label='3D-plot', value='tab-3d', children=[
         html.H1(children='3D visualization of the network',
                  style={'textAlign': 'center',
                         'color': colors['text']}),
@@ -492,23 +230,395 @@ app.layout = html.Div([
                       'color': colors['text']} ),
             
             
-        dcc.Graph(figure=fig3d),
+        filter_controls('3d'),
+        graph_with_details('3d'),
         
         #download the html file of the plot
         dcc.Markdown(children=markdown_text),
-        html.A(
-        html.Button("Download HTML"), 
-        id="download_html3d",
-        href="data:text/html;base64," + encoded3d,
-        download="3dvisualization.html")])
+        download_links(app, '3d', "3dvisualization.html")]),
+
+        dcc.Tab(label='Aggregated view', value='tab-aggregate', children=[
+        html.H1(children='Aggregated view of the network',
+                 style={'textAlign': 'center',
+                        'color': colors['text']}),
+        html.Div(children='Every color category is collapsed into one node, and the edges between two categories into one edge with the summed weight. ', style={
+                 'textAlign': 'left',
+                'color': colors['text']}),
+        html.P(children='Click on a category to show its nodes, click on one of its nodes to collapse it again',style={
+            'textAlign': 'left',
+            'color': colors['text']} ),
+        dcc.Store(id='expanded-categories', data=[]),
+        dcc.Graph(id='graph-aggregate')]),
+
+        dcc.Tab(label='Analytics', value='tab-analytics', children=[
+        html.H1(children='Analytics of the network',
+                 style={'textAlign': 'center',
+                        'color': colors['text']}),
+        html.Div(id='analytics-summary', style={'textAlign': 'left', 'color': colors['text']}),
+        html.H3(children='Nodes with the highest PageRank', style={'color': colors['text']}),
+        html.Div(id='analytics-top'),
+        html.H3(children='Shortest path', style={'color': colors['text']}),
+        html.P(children='Type a part of the label of a node to find it. The two nodes and the path are highlighted in the 2D and 3D plots.',
+               style={'textAlign': 'left', 'color': colors['text']}),
+        html.Div([
+            dcc.Dropdown(id='path-source', placeholder='From node', style={'flex': '1', 'marginRight': '10px'}),
+            dcc.Dropdown(id='path-target', placeholder='To node', style={'flex': '1', 'marginRight': '10px'}),
+            dcc.RadioItems(id='path-weighted', value='hops',
+                           options=[{'label': 'Fewest edges', 'value': 'hops'}, {'label': 'Lowest total weight', 'value': 'weight'}],
+                           labelStyle={'display': 'inline-block', 'marginRight': '10px'}, style={'flex': '1'})],
+            style={'display': 'flex'}),
+        html.Div(id='path-result', style={'paddingTop': '10px', 'color': colors['text']})])
         
         
-         ])
+         ]),
+    dcc.Store(id='selected-nodes', data={'nodes': [], 'path': []})
 ])
 
 
-if __name__ == '__main__':
-    app.run_server(debug=True)
+def analytics_table(analytics, node_labels, node_colors, nodes):
+    '''
+    -analytics: the GraphAnalytics of the network
+    -node_labels, node_colors: arrays with the labels and colors of the nodes, in the order of the index nodes
+    -nodes: the codes of the nodes to show
+    
+    Returns: 
+    -the table with the degrees, the weighted degrees, the PageRank and the strongly connected component of the nodes
+    '''
+    header = ['Node', 'Color', 'In', 'Out', 'Weighted in', 'Weighted out', 'PageRank', 'Component size']
+    cell = {'padding': '2px 10px', 'textAlign': 'right'}
+    rows = [html.Tr([html.Td(str(node_labels[node]), style=dict(cell, textAlign='left')),
+                     html.Td(str(node_colors[node]), style=dict(cell, textAlign='left'))] +
+                    [html.Td(text, style=cell) for text in (
+                        str(analytics.in_degree[node]), str(analytics.out_degree[node]),
+                        format_weight(analytics.in_weight[node]), format_weight(analytics.out_weight[node]),
+                        '%.4f' % analytics.pagerank[node], str(analytics.component_size[node]))]) for node in nodes]
+    return html.Table([html.Tr([html.Th(name, style=cell) for name in header])] + rows, style={'color': colors['text']})
+
+
+def create_app(dataset_path=DATASET_PATH, render_mode=RENDER_MODE, cache_sizes=None, layout_cache_dir=LAYOUT_CACHE_DIR,
+               layout_2d='auto', layout_3d='auto', hover_mode=HOVER_MODE, viewport_culling=False, profiling=False,
+               profile_dir=PROFILE_DIR, live_source=None, live_interval=LIVE_INTERVAL_MS, artifact_path=None, edge_bundling=False,
+               weight_buckets=WEIGHT_BUCKETS):
+    '''
+    -dataset_path: the path of the dataset
+    -render_mode: 'svg', 'webgl' or 'auto', the render mode of the 2-d figure
+    -cache_sizes: a dictionary with the number of entries kept by some of the caches of the app, the others keep CACHE_SIZES
+    -layout_cache_dir: the folder where the computed layouts are stored between restarts, None to disable it
+    -layout_2d, layout_3d: the layouts of the 2-d and 3-d figures, see LAYOUTS_2D and LAYOUTS_3D in the layouts module
+    -hover_mode: 'callback' to show the details of the edges in a side panel, looked up on the server when an edge 
+    is hovered or clicked, or 'embedded' to put the hover text of every edge in the figure
+    -viewport_culling: True to send to the 2D graph only the edges and nodes inside its visible range, 
+    updated on every zoom and pan, with an overview of the heaviest edges when zoomed out (see the viewport module)
+    -profiling: True to allow the cProfile/tracemalloc profiling of single requests (see the metrics module)
+    -profile_dir: the folder where the profiles are written
+    -live_source: a .jsonl or .csv file with changes of the edges and nodes (see the live_updates module). The 2D graph 
+    polls it every live_interval milliseconds and receives only the traces that changed
+    -live_interval: the polling interval of the live updates, in milliseconds
+    -artifact_path: the path of an artifact written by artifacts.py with the same render and layout options, or None.
+    The 2D and 3D figures, the html exports and the details of the edges are then read from the memory-mapped artifact,
+    shared by all the worker processes, as long as the dataset has not changed since the artifact was built
+    -edge_bundling: True to draw the edges of the 2D and 3D figures bundled along nested grids (see the bundling module), 
+    which merges the edges converging on the same region into shared segments. The bundles are cached with the layouts. 
+    The live and viewport modes of the 2D graph keep the straight edges
+    -weight_buckets: the maximum number of line widths and opacities of the edges (see figures.weight_buckets). With more 
+    distinct weights, the edges of a bucket are drawn with its mean weight
+    
+    Returns: 
+    -the dash app. The dataset is read and the figures are built only when the 2D or 3D tab is first selected. 
+    The network, the figures and the html exports are cached by the content hash of the dataset and the render 
+    options, so repeated visits are served from memory and a changed dataset is picked up on the next visit.
+    The html exports are generated on demand by the /download route of the server.
+    The timings of the stages, callbacks and requests are served in the Prometheus format by the /metrics route.
+    '''
+    if live_source is not None and viewport_culling:
+        raise ValueError('the live updates and the viewport culling of the 2D graph can not be combined')
+    app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+    filters_2d = live_source is None and not viewport_culling
+    app.layout = create_layout(app, live_interval if live_source is not None else None, filters_2d)
+    caches = {name: LRUCache(size) for name, size in dict(CACHE_SIZES, **(cache_sizes or {})).items()}
+    artifact = None
+    if artifact_path is not None:
+        artifact = open_artifact(artifact_path, dataset_path, artifact_options(render_mode, layout_2d, layout_3d, hover_mode, edge_bundling, weight_buckets))
+
+    def get_artifact():
+        #a changed dataset is built as without the artifact, the deployments without the dataset use the artifact
+        if artifact is not None and (not os.path.exists(dataset_path) or dataset_hash(dataset_path) == artifact.dataset_hash):
+            return artifact
+        return None
+
+    def get_network():
+        digest = dataset_hash(dataset_path)
+        return digest, caches['network'].get_or_build((digest, 'network'), lambda: load_network(dataset_path))
+
+    layouts = {'2d': layout_2d, '3d': layout_3d}
+
+    def get_layout(kind):
+        digest, network = get_network()
+        return caches['layout'].get_or_build((digest, kind, layouts[kind]), lambda: compute_layout(
+            network.graph, int(kind[0]), layouts[kind], layout_cache_dir, dataset_path))
+
+    def get_figure_json(kind, hover=hover_mode):
+        if hover == hover_mode and get_artifact() is not None:
+            return artifact.blob('figure_' + kind)
+        digest, network = get_network()
+        return caches['figure'].get_or_build((digest, kind, render_mode, layouts[kind], hover, edge_bundling, weight_buckets), lambda: figure_json(
+            build_figure(network, kind, render_mode, layout_cache_dir, layouts[kind], hover, edge_bundling, weight_buckets, get_layout(kind),
+                         dataset_path)))
+
+    def get_export(kind, variant):
+        if get_artifact() is not None:
+            return (artifact.dataset_hash, kind, 'artifact', variant), lambda: artifact.export(kind, variant)
+        digest = dataset_hash(dataset_path)
+        key = (digest, kind, render_mode, layouts[kind], edge_bundling, weight_buckets, variant)
+        #the exported files have no server behind them, so the hover text is embedded
+        return key, lambda: caches['export'].get_or_build(key, lambda: figure_html(get_figure_json(kind, 'embedded'),
+                                                                                 include_plotlyjs=PLOTLYJS_VARIANTS[variant]))
+
+    register_download_routes(app.server, get_export, caches['download'])
+
+    def get_filtered():
+        if get_artifact() is not None:
+            return caches['filtered'].get_or_build((artifact.dataset_hash, 'filtered', 'artifact'), lambda: FilteredNetwork(
+                artifact.edge_index(), artifact.node_labels(), artifact.array('node_colors'), artifact.positions,
+                render_mode, hover_mode, edge_bundling=edge_bundling, n_buckets=weight_buckets))
+        digest, network = get_network()
+        def get_positions(kind):
+            return network.edge_index.positions(get_layout(kind))
+        return caches['filtered'].get_or_build((digest, 'filtered'), lambda: FilteredNetwork(
+            network.edge_index, network.node_labels, get_colors()[0], get_positions, render_mode, hover_mode, edge_bundling=edge_bundling,
+            n_buckets=weight_buckets))
+
+    def get_filtered_json(kind, weight_range=None, selected_colors=None, direction=None):
+        if (not weight_range or list(weight_range) == [0, 1]) and selected_colors is None and direction in (None, 'all'):
+            return get_figure_json(kind) #the controls before the colors are filled in
+        filtered = get_filtered()
+        filters = filtered.filters(weight_range, selected_colors, direction)
+        if filtered.is_default(filters):
+            return get_figure_json(kind)
+        return filtered.figure_json(kind, filters)
+
+    def get_shown_json(kind, weight_range=None, selected_colors=None, direction=None, selected=None):
+        figure = get_filtered_json(kind, weight_range, selected_colors, direction)
+        selected = selected or {}
+        if not selected.get('nodes') and not selected.get('path'):
+            return figure
+        filtered = get_filtered()
+        return append_traces(figure, highlight_traces(kind, filtered.positions(kind), filtered.node_labels,
+                                                      selected.get('nodes', []), selected.get('path', [])))
+
+    register_metrics_routes(app.server, profiling, profile_dir)
+
+    def cached_figure(figure):
+        #the callbacks of the 2D and 3D tabs return a placeholder, replaced by the cached JSON of the figure in the
+        #response, so the figure is not parsed and serialized again by dash
+        token = 'cached-figure-' + uuid.uuid4().hex
+        g.setdefault('cached_figures', {})[token] = figure
+        return token
+
+    #registered after the metrics hooks, so it runs before the request timer stops (the after_request hooks run in reverse)
+    @app.server.after_request
+    def insert_cached_figures(response):
+        figures = g.pop('cached_figures', None)
+        if figures:
+            data = response.get_data()
+            for token, figure in figures.items():
+                data = data.replace(b'"' + token.encode() + b'"', bytes(figure), 1)
+            response.set_data(data)
+        return response
+
+    def get_viewport():
+        digest, network = get_network()
+        return network, caches['viewport'].get_or_build((digest, 'viewport', layout_2d), lambda: build_viewport(
+            network, get_layout('2d')))
+
+    live = {}
+    live_lock = threading.Lock()
+
+    def get_live():
+        with live_lock:
+            if 'network' not in live:
+                _, network = get_network()
+                live['network'] = LiveNetwork(network, get_layout('2d'), ChangeFeed(live_source), hover_mode, weight_buckets, render_mode)
+            return live['network']
+
+    if live_source is not None:
+        @app.callback([Output('graph-2d', 'figure'), Output('live-version', 'data')],
+                      [Input('tabs', 'value'), Input('live-interval', 'n_intervals')], [State('live-version', 'data')])
+        @timed('show_2d', 'callback')
+        def show_2d(tab, n_intervals, version):
+            if tab != 'tab-2d':
+                raise PreventUpdate
+            live_network = get_live()
+            live_network.poll()
+            if 'tabs.value' in [trigger['prop_id'] for trigger in dash.callback_context.triggered]:
+                return live_network.figure(), live_network.version
+            if version == live_network.version:
+                raise PreventUpdate
+            return live_network.update(version)
+    elif viewport_culling:
+        @app.callback(Output('graph-2d', 'figure'), [Input('tabs', 'value'), Input('graph-2d', 'relayoutData')])
+        @timed('show_2d', 'callback')
+        def show_2d(tab, relayout_data):
+            triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+            if tab != 'tab-2d' or ('graph-2d.relayoutData' in triggered and not any(
+                    key.startswith(('xaxis.', 'yaxis.')) for key in relayout_data or {})):
+                raise PreventUpdate
+            network, viewport = get_viewport()
+            #the last relayoutData is also used when coming back to the tab, uirevision has kept the zoom
+            return cached_figure(figure_json(create_viewport_figure(network, viewport, visible_range(relayout_data, viewport.bounds),
+                                                                    render_mode, hover_mode, n_buckets=weight_buckets)))
+    else:
+        @app.callback(Output('graph-2d', 'figure'), [Input('tabs', 'value'), Input('filter-weight-2d', 'value'),
+                                                     Input('filter-colors-2d', 'value'), Input('filter-direction-2d', 'value'),
+                                                     Input('selected-nodes', 'data')])
+        @timed('show_2d', 'callback')
+        def show_2d(tab, weight_range, selected_colors, direction, selected):
+            if tab != 'tab-2d':
+                raise PreventUpdate
+            return cached_figure(get_shown_json('2d', weight_range, selected_colors, direction, selected))
+
+    @app.callback(Output('graph-3d', 'figure'), [Input('tabs', 'value'), Input('filter-weight-3d', 'value'),
+                                                 Input('filter-colors-3d', 'value'), Input('filter-direction-3d', 'value'),
+                                                 Input('selected-nodes', 'data')])
+    @timed('show_3d', 'callback')
+    def show_3d(tab, weight_range, selected_colors, direction, selected):
+        if tab != 'tab-3d':
+            raise PreventUpdate
+        return cached_figure(get_shown_json('3d', weight_range, selected_colors, direction, selected))
+
+    def color_filter_callback(kind):
+        def fill_color_filter(tab, options):
+            if tab != 'tab-' + kind or options:
+                raise PreventUpdate
+            categories = get_filtered().categories
+            return [{'label': category, 'value': category} for category in categories], categories
+        return timed('fill_color_filter_' + kind, 'callback')(fill_color_filter)
+
+    for kind in ('2d', '3d') if filters_2d else ('3d',):
+        app.callback([Output('filter-colors-' + kind, 'options'), Output('filter-colors-' + kind, 'value')],
+                     [Input('tabs', 'value')], [State('filter-colors-' + kind, 'options')])(color_filter_callback(kind))
+
+    def edge_details_callback(kind):
+        def show_edge_details(hover_data, click_data):
+            for data in (hover_data, click_data):
+                point = ((data or {}).get('points') or [{}])[0]
+                if 'customdata' not in point: #only the middle nodes of the edges carry customdata
+                    continue
+                if kind == '2d' and live_source is not None: #the ids of the live figure are rows of the live index
+                    live_network = get_live()
+                    with live_network.lock:
+                        i = hovered_edge(point, live_network.edge_index, live_network.coords)
+                        lines = None if i is None else edge_details(live_network.edge_index, live_network.node_labels, i)
+                else:
+                    #the same index, labels and layout arrays as the figures, from the artifact or the dataset
+                    filtered = get_filtered()
+                    i = hovered_edge(point, filtered.edge_index, filtered.positions(kind))
+                    lines = None if i is None else edge_details(filtered.edge_index, filtered.node_labels, i)
+                if lines is not None:
+                    return [html.P(line) for line in lines]
+            raise PreventUpdate
+        return timed('show_edge_details_' + kind, 'callback')(show_edge_details)
+
+    for kind in ('2d', '3d'):
+        app.callback(Output('edge-details-' + kind, 'children'),
+                     [Input('graph-' + kind, 'hoverData'), Input('graph-' + kind, 'clickData')])(edge_details_callback(kind))
+
+    def get_colors():
+        digest, network = get_network()
+        return caches['colors'].get_or_build((digest, 'colors'), lambda: node_colors(network))
+
+    @app.callback(Output('expanded-categories', 'data'), [Input('graph-aggregate', 'clickData')], [State('expanded-categories', 'data')])
+    @timed('toggle_category', 'callback')
+    def toggle_category(click_data, expanded):
+        node = ((click_data or {}).get('points') or [{}])[0].get('customdata')
+        if not isinstance(node, str): #only the nodes carry their id, the middle nodes of the edges carry a number
+            raise PreventUpdate
+        if node.startswith('color:'):
+            category = node[len('color:'):]
+        else:
+            digest, network = get_network()
+            categories = caches['colors'].get_or_build((digest, 'category-of-node'), lambda: dict(
+                zip(('node:' + str(node_id) for node_id in network.edge_index.node_ids), get_colors()[0])))
+            category = categories[node]
+        return sorted(set(expanded or []) ^ {category})
+
+    @app.callback(Output('graph-aggregate', 'figure'), [Input('tabs', 'value'), Input('expanded-categories', 'data')])
+    @timed('show_aggregate', 'callback')
+    def show_aggregate(tab, expanded):
+        if tab != 'tab-aggregate':
+            raise PreventUpdate
+        digest, network = get_network()
+        expanded = frozenset(expanded or [])
+        return caches['aggregate'].get_or_build((digest, 'aggregate', expanded, render_mode),
+                                  lambda: create_aggregated_figure(network, expanded, get_colors(), render_mode))
+
+    def get_analytics():
+        filtered = get_filtered()
+        digest = artifact.dataset_hash if get_artifact() is not None else dataset_hash(dataset_path)
+        return filtered, caches['analytics'].get_or_build((digest, 'analytics'), lambda: GraphAnalytics(filtered.edge_index))
+
+    @app.callback([Output('analytics-summary', 'children'), Output('analytics-top', 'children')], [Input('tabs', 'value')])
+    @timed('show_analytics', 'callback')
+    def show_analytics(tab):
+        if tab != 'tab-analytics':
+            raise PreventUpdate
+        filtered, analytics = get_analytics()
+        index = filtered.edge_index
+        summary = [html.P('The network has %d nodes and %d edges, %d of them with an edge in the opposite direction.'
+                          % (len(index.node_ids), len(index), int(index.is_bidirectional.sum())))]
+        if len(index.node_ids):
+            hub = int(np.argmax(analytics.in_degree + analytics.out_degree))
+            summary.append(html.P('The node with the most edges is %s, with %d incoming and %d outgoing edges.'
+                                  % (filtered.node_labels[hub], analytics.in_degree[hub], analytics.out_degree[hub])))
+            summary.append(html.P('It has %d strongly connected components, the largest one has %d nodes.'
+                                  % (analytics.n_components, analytics.component_size.max())))
+        return summary, analytics_table(analytics, filtered.node_labels, filtered.node_colors, analytics.top_nodes(TOP_NODES))
+
+    def node_options_callback(dropdown):
+        def node_options(search_value, value):
+            if not search_value and value is None:
+                raise PreventUpdate
+            filtered = get_filtered()
+            found = []
+            if search_value:
+                labels = pd.Series(filtered.node_labels).astype(str)
+                found = [int(code) for code in np.flatnonzero(labels.str.contains(search_value, case=False, regex=False).to_numpy())[:MAX_NODE_OPTIONS]]
+            if node_codes([value], len(filtered.node_labels)) and value not in found: #the selected node keeps its label
+                found.insert(0, value)
+            return [{'label': '%s (%s)' % (filtered.node_labels[code], filtered.edge_index.node_ids[code]), 'value': code} for code in found]
+        return timed('node_options', 'callback')(node_options)
+
+    for dropdown in ('path-source', 'path-target'):
+        app.callback(Output(dropdown, 'options'), [Input(dropdown, 'search_value')], [State(dropdown, 'value')])(node_options_callback(dropdown))
+
+    @app.callback([Output('path-result', 'children'), Output('selected-nodes', 'data')],
+                  [Input('path-source', 'value'), Input('path-target', 'value'), Input('path-weighted', 'value')])
+    @timed('show_path', 'callback')
+    def show_path(source, target, weighted):
+        nodes = [node for node in (source, target) if node is not None]
+        if source is None or target is None:
+            return '', {'nodes': nodes, 'path': []}
+        filtered, analytics = get_analytics()
+        nodes = node_codes(nodes, len(filtered.node_labels))
+        if len(nodes) < 2: #selected in a previous version of the dataset
+            return '', {'nodes': nodes, 'path': []}
+        path, length = analytics.shortest_path(source, target, weighted == 'weight')
+        labels = [str(filtered.node_labels[node]) for node in (path or nodes)]
+        if not path:
+            return 'There is no path from %s to %s.' % tuple(labels), {'nodes': nodes, 'path': []}
+        if weighted == 'weight':
+            text = 'Path with the lowest total weight, %s, in %d edges:' % (format_weight(length), len(path) - 1)
+        else:
+            text = 'Path with the fewest edges, %d:' % (len(path) - 1)
+        return [html.P(text), html.P(' -> '.join(labels))], {'nodes': nodes, 'path': path}
 
+    return app
 
 
+app = create_app(artifact_path=os.environ.get('NETWORK_ARTIFACT'))
+server = app.server
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s') #the timings as json log lines
+    app.run(debug=True)
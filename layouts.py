@@ -0,0 +1,487 @@
+'''
+Positions of the nodes in the 2-d and 3-d plots.
+
+The layout of every figure is chosen by name from LAYOUTS_2D / LAYOUTS_3D. Scaling with N nodes and E edges:
+
+-radial (2d): O(N + E) time, O(N) memory. The hub nodes are found from their degree and put in the center.
+-circular (2d): O(N) time and memory.
+-force (2d and 3d): sparse Fruchterman-Reingold. Every iteration is O(E) for the attraction along the edges and
+ O(N*sqrt(N)) for the repulsion, which is approximated on about sqrt(N) balanced k-d tree cells. Memory is O(N + E).
+-kamada_kawai (3d): O(N^2) memory for the all-pairs shortest path distances and worse in time, so 'auto'
+ uses it only for graphs with at most KAMADA_KAWAI_MAX_NODES nodes.
+
+The computed positions are stored on disk (one .npz file per layout) keyed by the dataset, a hash of the nodes,
+the weighted edges and the layout parameters, so an unchanged dataset doesn't recompute its layouts
+when the process restarts. When the graph changed only a little, the iterative layouts are warm-started
+from the most recent cached positions of the same layout and dataset, which is faster than a cold start and keeps
+the existing nodes where they were.
+'''
+import glob
+import hashlib
+import os
+import tempfile
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+from metrics import span
+
+LAYOUT_CACHE_DIR = '.layout_cache'
+MAX_CACHED_LAYOUTS = 8 # cached files kept per dataset, layout and parameters, the oldest are removed
+WARM_START_MIN_OVERLAP = 0.5 # fraction of the nodes that must have a cached position to warm start
+KAMADA_KAWAI_MAX_NODES = 200 # above this number of nodes 'auto' uses the force directed layout in 3d (500 nodes take ~17 s)
+HUB_FRACTION = 0.5 # nodes connected to at least this fraction of the other nodes are hubs
+FORCE_ITERATIONS = 50
+REPULSION_CHUNK = 4096 # nodes processed at once in the far field repulsion, bounds the temporary memory
+
+
+def params_hash(name, params):
+    '''
+    -name: the name of the layout
+    -params: a dictionary with the parameters of the layout
+
+    Returns:
+    -a short hash of the layout name and its parameters
+    '''
+    text = name + repr(sorted((params or {}).items()))
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def dataset_key(dataset):
+    '''
+    -dataset: the path of the dataset, or None if the graph doesn't come from a dataset
+
+    Returns:
+    -a short key of the dataset used in the file names of the cache, so the cached files of the datasets are
+    warm-started from and removed separately
+    '''
+    if dataset is None:
+        return 'graph'
+    return hashlib.sha256(os.path.abspath(dataset).encode()).hexdigest()[:8]
+
+
+def graph_hash(Gr_dir):
+    '''
+    -Gr_dir: the directed graph
+
+    Returns:
+    -a hash of the node set and of the weighted edge set, independent of the insertion order
+    '''
+    digest = hashlib.sha256()
+    for node in sorted(map(repr, Gr_dir.nodes)):
+        digest.update(node.encode() + b'\n')
+    for edge in sorted('%r>%r:%r' % edge for edge in Gr_dir.edges(data='weights')):
+        digest.update(edge.encode() + b'\n')
+    return digest.hexdigest()[:16]
+
+
+def read_layout(path):
+    '''
+    -path: the path of a cached layout
+
+    Returns:
+    -a dictionary with key the node_id and value the array of positions of the node
+    '''
+    with np.load(path, allow_pickle=False) as data:
+        return dict(zip(data['node_ids'].tolist(), data['positions']))
+
+
+def write_arrays(path, **arrays):
+    '''
+    -path: the path of a cached .npz file
+    -arrays: the arrays stored in the file, by name
+
+    The file is written to a temporary file first and then renamed, so concurrent readers never see half a file.
+    '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def write_layout(path, pos):
+    '''
+    -path: the path of the cached layout
+    -pos: a dictionary with key the node_id and value the array of positions of the node
+    '''
+    write_arrays(path, node_ids=np.array(list(pos)), positions=np.array(list(pos.values()), dtype=float))
+
+
+def cached_files(prefix):
+    '''
+    -prefix: the common prefix of the paths of the cached files of a layout and its parameters
+
+    Returns:
+    -the paths of the cached files with the prefix, from the oldest to the newest. Files removed by another process
+    while they are listed are left out.
+    '''
+    times = {}
+    for path in glob.glob(prefix + '*.npz'):
+        try:
+            times[path] = os.path.getmtime(path)
+        except FileNotFoundError:
+            pass
+    return sorted(times, key=times.get)
+
+
+def remove_old_files(prefix, keep=MAX_CACHED_LAYOUTS):
+    '''
+    -prefix: the common prefix of the paths of the cached files of a layout and its parameters
+    -keep: the number of files kept
+
+    Removes the oldest cached files with the prefix, so at most keep of them are left.
+    Another process may be removing the same files, so the files already gone are skipped.
+    '''
+    previous = cached_files(prefix)
+    for old in previous[:max(len(previous) - keep, 0)]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+
+
+def warm_start_positions(Gr_dir, cached):
+    '''
+    -Gr_dir: the directed graph
+    -cached: a dictionary with the cached positions of a previous version of the graph
+
+    Returns:
+    -the initial positions of all the nodes, or None if too few nodes have a cached position.
+    The new nodes are placed at the mean position of their neighbours that have a cached position,
+    or at the center of the cached positions if they have none.
+    '''
+    known = [node for node in Gr_dir.nodes if node in cached]
+    if len(known) < WARM_START_MIN_OVERLAP*Gr_dir.number_of_nodes():
+        return None
+    center = np.mean([cached[node] for node in known], axis=0)
+    rng = np.random.default_rng(0)
+    initial = {}
+    for node in Gr_dir.nodes:
+        if node in cached:
+            initial[node] = np.asarray(cached[node], dtype=float)
+            continue
+        neighbours = [cached[n] for n in nx.all_neighbors(Gr_dir, node) if n in cached]
+        base = np.mean(neighbours, axis=0) if neighbours else center
+        initial[node] = base + rng.normal(scale=1e-2, size=len(center)) #avoid placing nodes on top of each other
+    return initial
+
+
+def cached_layout(Gr_dir, name, compute, params=None, cache_dir=LAYOUT_CACHE_DIR, warm_start=False, dataset=None):
+    '''
+    -Gr_dir: the directed graph
+    -name: the name of the layout, used in the file names of the cache
+    -compute: a function (Gr_dir, initial positions or None) -> dictionary of positions
+    -params: a dictionary with the parameters of the layout, part of the cache key
+    -cache_dir: the folder of the cached layouts, None to disable the cache
+    -warm_start: True if compute accepts initial positions
+    -dataset: the path of the dataset of the graph, part of the cache key (see dataset_key)
+
+    Returns:
+    -a dictionary with key the node_id and value the array of positions of the node
+    '''
+    if cache_dir is None:
+        return compute(Gr_dir, None)
+    prefix = os.path.join(cache_dir, '%s-%s-%s-' % (name, params_hash(name, params), dataset_key(dataset)))
+    path = prefix + graph_hash(Gr_dir) + '.npz'
+    try:
+        return read_layout(path)
+    except FileNotFoundError:
+        pass
+    initial = None
+    previous = cached_files(prefix)
+    if warm_start and previous:
+        try:
+            initial = warm_start_positions(Gr_dir, read_layout(previous[-1]))
+        except FileNotFoundError: #removed by another process since it was listed
+            pass
+    pos = compute(Gr_dir, initial)
+    write_layout(path, pos)
+    remove_old_files(prefix)
+    return pos
+
+
+def node_degrees(Gr_dir):
+    '''
+    -Gr_dir: the directed graph
+
+    Returns:
+    -the list of the nodes
+    -an array with the number of distinct neighbours (predecessors or successors) of every node
+    '''
+    nodes = list(Gr_dir.nodes)
+    return nodes, np.array([len(set(Gr_dir.predecessors(node)) | set(Gr_dir.successors(node))) for node in nodes])
+
+
+def find_hubs(Gr_dir, hub_fraction=HUB_FRACTION):
+    '''
+    -Gr_dir: the directed graph
+    -hub_fraction: nodes connected to at least this fraction of the other nodes are hubs
+
+    Returns:
+    -the list of the hub nodes, sorted by decreasing degree. If no node passes the threshold the node with the
+    highest degree is the hub (e.g. node 966 in the case study, connected with all the nodes apart from one).
+    '''
+    nodes, degrees = node_degrees(Gr_dir)
+    if not nodes:
+        return []
+    order = np.argsort(-degrees, kind='stable')
+    hubs = [nodes[i] for i in order if degrees[i] >= hub_fraction*(len(nodes) - 1)]
+    return hubs or [nodes[order[0]]]
+
+
+def radial_layout(Gr_dir, scale=2, hub_fraction=HUB_FRACTION):
+    '''
+    -Gr_dir: the directed graph
+    -scale: the radius of the outer circle
+    -hub_fraction: nodes connected to at least this fraction of the other nodes are hubs
+
+    Returns:
+    -a dictionary with key the node_id and value the array of 2-d positions of the node
+
+    A single hub is put in the center and several hubs on an inner circle, the other nodes are equidistant on 
+    the outer circle. In that way the connections with the hubs are easily depicted. O(N + E).
+    '''
+    hubs = find_hubs(Gr_dir, hub_fraction)
+    hub_set = set(hubs)
+    others = [node for node in Gr_dir.nodes if node not in hub_set]
+    pos = {}
+    for ring, radius in ((hubs, 0.25*scale if len(hubs) > 1 else 0), (others, scale)):
+        angles = 2*np.pi*np.arange(len(ring))/max(len(ring), 1)
+        coords = radius*np.column_stack([np.cos(angles), np.sin(angles)])
+        pos.update(zip(ring, coords))
+    return pos
+
+
+def adjacency_matrix(Gr_dir, weight='weights'):
+    '''
+    -Gr_dir: the directed graph
+    -weight: the edge attribute with the weights
+
+    Returns:
+    -the list of the nodes
+    -the symmetric weighted adjacency matrix of the graph as a scipy.sparse COO matrix, with the weights normalized between 0 and 1
+    '''
+    nodes = list(Gr_dir.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = [(index[u], index[v], w) for u, v, w in Gr_dir.edges(data=weight, default=1) if u != v]
+    rows, cols, weights = (np.array(column, dtype=float) for column in zip(*edges)) if edges else (np.zeros(0),)*3
+    if len(weights):
+        weights = weights/weights.max()
+    A = sp.coo_matrix((weights, (rows.astype(int), cols.astype(int))), shape=(len(nodes), len(nodes)))
+    return nodes, (A + A.T).tocoo()
+
+
+def kd_cells(pos, n_cells):
+    '''
+    -pos: array with the positions of the nodes
+    -n_cells: the wanted number of cells, rounded to a power of 2
+
+    Returns:
+    -the cell of every node, in [0, 2^depth). The nodes are split in two halves at the median of the widest axis 
+    of their cell, recursively (a balanced k-d tree), so every cell holds about N/n_cells nodes whatever their 
+    distribution: a ring or a converged layout with dense clusters gets small cells where the nodes are.
+    '''
+    n, dim = pos.shape
+    cell = np.zeros(n, dtype=np.int64)
+    order = np.arange(n)
+    low, width = pos.min(axis=0), np.maximum(np.ptp(pos, axis=0), 1e-12)
+    for depth in range(max(int(round(np.log2(max(n_cells, 1)))), 0)):
+        #the nodes are sorted by cell, so the extent of every cell is one reduceat over its slice
+        mass = np.bincount(cell, minlength=2**depth)
+        starts = np.concatenate([[0], np.cumsum(mass)[:-1]])
+        occupied = np.flatnonzero(mass)
+        extent = np.zeros((2**depth, dim))
+        extent[occupied] = (np.maximum.reduceat(pos[order], starts[occupied], axis=0)
+                            - np.minimum.reduceat(pos[order], starts[occupied], axis=0))
+        axis = extent.argmax(axis=1)[cell]
+        #cell + the coordinate scaled in [0, 1) sorts by cell, then by the coordinate within the cell
+        key = cell + (pos[np.arange(n), axis] - low[axis])/(width[axis]*(1 + 1e-9))
+        order = np.argsort(key, kind='stable')
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n) - starts[cell[order]]
+        cell = 2*cell + (rank >= mass[cell]//2)
+    return cell
+
+
+def grid_repulsion(pos, k, chunk=REPULSION_CHUNK):
+    '''
+    -pos: array with the current positions of the nodes
+    -k: the optimal distance between the nodes
+    -chunk: number of nodes processed at once in the far field
+
+    Returns:
+    -the repulsive displacement of every node
+
+    The space is divided in about sqrt(N) cells of about sqrt(N) nodes each (see kd_cells). The nodes of other cells 
+    are replaced by the centroid of their cell, weighted by the number of nodes in it, and only the nodes of the same 
+    cell repel each other exactly.
+    '''
+    n, dim = pos.shape
+    cell = kd_cells(pos, np.sqrt(n))
+    mass = np.bincount(cell)
+    occupied = np.flatnonzero(mass)
+    centroid = np.column_stack([np.bincount(cell, weights=pos[:, d], minlength=len(mass)) for d in range(dim)])[occupied]
+    centroid /= mass[occupied][:, None]
+
+    disp = np.zeros_like(pos)
+    sq_norms = (pos*pos).sum(axis=1)
+    centroid_sq_norms = (centroid*centroid).sum(axis=1)
+    #far field: every node against the centroids of the other cells
+    for start in range(0, n, chunk):
+        part = pos[start:start + chunk]
+        dist2 = sq_norms[start:start + chunk, None] + centroid_sq_norms[None, :] - 2*part @ centroid.T
+        coef = k*k*mass[occupied][None, :]/np.maximum(dist2, 1e-9)
+        coef[cell[start:start + chunk, None] == occupied[None, :]] = 0 #the own cell is computed exactly below
+        disp[start:start + chunk] = part*coef.sum(axis=1)[:, None] - coef @ centroid
+    #near field: exact repulsion between the nodes of the same cell
+    order = np.argsort(cell, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(mass)])
+    for c in occupied:
+        members = order[bounds[c]:bounds[c + 1]]
+        if len(members) < 2:
+            continue
+        for start in range(0, len(members), chunk):
+            part = members[start:start + chunk]
+            dist2 = sq_norms[part, None] + sq_norms[None, members] - 2*pos[part] @ pos[members].T
+            coef = k*k/np.maximum(dist2, 1e-9)
+            coef[part[:, None] == members[None, :]] = 0 #no force of a node on itself
+            disp[part] += pos[part]*coef.sum(axis=1)[:, None] - coef @ pos[members]
+    return disp
+
+
+def force_directed_layout(Gr_dir, dim=2, initial=None, iterations=FORCE_ITERATIONS, scale=1, seed=0, weight='weights'):
+    '''
+    -Gr_dir: the directed graph
+    -dim: 2 or 3
+    -initial: a dictionary with initial positions of the nodes (warm start), None for a random start
+    -iterations: the number of iterations
+    -scale: the positions are rescaled in [-scale, scale]
+    -seed: the seed of the random start
+    -weight: the edge attribute with the weights, heavier edges pull their nodes closer
+
+    Returns:
+    -a dictionary with key the node_id and value the array of positions of the node
+
+    Fruchterman-Reingold with the attraction computed along the edges of the sparse adjacency matrix and the 
+    repulsion approximated on a grid (see grid_repulsion). O(E + N*sqrt(N)) time per iteration and O(N + E) memory.
+    '''
+    nodes, A = adjacency_matrix(Gr_dir, weight)
+    n = len(nodes)
+    if n <= 1:
+        return {node: np.zeros(dim) for node in nodes}
+    if initial is None:
+        pos = np.random.default_rng(seed).random((n, dim))
+        temperature = 0.1
+    else:
+        pos = np.array([initial[node] for node in nodes], dtype=float)
+        pos = (pos - pos.min(axis=0))/np.maximum(np.ptp(pos, axis=0).max(), 1e-9)
+        temperature = 0.02 #the warm start only needs small moves
+    k = (1.0/n)**(1.0/dim)
+    cooling = temperature/(iterations + 1)
+    for _ in range(iterations):
+        disp = grid_repulsion(pos, k)
+        delta = pos[A.row] - pos[A.col]
+        dist = np.maximum(np.sqrt((delta**2).sum(axis=1)), 1e-9)
+        pull = delta*(dist*A.data/k)[:, None]
+        for d in range(dim):
+            disp[:, d] -= np.bincount(A.row, weights=pull[:, d], minlength=n)
+        length = np.maximum(np.sqrt((disp**2).sum(axis=1)), 1e-9)
+        pos += disp*(np.minimum(length, temperature)/length)[:, None]
+        temperature -= cooling
+    pos -= pos.mean(axis=0)
+    pos *= scale/max(np.abs(pos).max(), 1e-9)
+    return dict(zip(nodes, pos))
+
+
+def random_start(Gr_dir, dim, seed=0):
+    '''
+    -Gr_dir: the directed graph
+    -dim: the number of dimensions
+    -seed: the seed of the random positions
+
+    Returns:
+    -a dictionary with random initial positions of the nodes. networkx starts the 3d Kamada-Kawai layout from unseeded
+    random positions, so every process (and every build without the cache) would get other positions than the figures.
+    '''
+    return dict(zip(Gr_dir.nodes, np.random.default_rng(seed).random((Gr_dir.number_of_nodes(), dim))))
+
+
+#the available layouts: name -> (function (Gr_dir, initial positions or None) -> positions, parameters, supports warm start)
+LAYOUTS_2D = {
+    'radial': (lambda Gr_dir, initial: radial_layout(Gr_dir, scale=2), {'scale': 2, 'hub_fraction': HUB_FRACTION}, False),
+    'circular': (lambda Gr_dir, initial: nx.circular_layout(Gr_dir, scale=2), {'scale': 2}, False),
+    'force': (lambda Gr_dir, initial: force_directed_layout(Gr_dir, dim=2, initial=initial, scale=2),
+              {'dim': 2, 'scale': 2, 'iterations': FORCE_ITERATIONS, 'repulsion': 'kd_cells'}, True),
+}
+LAYOUTS_3D = {
+    'kamada_kawai': (lambda Gr_dir, initial: nx.kamada_kawai_layout(Gr_dir, pos=initial or random_start(Gr_dir, 3),
+                                                                    dim=3, weight='weights'),
+                     {'dim': 3, 'weight': 'weights', 'seed': 0}, True),
+    'force': (lambda Gr_dir, initial: force_directed_layout(Gr_dir, dim=3, initial=initial),
+              {'dim': 3, 'iterations': FORCE_ITERATIONS, 'repulsion': 'kd_cells'}, True),
+}
+
+
+def choose_layout(Gr_dir, dim, name='auto'):
+    '''
+    -Gr_dir: the directed graph
+    -dim: 2 or 3
+    -name: the name of the layout or 'auto'
+
+    Returns:
+    -the name of the layout to use. 'auto' is the radial layout in 2d, and in 3d the Kamada-Kawai layout 
+    for small graphs and the force directed layout above KAMADA_KAWAI_MAX_NODES nodes.
+    '''
+    if name != 'auto':
+        return name
+    if dim == 2:
+        return 'radial'
+    return 'kamada_kawai' if Gr_dir.number_of_nodes() <= KAMADA_KAWAI_MAX_NODES else 'force'
+
+
+def compute_layout(Gr_dir, dim, name='auto', cache_dir=LAYOUT_CACHE_DIR, dataset=None):
+    '''
+    -Gr_dir: the directed graph
+    -dim: 2 or 3
+    -name: the name of the layout (see LAYOUTS_2D and LAYOUTS_3D) or 'auto'
+    -cache_dir: the folder of the cached layouts, None to disable the cache
+    -dataset: the path of the dataset of the graph, so its cached layouts are kept apart from those of the other datasets
+
+    Returns:
+    -a dictionary with key the node_id and value the array of positions of the node
+    '''
+    layouts = LAYOUTS_2D if dim == 2 else LAYOUTS_3D
+    name = choose_layout(Gr_dir, dim, name)
+    if name not in layouts:
+        raise ValueError('unknown %dd layout %r, choose one of %s' % (dim, name, ', '.join(sorted(layouts))))
+    compute, params, warm_start = layouts[name]
+    with span('layout', dim=dim, layout=name):
+        return cached_layout(Gr_dir, name, compute, params, cache_dir=cache_dir, warm_start=warm_start, dataset=dataset)
+
+
+def layout_2d(Gr_dir, name='auto', cache_dir=LAYOUT_CACHE_DIR, dataset=None):
+    '''
+    -Gr_dir: the directed graph
+    -name: the name of the 2d layout or 'auto'
+    -cache_dir: the folder of the cached layouts, None to disable the cache
+    -dataset: the path of the dataset of the graph, see compute_layout
+
+    Returns:
+    -a dictionary with key the node_id and value the array of 2-d positions of the node
+    '''
+    return compute_layout(Gr_dir, 2, name, cache_dir, dataset)
+
+
+def layout_3d(Gr_dir, name='auto', cache_dir=LAYOUT_CACHE_DIR, dataset=None):
+    '''
+    -Gr_dir: the directed graph
+    -name: the name of the 3d layout or 'auto'
+    -cache_dir: the folder of the cached layouts, None to disable the cache
+    -dataset: the path of the dataset of the graph, see compute_layout
+
+    Returns:
+    -a dictionary with key the node_id and value the array of 3-d positions of the node
+    '''
+    return compute_layout(Gr_dir, 3, name, cache_dir, dataset)
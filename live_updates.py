@@ -0,0 +1,594 @@
+'''
+Live incremental updates of the 2-d figure.
+
+The changes of the network are appended to a local file, one change per line, in JSON lines (.jsonl) or csv:
+
+    {"op": "upsert", "source_id": 951, "target_id": 966, "weights": 4}     insert or update an edge
+    {"op": "delete", "source_id": 951, "target_id": 966}                   delete an edge
+    {"op": "upsert", "node_id": 990, "node_label": "N990", "node_color": "red"}
+    {"op": "delete", "node_id": 990}                                       delete a node and its edges
+
+A csv file has a header with the columns op, source_id, target_id, weights, node_id, node_label and node_color,
+and leaves empty the columns that don't apply. A line that can't be parsed is skipped and logged. The file is read
+from the last position on every poll, so every process that tails it ends up with the same network. The version of the network is the number of bytes of the file
+applied to it, so it is the same in every process (every gunicorn worker) that applied the same changes.
+
+The changes are applied to the graph and to a LiveEdgeIndex, which keeps the edge arrays with spare capacity:
+only the changed edges and their reverse edges get a new reciprocal status and normalized weight, and all the
+weights are normalized again only when the maximum weight changes. The figure has a fixed set of traces, one
+per edge class and weight bucket (lines, arrows and middle nodes) and one per node color, so a change rebuilds
+only the traces of the buckets and colors it touches. The buckets are always the n_buckets equal ranges of the
+normalized weights, drawn with the mean weight of their edges, since the traces of the figure are fixed.
+The traces are Scatter or Scattergl traces as chosen by figures.choose_render_mode, with the arrows drawn as marker
+traces in both modes; the figure is built again when the number of edges crosses the threshold of the 'auto' mode.
+A client sends the version it has and receives only the traces that changed since then, as a dash.Patch, or the
+whole figure when the process has not applied that version or the order of the traces changed.
+'''
+import csv
+import json
+import logging
+import os
+import threading
+import zlib
+
+import numpy as np
+import plotly.graph_objects as go
+from dash import Patch
+
+from aggregation import UNKNOWN_COLOR, node_colors
+from edge_index import EdgeIndex
+from figures import (EDGE_CLASSES, HOVER_MODE, RENDER_MODE, WEIGHT_BUCKETS, bucket_of, choose_render_mode, create_arrow_trace,
+                     create_edge_traces, create_layout_2d, create_middle_trace, node_marker_traces)
+from metrics import span
+
+LIVE_INTERVAL_MS = 2000 # how often the clients poll for changes
+LIVE_HISTORY = 100 # polls remembered; a client that is further behind receives the whole figure
+CSV_COLUMNS = ['op', 'source_id', 'target_id', 'weights', 'node_id', 'node_label', 'node_color']
+
+logger = logging.getLogger('live_updates')
+
+
+class ChangeFeed:
+    '''
+    Reads the changes appended to a .jsonl or .csv file since the last read.
+    A line is read only when it is complete (ends with a newline), so a change being written is read on the next poll.
+
+    Attributes:
+    -offset: the position in the file of the next line to read
+    -position: the number of bytes read since the feed was created, also over a truncation of the file
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.position = 0
+        self.header = None if path.endswith('.csv') else CSV_COLUMNS
+
+    def read(self):
+        '''
+        Returns:
+        -the list of the new changes, every change is a dictionary. The lines that can't be parsed are skipped and 
+        logged, and the position moves past the new lines only once they are all parsed.
+        '''
+        if not os.path.exists(self.path):
+            return []
+        if os.path.getsize(self.path) < self.offset: #the file was truncated or replaced, read it again
+            self.offset = 0
+            self.header = None if self.path.endswith('.csv') else CSV_COLUMNS
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        complete = data[:data.rfind(b'\n') + 1]
+        header, changes = self.header, []
+        for line in complete.splitlines():
+            if not line.strip():
+                continue
+            try:
+                if header is None:
+                    header = next(csv.reader([line.decode()]))
+                    continue
+                change = self.parse(line.decode(), header)
+            except (UnicodeDecodeError, ValueError, csv.Error) as error:
+                logger.warning('skipped the line %r of %s: %r', line, self.path, error)
+                continue
+            changes.append(change)
+        self.header = header
+        self.offset += len(complete)
+        self.position += len(complete)
+        return changes
+
+    def parse(self, line, header):
+        '''
+        -line: a line of the file, without the newline
+        -header: the columns of a csv file
+
+        Returns:
+        -the change of the line, as a dictionary without the empty columns
+        Raises ValueError if the line is not a change.
+        '''
+        if not self.path.endswith('.csv'):
+            change = json.loads(line)
+            if not isinstance(change, dict):
+                raise ValueError('a change must be a JSON object, got %s' % type(change).__name__)
+            return change
+        values = next(csv.reader([line]))
+        if len(values) > len(header):
+            raise ValueError('%d values for the %d columns %s' % (len(values), len(header), ', '.join(header)))
+        return {key: value for key, value in zip(header, values) if value != ''}
+
+
+class LiveEdgeIndex(EdgeIndex):
+    '''
+    Edge index that is updated in place.
+
+    The arrays of EdgeIndex are kept with spare capacity: the rows of the deleted edges are marked inactive and
+    reused, and the arrays are doubled when they are full. take() works as for an EdgeIndex, on active rows.
+
+    Attributes (besides the ones of EdgeIndex, which cover all the rows of the capacity):
+    -active: boolean array, True for the rows that hold an edge
+    -bucket: array with the weight bucket of every row
+    -max_weight: the weight used for the normalization
+    -rows: dictionary with key (source_code, target_code) and value the row of the edge
+    '''
+
+    ROW_ARRAYS = ['source_code', 'target_code', 'weight', 'source', 'target', 'norm_weight',
+                  'is_bidirectional', 'reverse_weight', 'reverse', 'active', 'bucket']
+
+    def __init__(self, edge_index, n_buckets=WEIGHT_BUCKETS):
+        for name in ('node_ids', 'source_code', 'target_code', 'source', 'target', 'norm_weight',
+                     'is_bidirectional', 'reverse'):
+            setattr(self, name, np.array(getattr(edge_index, name)))
+        self.weight = edge_index.weight.astype(float)
+        self.reverse_weight = edge_index.reverse_weight.astype(float)
+        self.n_buckets = n_buckets
+        self.active = np.ones(len(self.weight), dtype=bool)
+        self.bucket = bucket_of(self.norm_weight, n_buckets)
+        self.max_weight = float(self.weight.max()) if len(self.weight) else 1.0
+        self.rows = dict(zip(zip(self.source_code.tolist(), self.target_code.tolist()), range(len(self.weight))))
+        self.free = [] # rows of the deleted edges, reused by the next inserts
+        self.ids = np.arange(len(self.weight))
+        self._max_removed = False # True when the edge with the maximum weight was lowered or deleted
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add_node(self, node_id):
+        '''
+        -node_id: the id of a new node
+
+        Returns:
+        -the code of the node
+        '''
+        self.node_ids = np.append(self.node_ids, np.array([node_id], dtype=self.node_ids.dtype))
+        return len(self.node_ids) - 1
+
+    def grow(self):
+        '''
+        Doubles the capacity of the row arrays.
+        '''
+        size = len(self.weight)
+        capacity = max(2*size, 16)
+        for name in self.ROW_ARRAYS:
+            old = getattr(self, name)
+            new = np.full(capacity, -1, dtype=old.dtype) if name == 'reverse' else np.zeros(capacity, dtype=old.dtype)
+            new[:size] = old
+            setattr(self, name, new)
+        self.free.extend(range(capacity - 1, size - 1, -1))
+        self.ids = np.arange(capacity)
+
+    def touched(self, source_code, target_code):
+        '''
+        -source_code, target_code: the codes of the ends of an edge
+
+        Returns:
+        -the rows of the edge and of its reverse edge that exist, the rows a change of the edge modifies
+        '''
+        rows = (self.rows.get((source_code, target_code)), self.rows.get((target_code, source_code)))
+        return {row for row in rows if row is not None}
+
+    def groups(self, rows):
+        '''
+        -rows: rows of the index
+
+        Returns:
+        -the set of the (is_bidirectional, bucket) groups of the rows, the groups of traces that draw them
+        '''
+        rows = np.fromiter(rows, dtype=np.int64)
+        return set(zip(self.is_bidirectional[rows].tolist(), self.bucket[rows].tolist()))
+
+    def upsert(self, source_code, target_code, weight):
+        '''
+        -source_code, target_code: the codes of the ends of the edge
+        -weight: the weight of the edge
+
+        Inserts the edge or updates its weight, and updates the reciprocal status of the edge and of its reverse edge.
+        '''
+        key = (source_code, target_code)
+        row = self.rows.get(key)
+        if row is None:
+            if not self.free:
+                self.grow()
+            row = self.free.pop()
+            self.rows[key] = row
+            self.active[row] = True
+            self.source_code[row], self.target_code[row] = source_code, target_code
+            self.source[row], self.target[row] = self.node_ids[source_code], self.node_ids[target_code]
+        elif self.weight[row] == self.max_weight and weight < self.max_weight:
+            self._max_removed = True
+        self.weight[row] = weight
+        reverse = self.rows.get((target_code, source_code), -1)
+        self.reverse[row] = reverse
+        self.is_bidirectional[row] = reverse >= 0
+        self.reverse_weight[row] = self.weight[reverse] if reverse >= 0 else 0
+        if reverse >= 0:
+            self.reverse[reverse], self.is_bidirectional[reverse], self.reverse_weight[reverse] = row, True, weight
+
+    def delete(self, source_code, target_code):
+        '''
+        -source_code, target_code: the codes of the ends of the edge
+
+        Deletes the edge, if it exists, and makes its reverse edge one-way.
+        '''
+        row = self.rows.pop((source_code, target_code), None)
+        if row is None:
+            return
+        self._max_removed = self._max_removed or self.weight[row] == self.max_weight
+        reverse = self.reverse[row]
+        self.active[row], self.is_bidirectional[row], self.reverse[row] = False, False, -1
+        self.free.append(row)
+        if reverse >= 0:
+            self.reverse[reverse], self.is_bidirectional[reverse], self.reverse_weight[reverse] = -1, False, 0
+
+    def normalize(self, rows):
+        '''
+        -rows: the changed rows
+
+        Returns:
+        -True if the maximum weight changed, so all the edges were normalized again, False if only the given rows were
+        '''
+        rows = np.fromiter(rows, dtype=np.int64)
+        rows = rows[self.active[rows]]
+        max_weight = self.max_weight
+        if self._max_removed: #only then the whole index is searched for the maximum
+            max_weight = float(self.weight[self.active].max()) if self.active.any() else 1.0
+            self._max_removed = False
+        if len(rows):
+            max_weight = max(max_weight, float(self.weight[rows].max()))
+        renormalized = max_weight != self.max_weight
+        self.max_weight = max_weight
+        if renormalized:
+            rows = np.flatnonzero(self.active)
+        self.norm_weight[rows] = self.weight[rows]/self.max_weight
+        self.bucket[rows] = bucket_of(self.norm_weight[rows], self.n_buckets)
+        return renormalized
+
+    def group_rows(self, group):
+        '''
+        -group: an (is_bidirectional, bucket) group
+
+        Returns:
+        -the active rows of the group
+        '''
+        bidirectional, bucket = group
+        return np.flatnonzero(self.active & (self.is_bidirectional == bidirectional) & (self.bucket == bucket))
+
+    def node_rows(self, code):
+        '''
+        -code: the code of a node
+
+        Returns:
+        -the active rows of the edges of the node
+        '''
+        return np.flatnonzero(self.active & ((self.source_code == code) | (self.target_code == code)))
+
+
+def empty_trace(render_mode='webgl'):
+    '''
+    -render_mode: 'webgl' for a Scattergl trace, 'svg' otherwise
+
+    Returns:
+    -a trace without points, that keeps the place of a trace of the live figure
+    '''
+    return (go.Scattergl if render_mode == 'webgl' else go.Scatter)(x=[], y=[], mode='markers', showlegend=False, hoverinfo='skip')
+
+
+class LiveNetwork:
+    '''
+    The network of the live 2-d figure, updated in place with the changes read from a ChangeFeed.
+
+    Attributes:
+    -graph: the directed graph, a copy of the graph of the dataset
+    -edge_index: the LiveEdgeIndex of the edges
+    -codes: dictionary with key the node_id and value its code in the edge index
+    -node_labels, colors, coords: the label, the color and the 2-d position of every node code
+    -node_active: boolean array, False for the deleted nodes
+    -version: the number of bytes of the feed applied to the network (ChangeFeed.position)
+    -trace_mode: 'svg' or 'webgl', the render mode of the traces chosen for the current number of edges
+    -traces: dictionary with key the trace key and value the trace, as a plotly json dictionary
+    '''
+
+    def __init__(self, network, pos, feed, hover=HOVER_MODE, n_buckets=WEIGHT_BUCKETS, render_mode=RENDER_MODE):
+        self.graph = network.graph.copy()
+        self.edge_index = LiveEdgeIndex(network.edge_index, n_buckets)
+        self.codes = {node: code for code, node in enumerate(self.edge_index.node_ids.tolist())}
+        self.node_labels = np.array(network.node_labels, dtype=object)
+        self.colors = node_colors(network)[0]
+        self.coords = network.edge_index.positions(pos)
+        self.node_active = np.ones(len(self.codes), dtype=bool)
+        self.feed = feed
+        self.hover = hover
+        self.render_mode = render_mode
+        self.version = feed.position
+        self.history = [] # (version before, version after, the keys of the changed traces or None if the whole figure changed)
+        self.lock = threading.RLock()
+        self.rebuild()
+
+    def group_keys(self, groups):
+        '''
+        -groups: (is_bidirectional, bucket) groups
+
+        Returns:
+        -the keys of the line, arrow and middle node traces of the groups
+        '''
+        return {(kind,) + tuple(group) for group in groups for kind in ('edges', 'arrows', 'middle')}
+
+    def rebuild(self):
+        '''
+        Builds all the traces and their order in the figure.
+        '''
+        self.trace_mode = choose_render_mode(len(self.edge_index), self.render_mode)
+        groups = [(bidirectional, bucket) for bidirectional, *_ in EDGE_CLASSES for bucket in range(self.edge_index.n_buckets)]
+        self.color_order = list(dict.fromkeys(self.colors[self.node_active].tolist()))
+        self.order = ([('legend', bidirectional) for bidirectional, *_ in EDGE_CLASSES]
+                      + [('edges',) + group for group in groups] + [('arrows',) + group for group in groups]
+                      + [('nodes', color) for color in self.color_order] + [('middle',) + group for group in groups])
+        self.position = {key: i for i, key in enumerate(self.order)}
+        self.traces = {}
+        for bidirectional, color, legendgroup, name in EDGE_CLASSES:
+            self.traces[('legend', bidirectional)] = (go.Scattergl if self.trace_mode == 'webgl' else go.Scatter)(
+                x=[None], y=[None], mode='lines', line={'color': color, 'width': 4}, name=name,
+                legendgroup=legendgroup, uid='legend-%s' % bidirectional).to_plotly_json()
+        self.update_traces(set(self.order) - set(self.traces))
+
+    def update_traces(self, keys):
+        '''
+        -keys: the keys of the traces to build again
+        '''
+        for group in {key[1:] for key in keys if key[0] in ('edges', 'arrows', 'middle')}:
+            self.traces.update(self.group_traces(group))
+        for key in keys:
+            if key[0] == 'nodes':
+                self.traces[key] = self.node_trace(key[1])
+
+    def group_traces(self, group):
+        '''
+        -group: an (is_bidirectional, bucket) group
+
+        Returns:
+        -the line, arrow and middle node traces of the edges of the group
+        '''
+        subset = self.edge_index.take(self.edge_index.group_rows(group))
+        if len(subset.weight):
+            #one level for the whole bucket, drawn with the mean weight of its edges
+            line = create_edge_traces(subset, self.coords, 1, render_mode=self.trace_mode)[0]
+            line.update(showlegend=False)
+            arrows = create_arrow_trace(subset, self.coords, render_mode=self.trace_mode)
+            middle = create_middle_trace(subset, self.node_labels, self.coords, render_mode=self.trace_mode, hover=self.hover)
+        else:
+            line, arrows, middle = (empty_trace(self.trace_mode) for _ in range(3))
+        traces = {}
+        for kind, trace in (('edges', line), ('arrows', arrows), ('middle', middle)):
+            key = (kind,) + tuple(group)
+            trace.update(uid='-'.join(map(str, key)))
+            traces[key] = trace.to_plotly_json()
+        return traces
+
+    def node_trace(self, color):
+        '''
+        -color: a node color
+
+        Returns:
+        -the trace of the active nodes with that color
+        '''
+        codes = np.flatnonzero(self.node_active & (self.colors == color))
+        traces = node_marker_traces(self.coords[codes], self.node_labels[codes], self.colors[codes], render_mode=self.trace_mode)
+        trace = traces[0] if traces else empty_trace(self.trace_mode)
+        trace.update(uid='nodes-%s' % color)
+        return trace.to_plotly_json()
+
+    def new_position(self, node_id):
+        '''
+        -node_id: the id of a new node
+
+        Returns:
+        -the position of the node, on the circle of the median distance of the nodes from their center, at an angle
+        derived from the id so that every process places the node at the same position
+        '''
+        coords = self.coords[self.node_active]
+        center = coords.mean(axis=0) if len(coords) else np.zeros(2)
+        radius = float(np.median(np.linalg.norm(coords - center, axis=1))) if len(coords) else 1.0
+        angle = 2*np.pi*(zlib.crc32(repr(node_id).encode())/2**32)
+        return center + (radius or 1.0)*np.array([np.cos(angle), np.sin(angle)])
+
+    def node_code(self, node_id, label=None, color=None):
+        '''
+        -node_id: the id of the node
+        -label, color: the label and the color of a new node
+
+        Returns:
+        -the code of the node, added to the graph and to the index if it is new or deleted
+        '''
+        code = self.codes.get(node_id)
+        if code is None:
+            code = self.edge_index.add_node(node_id)
+            self.codes[node_id] = code
+            self.node_labels = np.append(self.node_labels, np.array([None], dtype=object))
+            self.colors = np.append(self.colors, np.array([None], dtype=object))
+            self.coords = np.vstack([self.coords, self.new_position(node_id)])
+            self.node_active = np.append(self.node_active, False)
+        if not self.node_active[code]:
+            self.node_active[code] = True
+            self.node_labels[code] = label if label is not None else 'N%s' % node_id
+            self.colors[code] = color if color is not None else UNKNOWN_COLOR
+            self.graph.add_node(node_id, node_label=self.node_labels[code], node_color=self.colors[code])
+        return code
+
+    def apply_edge(self, change, rows, groups):
+        '''
+        -change: an edge change
+        -rows, groups: the sets of the changed rows and of the groups they were in before the change, updated in place
+        '''
+        source, target = int(change['source_id']), int(change['target_id'])
+        index = self.edge_index
+        if change.get('op', 'upsert') == 'delete':
+            if source not in self.codes or target not in self.codes:
+                return
+            source_code, target_code = self.codes[source], self.codes[target]
+            touched = index.touched(source_code, target_code)
+            groups |= index.groups(touched)
+            index.delete(source_code, target_code)
+            if self.graph.has_edge(source, target):
+                self.graph.remove_edge(source, target)
+        else:
+            weight = float(change['weights'])
+            source_code, target_code = self.node_code(source), self.node_code(target)
+            groups |= index.groups(index.touched(source_code, target_code))
+            index.upsert(source_code, target_code, weight)
+            touched = index.touched(source_code, target_code)
+            self.graph.add_edge(source, target, weights=weight)
+        rows |= touched
+
+    def apply_node(self, change, rows, groups, colors):
+        '''
+        -change: a node change
+        -rows, groups, colors: the sets of the changed rows, of the changed groups and of the changed node colors,
+        updated in place
+        '''
+        node_id = int(change['node_id'])
+        code = self.codes.get(node_id)
+        index = self.edge_index
+        if code is not None and self.node_active[code]:
+            colors.add(self.colors[code])
+        if change.get('op', 'upsert') == 'delete':
+            if code is None or not self.node_active[code]:
+                return
+            for row in index.node_rows(code).tolist():
+                source_code, target_code = int(index.source_code[row]), int(index.target_code[row])
+                groups |= index.groups(index.touched(source_code, target_code))
+                rows |= index.touched(source_code, target_code)
+                index.delete(source_code, target_code)
+            self.node_active[code] = False
+            self.graph.remove_node(node_id)
+            return
+        code = self.node_code(node_id, change.get('node_label'), change.get('node_color'))
+        self.node_labels[code] = change.get('node_label', self.node_labels[code])
+        self.colors[code] = change.get('node_color', self.colors[code])
+        self.graph.nodes[node_id].update(node_label=self.node_labels[code], node_color=self.colors[code])
+        colors.add(self.colors[code])
+        if self.hover == 'embedded': #the hover text of the edges of the node shows its label
+            groups |= index.groups(index.node_rows(code))
+
+    def apply(self, changes):
+        '''
+        -changes: list of changes, see the module docstring
+
+        Returns:
+        -the keys of the traces that changed, or None if the order or the type of the traces changed (a new node color,
+        or a number of edges that changes the render mode)
+        The changes that can't be applied (missing or invalid fields) are skipped and logged.
+        '''
+        rows, groups, colors = set(), set(), set()
+        for change in changes:
+            try:
+                if 'node_id' in change:
+                    self.apply_node(change, rows, groups, colors)
+                else:
+                    self.apply_edge(change, rows, groups)
+            except (KeyError, TypeError, ValueError) as error:
+                logger.warning('skipped the change %r: %r', change, error)
+        index = self.edge_index
+        if index.normalize(rows): #all the normalized weights changed, so all the buckets
+            groups |= {(bidirectional, bucket) for bidirectional, *_ in EDGE_CLASSES for bucket in range(index.n_buckets)}
+        rows = [row for row in rows if index.active[row]]
+        groups |= index.groups(rows)
+        for row in rows: #the ends of the changed edges may be new nodes
+            colors.add(self.colors[index.source_code[row]])
+            colors.add(self.colors[index.target_code[row]])
+        groups = {(bool(bidirectional), int(bucket)) for bidirectional, bucket in groups}
+        if not colors <= set(self.color_order) or choose_render_mode(len(index), self.render_mode) != self.trace_mode:
+            return None
+        return self.group_keys(groups) | {('nodes', color) for color in colors}
+
+    def poll(self):
+        '''
+        Reads and applies the new changes of the feed and builds the traces they changed.
+
+        Returns:
+        -the version of the network
+        '''
+        with self.lock:
+            changes = self.feed.read()
+            if self.feed.position == self.version:
+                return self.version
+            keys = set()
+            if changes:
+                with span('live_update', changes=len(changes)):
+                    keys = self.apply(changes)
+                    if keys is None:
+                        self.rebuild()
+                    else:
+                        self.update_traces(keys)
+            self.history = (self.history + [(self.version, self.feed.position, keys)])[-LIVE_HISTORY:]
+            self.version = self.feed.position
+            return self.version
+
+    def changed_since(self, version):
+        '''
+        -version: the version of the network that a client has
+
+        Returns:
+        -the keys of the traces that changed since that version, or None if the client needs the whole figure.
+        The version may come from another process, which read the feed in other steps: the polls of this process that
+        end after it are merged, if the first of them starts at or before it.
+        '''
+        if version == self.version:
+            return set()
+        if version is None or version > self.version:
+            return None
+        polls = [(start, changed) for start, end, changed in self.history if end > version]
+        if not polls or polls[0][0] > version:
+            return None
+        keys = set()
+        for _, changed in polls:
+            if changed is None:
+                return None
+            keys |= changed
+        return keys
+
+    def figure(self):
+        '''
+        Returns:
+        -the whole live figure, as a plotly json dictionary
+        '''
+        with self.lock:
+            layout = create_layout_2d().to_plotly_json()
+            layout.update(uirevision='live', legend={'itemclick': False, 'itemdoubleclick': False})
+            return {'data': [self.traces[key] for key in self.order], 'layout': layout}
+
+    def update(self, version):
+        '''
+        -version: the version of the network that a client has
+
+        Returns:
+        -the update of the figure of the client: a Patch with the changed traces, or the whole figure when the client
+        is too far behind or the order of the traces changed
+        -the version of the network after the update
+        '''
+        with self.lock:
+            keys = self.changed_since(version)
+            if keys is None:
+                return self.figure(), self.version
+            patch = Patch()
+            for key in keys:
+                patch['data'][self.position[key]] = self.traces[key]
+            return patch, self.version
@@ -0,0 +1,288 @@
+'''
+Timing of the stages of the pipeline and of the requests of the app.
+
+The code to measure is wrapped in a named span (the span context manager or the timed decorator). Every span is
+-added to an in-memory histogram, served in the Prometheus text format by the /metrics route of the server, and
+-written as a structured (JSON) log line to the 'metrics' logger.
+
+The requests of the server are timed as well, which includes the serialization of the Dash callback responses.
+When the app is created with profiling=True, a single request can be profiled with cProfile or tracemalloc, by
+sending it with the header X-Profile: cpu|memory or by arming the profiler for the next request at /metrics/profile.
+'''
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+METRIC_PREFIX = 'network_app'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60) # upper bounds of the histograms, in seconds
+PROFILE_DIR = 'profiles'
+PROFILE_TOP = 30 # number of functions (cpu) or allocation lines (memory) kept in the profile summary
+
+#the kinds of spans, each one is a histogram of the Prometheus output
+METRICS = {'stage': 'Time spent in the stages of the pipeline.',
+           'callback': 'Time spent in the Dash callbacks.',
+           'request': 'Time spent in the requests of the server, until the response is returned.'}
+
+logger = logging.getLogger('metrics')
+
+_lock = threading.Lock()
+_histograms = {} # (metric, labels) -> [count per bucket..., count in +Inf bucket, sum]
+
+
+def observe(metric, seconds, **labels):
+    '''
+    -metric: the kind of the span, a key of METRICS
+    -seconds: the measured time
+    -labels: the labels of the span, for example its name
+
+    Adds the time to the histogram of the metric and labels and writes it as a log line.
+    '''
+    key = (metric, tuple(sorted((name, str(value)) for name, value in labels.items())))
+    bucket = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+    with _lock:
+        histogram = _histograms.setdefault(key, [0]*(len(BUCKETS) + 1) + [0.0])
+        histogram[bucket] += 1
+        histogram[-1] += seconds
+    logger.info(json.dumps(dict(labels, metric=metric, seconds=round(seconds, 6)), default=str))
+
+
+@contextmanager
+def span(name, metric='stage', **labels):
+    '''
+    -name: the name of the span
+    -metric: the kind of the span, a key of METRICS
+    -labels: more labels of the span
+
+    Times the code inside the with block. The label outcome is 'ok', or the name of the exception raised in the block.
+    '''
+    outcome = 'ok'
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as error:
+        outcome = type(error).__name__
+        raise
+    finally:
+        observe(metric, time.perf_counter() - start, name=name, outcome=outcome, **labels)
+
+
+def timed(name, metric='stage'):
+    '''
+    -name: the name of the span
+    -metric: the kind of the span, a key of METRICS
+
+    Returns:
+    -a decorator that times every call of the function in a span
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, metric):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def label_text(labels):
+    '''
+    -labels: tuple with the (name, value) pairs of the labels
+
+    Returns:
+    -the labels in the Prometheus format, name="value" separated by commas
+    '''
+    return ','.join('%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for name, value in labels)
+
+
+def render_prometheus():
+    '''
+    Returns:
+    -the histograms of all the spans in the Prometheus text exposition format
+    '''
+    with _lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+    lines = []
+    for metric, help_text in METRICS.items():
+        name = '%s_%s_seconds' % (METRIC_PREFIX, metric)
+        lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s histogram' % name]
+        for (kind, labels), values in sorted(histograms.items()):
+            if kind != metric:
+                continue
+            cumulative = 0
+            for bound, count in zip([str(bound) for bound in BUCKETS] + ['+Inf'], values[:-1]):
+                cumulative += count
+                lines.append('%s_bucket{%s} %d' % (name, label_text(labels + (('le', bound),)), cumulative))
+            lines.append('%s_sum{%s} %r' % (name, label_text(labels), values[-1]))
+            lines.append('%s_count{%s} %d' % (name, label_text(labels), cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    '''
+    Removes all the recorded spans.
+    '''
+    with _lock:
+        _histograms.clear()
+
+
+class RequestProfiler:
+    '''
+    Opt-in cProfile or tracemalloc profile of single requests.
+
+    A request is profiled when it has the header X-Profile: cpu|memory, or when the profiler was armed with arm()
+    and the path of the request starts with the armed path prefix. The profile is written in profile_dir
+    (a .prof file for cpu, a text summary for memory) and its summary is written to the log.
+    '''
+
+    def __init__(self, profile_dir=PROFILE_DIR):
+        self.profile_dir = profile_dir
+        self._armed = None # (mode, path prefix) of the next request to profile
+        self._active = False # only one request is profiled at a time
+        self._lock = threading.Lock()
+
+    def arm(self, mode, path_prefix='/'):
+        '''
+        -mode: 'cpu' or 'memory'
+        -path_prefix: the next request with a path starting with the prefix is profiled
+        '''
+        with self._lock:
+            self._armed = (mode, path_prefix)
+
+    def mode(self, path, header):
+        '''
+        -path: the path of the request
+        -header: the value of the X-Profile header, or None
+
+        Returns:
+        -'cpu', 'memory' or None if the request is not profiled
+        '''
+        with self._lock:
+            if self._active:
+                return None
+            if header in ('cpu', 'memory'):
+                mode = header
+            elif self._armed and path.startswith(self._armed[1]):
+                mode, self._armed = self._armed[0], None
+            else:
+                return None
+            self._active = True
+            return mode
+
+    def start(self, mode):
+        '''
+        -mode: 'cpu' or 'memory'
+
+        Returns:
+        -the running cProfile profile for cpu, None for memory
+        Called after mode returned the mode, stop must follow.
+        '''
+        if mode == 'cpu':
+            profile = cProfile.Profile()
+            profile.enable()
+            return profile
+        tracemalloc.start()
+        return None
+
+    def stop(self, mode, profile, path):
+        '''
+        -mode: 'cpu' or 'memory'
+        -profile: the value returned by start
+        -path: the path of the request, used in the name of the file
+
+        Returns:
+        -the path of the written profile
+        The profiler is released even when the profile can't be written, so the next requests can be profiled.
+        '''
+        if mode == 'cpu':
+            profile.disable()
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            stem = os.path.join(self.profile_dir, '%s-%s-%s' % (time.strftime('%Y%m%d-%H%M%S'), mode,
+                                                                re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_') or 'root'))
+            if mode == 'cpu':
+                profile.dump_stats(stem + '.prof')
+                summary = io.StringIO()
+                pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP)
+                output, text = stem + '.prof', summary.getvalue()
+            else:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                text = 'peak: %d bytes\n' % peak + '\n'.join(str(stat) for stat in snapshot.statistics('lineno')[:PROFILE_TOP])
+                output = stem + '.txt'
+                with open(output, 'w') as f:
+                    f.write(text)
+        finally:
+            if mode == 'memory':
+                tracemalloc.stop()
+            with self._lock:
+                self._active = False
+        logger.info(json.dumps({'metric': 'profile', 'mode': mode, 'path': path, 'file': output}))
+        logger.debug(text)
+        return output
+
+
+def register_metrics_routes(server, profiling=False, profile_dir=PROFILE_DIR):
+    '''
+    -server: the flask server of the dash app
+    -profiling: True to allow the profiling of single requests, see RequestProfiler
+    -profile_dir: the folder of the profiles
+
+    Adds the /metrics route with the Prometheus text of the spans and times every request of the server.
+    With profiling, /metrics/profile?mode=cpu|memory&path=<prefix> arms the profiler for the next request
+    whose path starts with the prefix (by default the next Dash callback).
+    '''
+    from flask import Response, abort, g, jsonify, request
+
+    profiler = RequestProfiler(profile_dir) if profiling else None
+
+    @server.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_profile = None
+        if profiler is not None and request.path != '/metrics/profile':
+            mode = profiler.mode(request.path, request.headers.get('X-Profile'))
+            if mode is not None:
+                g.metrics_profile = (mode, profiler.start(mode))
+
+    @server.after_request
+    def stop_request_timer(response):
+        if getattr(g, 'metrics_profile', None) is not None:
+            (mode, profile), g.metrics_profile = g.metrics_profile, None
+            response.headers['X-Profile-File'] = profiler.stop(mode, profile, request.path)
+        if hasattr(g, 'metrics_start'):
+            #the rule rather than the path, so the urls with parameters don't create a label per value
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            observe('request', time.perf_counter() - g.metrics_start, route=route, method=request.method,
+                    status=response.status_code)
+        return response
+
+    @server.teardown_request
+    def stop_profiler(error):
+        #the after_request hooks are skipped when the request raises, the profile of such a request is still written
+        if getattr(g, 'metrics_profile', None) is not None:
+            (mode, profile), g.metrics_profile = g.metrics_profile, None
+            profiler.stop(mode, profile, request.path)
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    @server.route('/metrics/profile')
+    def arm_profiler():
+        mode = request.args.get('mode', 'cpu')
+        if profiler is None or mode not in ('cpu', 'memory'):
+            abort(404)
+        path = request.args.get('path', '/_dash-update-component')
+        profiler.arm(mode, path)
+        return jsonify({'armed': mode, 'path': path})
+
+    return metrics
@@ -0,0 +1,260 @@
+'''
+Importing the data and creating the network.
+
+A dataset is either
+-an excel workbook with two sheets, 'edges' and 'nodes', or
+-a folder with an edges and a nodes file, each one in csv, parquet or arrow (feather) format.
+The edges have the columns source_id, target_id and weights and the nodes the columns node_id, node_label and node_color. 
+Only these columns are read, with the dtypes of EDGE_SCHEMA and NODE_SCHEMA.
+
+The workbook is opened once and, if pyarrow is installed, converted on the first read to a parquet sidecar 
+folder next to it (<workbook>.parquet), so the next starts load memory-mapped parquet files instead of parsing the workbook.
+'''
+import hashlib
+import importlib.util
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+import networkx as nx
+import pandas as pd
+
+from edge_index import EdgeIndex
+from metrics import span, timed
+
+DATASET_PATH = 'raan_case_study interns.xlsx'
+
+EDGE_SCHEMA = {'source_id': 'int64', 'target_id': 'int64', 'weights': 'float64'}
+NODE_SCHEMA = {'node_id': 'int64', 'node_label': 'str', 'node_color': 'str'}
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+TABLE_EXTENSIONS = ('.parquet', '.arrow', '.feather', '.csv') # in order of preference inside a dataset folder
+SIDECAR_SUFFIX = '.parquet'
+
+#everything that is derived from one dataset and is needed for the figures
+Network = namedtuple('Network', ['edges', 'nodes', 'graph', 'edge_index', 'node_labels'])
+
+_hashes = {} # path -> (modification time, size, content hash) of its latest version, so unchanged files are not read again
+
+
+def file_hash(path):
+    '''
+    -path: the path of a file
+
+    Returns:
+    -the sha256 hex digest of the content of the file
+    The digest of the latest version of every path is remembered with its modification time and size, so the file
+    is read only when it changes, and a file that changes often keeps one entry.
+    '''
+    stat = os.stat(path)
+    path = os.path.abspath(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _hashes.get(path)
+    if cached is None or cached[:2] != version:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        cached = _hashes[path] = version + (digest.hexdigest(),)
+    return cached[2]
+
+
+def dataset_hash(path):
+    '''
+    -path: the path of the dataset, a workbook or a folder with an edges and a nodes file
+
+    Returns:
+    -the sha256 hex digest of the content of the dataset
+    '''
+    if not os.path.isdir(path):
+        return file_hash(path)
+    digest = hashlib.sha256()
+    for table in ('edges', 'nodes'):
+        table_path = table_file(path, table)
+        digest.update(os.path.basename(table_path).encode() + file_hash(table_path).encode())
+    return digest.hexdigest()
+
+
+def table_file(folder, table):
+    '''
+    -folder: the folder of the dataset
+    -table: 'edges' or 'nodes'
+
+    Returns:
+    -the path of the file of the table, the first of TABLE_EXTENSIONS that exists
+    '''
+    for extension in TABLE_EXTENSIONS:
+        path = os.path.join(folder, table + extension)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError('no %s file (%s) in %s' % (table, ', '.join(TABLE_EXTENSIONS), folder))
+
+
+def check_columns(columns, schema, source):
+    '''
+    -columns: the columns found in the file
+    -schema: a dictionary with the required columns and their dtypes
+    -source: the name of the file or sheet, for the error message
+
+    Raises a ValueError if a required column is missing.
+    '''
+    missing = [column for column in schema if column not in set(columns)]
+    if missing:
+        raise ValueError('%s is missing the columns %s' % (source, ', '.join(missing)))
+
+
+def apply_schema(frame, schema, source):
+    '''
+    -frame: a dataframe with (at least) the columns of the schema
+    -schema: a dictionary with the required columns and their dtypes
+    -source: the name of the file or sheet, for the error message
+
+    Returns:
+    -the dataframe with only the columns of the schema, in the dtypes of the schema
+    '''
+    check_columns(frame.columns, schema, source)
+    frame = frame[list(schema)]
+    try:
+        return frame.astype(schema)
+    except (TypeError, ValueError) as error:
+        raise ValueError('%s does not match the schema %s: %s' % (source, schema, error))
+
+
+def read_table(path, schema):
+    '''
+    -path: the path of a csv, parquet or arrow file
+    -schema: a dictionary with the required columns and their dtypes
+
+    Returns:
+    -the dataframe with the columns of the schema. Only these columns are read from the file, 
+    and the parquet and arrow files are memory-mapped.
+    '''
+    columns = list(schema)
+    if path.endswith('.csv'):
+        frame = pd.read_csv(path, usecols=lambda column: column in schema, dtype=schema)
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        check_columns(pq.read_schema(path).names, schema, path)
+        frame = pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    else:
+        import pyarrow.feather as feather
+        frame = feather.read_table(path, memory_map=True)
+        check_columns(frame.column_names, schema, path)
+        frame = frame.select(columns).to_pandas()
+    return apply_schema(frame, schema, path)
+
+
+def read_workbook(path):
+    '''
+    -path: the path of the excel workbook
+
+    Returns:
+    -the edges dataframe
+    -the nodes dataframe
+    The workbook is opened and parsed once for both sheets, reading only the columns of the schemas.
+    '''
+    with pd.ExcelFile(path) as book:
+        tables = []
+        for sheet, schema in (('edges', EDGE_SCHEMA), ('nodes', NODE_SCHEMA)):
+            frame = book.parse(sheet, usecols=lambda column: column in schema)
+            tables.append(apply_schema(frame, schema, '%s[%s]' % (path, sheet)))
+    return tables[0], tables[1]
+
+
+def read_sidecar(path):
+    '''
+    -path: the path of the excel workbook
+
+    Returns:
+    -the edges and nodes dataframes from the parquet sidecar of the workbook, or None if there is no 
+    sidecar, it was made from a different version of the workbook or pyarrow is not installed
+    '''
+    folder = path + SIDECAR_SUFFIX
+    source_file = os.path.join(folder, 'source.sha256')
+    if importlib.util.find_spec('pyarrow') is None or not os.path.exists(source_file):
+        return None
+    with open(source_file) as f:
+        if f.read().strip() != file_hash(path):
+            return None
+    return (read_table(os.path.join(folder, 'edges.parquet'), EDGE_SCHEMA),
+            read_table(os.path.join(folder, 'nodes.parquet'), NODE_SCHEMA))
+
+
+def write_sidecar(path, edges, nodes):
+    '''
+    -path: the path of the excel workbook
+    -edges: the edges dataframe
+    -nodes: the nodes dataframe
+
+    Writes the parquet sidecar of the workbook. It is written in a temporary folder and renamed, 
+    and skipped when pyarrow is not installed or the folder of the workbook is not writable.
+    '''
+    if importlib.util.find_spec('pyarrow') is None:
+        return
+    folder = path + SIDECAR_SUFFIX
+    tmp = None
+    try:
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+        edges.to_parquet(os.path.join(tmp, 'edges.parquet'), index=False)
+        nodes.to_parquet(os.path.join(tmp, 'nodes.parquet'), index=False)
+        with open(os.path.join(tmp, 'source.sha256'), 'w') as f:
+            f.write(file_hash(path))
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp, folder)
+    except OSError:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+@timed('read_dataset')
+def read_dataset(path):
+    '''
+    -path: the path of the dataset, a workbook or a folder with an edges and a nodes file
+
+    Returns:
+    -the edges dataframe
+    -the nodes dataframe
+    '''
+    if os.path.isdir(path):
+        return read_table(table_file(path, 'edges'), EDGE_SCHEMA), read_table(table_file(path, 'nodes'), NODE_SCHEMA)
+    if not path.endswith(EXCEL_EXTENSIONS):
+        raise ValueError('unsupported dataset %s, expected a workbook (%s) or a folder' % (path, ', '.join(EXCEL_EXTENSIONS)))
+    tables = read_sidecar(path)
+    if tables is None:
+        tables = read_workbook(path)
+        write_sidecar(path, *tables)
+    return tables
+
+
+def build_network(edges, nodes, include_isolated=False):
+    '''
+    -edges: the edges dataframe
+    -nodes: the nodes dataframe
+    -include_isolated: True to add to the graph also the nodes without edges
+
+    Returns:
+    -the Network with the directed graph, the columnar edge index and the node labels in the order of the index nodes
+    '''
+    with span('from_pandas_edgelist'):
+        Gr_dir = nx.from_pandas_edgelist(edges, 'source_id', 'target_id', edge_attr=True, create_using=nx.DiGraph()) #directed graph
+        if include_isolated:
+            Gr_dir.add_nodes_from(nodes['node_id'])
+    with span('set_node_attributes'):
+        atribs = nodes.set_index('node_id').to_dict('index')
+        nx.set_node_attributes(Gr_dir, atribs)
+    #the columnar edge index holds the weights, the normalized weights and the bidirectional edges, computed once
+    with span('edge_index'):
+        edge_index = EdgeIndex.from_frame(edges, node_ids=list(Gr_dir.nodes))
+    node_labels = nodes.set_index('node_id')['node_label'].reindex(edge_index.node_ids).to_numpy()
+    return Network(edges, nodes, Gr_dir, edge_index, node_labels)
+
+
+def load_network(path):
+    '''
+    -path: the path of the dataset
+
+    Returns:
+    -the Network built from the dataset
+    '''
+    edges, nodes = read_dataset(path)
+    return build_network(edges, nodes)
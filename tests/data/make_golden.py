@@ -0,0 +1,62 @@
+'''
+Writes the golden figures of the small dataset with the figure code of the original app.
+
+The 2-d and 3-d figures of the first version of final_app.py (one trace per edge and per node) are built from
+the small dataset and written as JSON, without the plotly template. tests/test_golden_figures.py compares the
+figures of the figures module with them. Run it again only if the small dataset changes, from the root of the repository:
+
+    python tests/data/make_golden.py
+'''
+import io
+import json
+import os
+import subprocess
+import tempfile
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+BASELINE = '72e61e5' # the commit of the original app
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET = os.path.join(DATA_DIR, 'small')
+
+
+def baseline_figures():
+    '''
+    Returns:
+    -the 2-d and 3-d figures of the original app, built from the small dataset
+    '''
+    source = subprocess.run(['git', 'show', BASELINE + ':final_app.py'], check=True, capture_output=True, text=True,
+                            cwd=DATA_DIR).stdout
+    #the part of the module that reads the workbook and builds the two figures, without the dash app
+    code = source[source.index('#### Importing the data ####'):source.index('fig3d.write_html(buffer3d)')]
+    nodes = pd.read_csv(os.path.join(DATASET, 'nodes.csv'))
+    nodes['Unnamed: 3'] = np.nan #the empty column of the case study workbook, dropped by the original app
+    with tempfile.TemporaryDirectory() as folder:
+        with pd.ExcelWriter(os.path.join(folder, 'raan_case_study interns.xlsx')) as writer:
+            pd.read_csv(os.path.join(DATASET, 'edges.csv')).to_excel(writer, sheet_name='edges', index=False)
+            nodes.to_excel(writer, sheet_name='nodes', index=False)
+        namespace = {'pd': pd, 'np': np, 'nx': nx, 'go': go, 'io': io,
+                     'buffer2d': io.StringIO(), 'buffer3d': io.StringIO()}
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            exec(code, namespace)
+        finally:
+            os.chdir(cwd)
+    return namespace['fig_2d'], namespace['fig3d']
+
+
+def main():
+    for name, fig in zip(('golden_2d.json', 'golden_3d.json'), baseline_figures()):
+        spec = fig.to_plotly_json()
+        spec['layout'].pop('template', None)
+        with open(os.path.join(DATA_DIR, name), 'w') as f:
+            json.dump(spec, f, cls=PlotlyJSONEncoder, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
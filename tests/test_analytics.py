@@ -0,0 +1,51 @@
+'''
+The sparse PageRank of the analytics tab, against networkx, and the highlighted nodes and paths.
+'''
+import os
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from analytics import GraphAnalytics, adjacency_matrix, highlight_traces, node_codes, pagerank
+from edge_index import EdgeIndex
+from network_data import load_network
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'small')
+
+
+def networkx_pagerank(graph, node_ids):
+    ranks = nx.pagerank(graph, weight='weights', tol=1e-12, max_iter=1000)
+    return np.array([ranks[node] for node in node_ids])
+
+
+def test_pagerank_of_the_small_dataset():
+    network = load_network(DATASET)
+    index = network.edge_index
+    assert np.allclose(pagerank(adjacency_matrix(index)), networkx_pagerank(network.graph, index.node_ids), atol=1e-8)
+
+
+def test_pagerank_with_dangling_and_isolated_nodes():
+    rng = np.random.default_rng(0)
+    graph = nx.gnp_random_graph(300, 0.02, directed=True, seed=1)
+    graph.add_nodes_from([300, 301]) #isolated nodes
+    edges = pd.DataFrame([(s, t, rng.integers(1, 10)) for s, t in graph.edges], columns=['source_id', 'target_id', 'weights'])
+    nx.set_edge_attributes(graph, {(s, t): w for s, t, w in edges.itertuples(index=False)}, 'weights')
+    index = EdgeIndex.from_frame(edges, node_ids=list(graph.nodes))
+    ranks = pagerank(adjacency_matrix(index))
+    assert np.isclose(ranks.sum(), 1)
+    assert np.allclose(ranks, networkx_pagerank(graph, index.node_ids), atol=1e-8)
+
+
+def test_codes_that_are_not_nodes_are_not_highlighted():
+    network = load_network(DATASET)
+    index = network.edge_index
+    analytics = GraphAnalytics(index)
+    n_nodes = len(index.node_ids)
+    assert node_codes([0, n_nodes - 1, n_nodes, -1, '2', None, True], n_nodes) == [0, n_nodes - 1]
+    assert analytics.shortest_path(0, n_nodes) == ([], np.inf)
+    assert analytics.shortest_path(-1, 0) == ([], np.inf)
+    pos = np.zeros((n_nodes, 2))
+    assert highlight_traces('2d', pos, network.node_labels, [n_nodes + 5], [0, n_nodes + 5]) == []
+    traces = highlight_traces('2d', pos, network.node_labels, [0, n_nodes], [0, 1])
+    assert [trace['mode'] for trace in traces] == ['lines', 'markers'] and len(traces[1]['x']) == 1
@@ -0,0 +1,54 @@
+'''
+The artifact: the arrays and figures read back from the file, and the artifacts that the app must not use.
+'''
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from artifacts import artifact_options, build_artifact, open_artifact
+from figures import HOVER_MODE, RENDER_MODE
+from network_data import load_network
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'small')
+OPTIONS = artifact_options(RENDER_MODE, 'auto', 'auto', HOVER_MODE)
+
+
+@pytest.fixture(scope='module')
+def built(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('artifact')
+    dataset = str(folder/'small')
+    shutil.copytree(DATASET, dataset)
+    path = str(folder/'network.artifact')
+    build_artifact(dataset, path, layout_cache_dir=None)
+    return dataset, path
+
+
+def test_round_trip(built):
+    dataset, path = built
+    artifact = open_artifact(path, dataset, OPTIONS)
+    assert artifact is not None
+    network = load_network(dataset)
+    index, read = network.edge_index, artifact.edge_index()
+    for name in ('source_code', 'target_code', 'weight', 'norm_weight', 'is_bidirectional', 'reverse', 'reverse_weight'):
+        assert np.array_equal(getattr(read, name), getattr(index, name)), name
+    assert read.node_ids.tolist() == index.node_ids.tolist()
+    assert artifact.node_labels().tolist() == list(network.node_labels)
+    assert artifact.positions('2d').shape == (len(index.node_ids), 2)
+    assert artifact.positions('3d').shape == (len(index.node_ids), 3)
+    assert artifact.figure('2d') == json.loads(artifact.blob('figure_2d').tobytes())
+    assert bytes(artifact.export('3d', 'cdn')).lstrip().startswith(b'<html')
+
+
+def test_other_options_are_not_used(built):
+    dataset, path = built
+    assert open_artifact(path, dataset, dict(OPTIONS, weight_buckets=3)) is None
+
+
+def test_changed_dataset_is_not_used(built):
+    dataset, path = built
+    with open(os.path.join(dataset, 'edges.csv'), 'a') as f:
+        f.write('950,951,1\n')
+    assert open_artifact(path, dataset, OPTIONS) is None
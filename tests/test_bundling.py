@@ -0,0 +1,48 @@
+'''
+The edge bundles: every edge is still drawn from its source to its target, and the cache.
+'''
+import os
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from bundling import bundle_edges, cached_bundles
+from layouts import compute_layout
+from network_data import load_network
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'small')
+
+
+@pytest.fixture(scope='module')
+def network():
+    return load_network(DATASET)
+
+
+def segment_graph(bundles, is_bidirectional):
+    graph = nx.Graph()
+    rows = np.flatnonzero(bundles.is_bidirectional == is_bidirectional)
+    graph.add_edges_from(zip(map(tuple, bundles.start[rows].round(9)), map(tuple, bundles.end[rows].round(9))))
+    return graph
+
+
+@pytest.mark.parametrize('dim, levels', [(2, None), (3, None), (2, (4, 2, 1))])
+def test_the_bundled_paths_keep_the_ends_of_every_edge(network, dim, levels):
+    index = network.edge_index
+    coords = index.positions(compute_layout(network.graph, dim, 'force', None))
+    bundles = bundle_edges(index, coords, levels)
+    graphs = {is_bidirectional: segment_graph(bundles, is_bidirectional) for is_bidirectional in (False, True)}
+    for source, target, is_bidirectional in zip(index.source_code, index.target_code, index.is_bidirectional):
+        graph = graphs[bool(is_bidirectional)]
+        ends = tuple(coords[source].round(9)), tuple(coords[target].round(9))
+        assert all(end in graph for end in ends)
+        assert nx.has_path(graph, *ends)
+
+
+def test_cached_bundles_are_read_back(network, tmp_path):
+    pos = compute_layout(network.graph, 2, 'radial', None)
+    bundles = cached_bundles(network.edge_index, pos, cache_dir=str(tmp_path), dataset=DATASET)
+    cached = cached_bundles(network.edge_index, pos, cache_dir=str(tmp_path), dataset=DATASET)
+    assert len(os.listdir(str(tmp_path))) == 1
+    for name in bundles._fields:
+        np.testing.assert_array_equal(getattr(bundles, name), getattr(cached, name))
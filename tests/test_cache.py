@@ -0,0 +1,31 @@
+'''
+The LRU cache of the app.
+'''
+from cache import LRUCache
+
+
+def test_get_or_build_builds_a_key_once():
+    cache = LRUCache(2)
+    calls = []
+    build = lambda: calls.append('a') or len(calls)
+    assert cache.get_or_build('a', build) == 1
+    assert cache.get_or_build('a', build) == 1
+    assert calls == ['a']
+    assert 'a' in cache and len(cache) == 1
+
+
+def test_the_least_recently_used_key_is_evicted():
+    cache = LRUCache(2)
+    cache.get_or_build('a', lambda: 1)
+    cache.get_or_build('b', lambda: 2)
+    cache.get_or_build('a', lambda: 0) #'a' is now the most recently used
+    cache.get_or_build('c', lambda: 3)
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.get_or_build('b', lambda: 4) == 4
+
+
+def test_clear():
+    cache = LRUCache()
+    cache.get_or_build('a', lambda: 1)
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,89 @@
+'''
+The download route of the html exports: the encodings, the ETags and the plotly.js variants.
+'''
+import gzip
+import os
+import types
+
+import pytest
+from flask import Flask
+
+import downloads
+from cache import LRUCache
+from downloads import register_download_routes
+from final_app import create_app
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'small')
+
+
+@pytest.fixture
+def exports():
+    built = []
+
+    def get_export(kind, variant):
+        def build():
+            built.append((kind, variant))
+            return ('<html>%s %s</html>' % (kind, variant)).encode()*1000
+        return ('dataset', kind, variant), build
+
+    server = Flask(__name__)
+    register_download_routes(server, get_export, LRUCache(8))
+    return server.test_client(), built
+
+
+@pytest.fixture
+def fake_brotli(monkeypatch):
+    #brotli is optional, a stand-in checks that it is chosen and used
+    monkeypatch.setattr(downloads, 'brotli', types.SimpleNamespace(compress=lambda body, quality: b'br' + body))
+
+
+@pytest.mark.parametrize('accept, encoding, decode', [
+    ('br, gzip', 'br', lambda data: data[2:]),
+    ('gzip, deflate', 'gzip', gzip.decompress),
+    ('', None, lambda data: data)])
+def test_the_export_is_sent_in_the_accepted_encoding(exports, fake_brotli, accept, encoding, decode):
+    client = exports[0]
+    response = client.get('/download/2d.html', headers={'Accept-Encoding': accept})
+    assert response.status_code == 200
+    assert response.headers.get('Content-Encoding') == encoding
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert decode(response.data) == b'<html>2d full</html>'*1000
+    assert response.headers['Content-Disposition'] == 'attachment; filename="2dvisualization.html"'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_gzip_without_brotli(exports, monkeypatch):
+    monkeypatch.setattr(downloads, 'brotli', None)
+    response = exports[0].get('/download/3d.html', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+
+def test_a_known_etag_gets_a_304_without_building_the_export(exports):
+    client, built = exports
+    etag = client.get('/download/2d.html?plotlyjs=cdn', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    assert built == [('2d', 'cdn')]
+    built.clear()
+    response = client.get('/download/2d.html?plotlyjs=cdn', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b'' and built == []
+    #another encoding has another ETag, and its body is encoded from the export
+    response = client.get('/download/2d.html?plotlyjs=cdn', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag and built == [('2d', 'cdn')]
+
+
+def test_unknown_exports(exports):
+    client = exports[0]
+    assert client.get('/download/4d.html').status_code == 404
+    assert client.get('/download/2d.html?plotlyjs=none').status_code == 404
+
+
+@pytest.mark.parametrize('variant', ['full', 'cdn'])
+def test_the_app_exports_with_both_plotlyjs_variants(variant):
+    client = create_app(DATASET, layout_cache_dir=None).server.test_client()
+    response = client.get('/download/2d.html?plotlyjs=%s' % variant, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    html = gzip.decompress(response.data).decode()
+    assert 'Alice' in html
+    assert ('<script src="https://cdn.plot.ly/' in html) == (variant == 'cdn')
+    assert len(html) > 1000000 if variant == 'full' else len(html) < 1000000
+    filename = '2dvisualization.html' if variant == 'full' else '2dvisualization_cdn.html'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="%s"' % filename
@@ -0,0 +1,44 @@
+'''
+The edge index: the repeated edges, the reverse edges and the subsets taken from it.
+'''
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from edge_index import EdgeIndex
+
+
+def test_repeated_edges_keep_the_last_weight_as_networkx():
+    edges = pd.DataFrame({'source_id': [1, 2, 1, 3], 'target_id': [2, 3, 2, 1], 'weights': [3, 4, 5, 6]})
+    index = EdgeIndex.from_frame(edges)
+    graph = nx.from_pandas_edgelist(edges, 'source_id', 'target_id', 'weights', create_using=nx.DiGraph())
+    assert len(index) == graph.number_of_edges() == 3
+    assert {(s, t): w for s, t, w in zip(index.source, index.target, index.weight)} == {
+        (s, t): w for s, t, w in graph.edges(data='weights')}
+
+
+def test_node_ids_keep_the_known_nodes_first():
+    edges = pd.DataFrame({'source_id': [5, 7], 'target_id': [6, 5], 'weights': [1, 2]})
+    index = EdgeIndex.from_frame(edges, node_ids=[6, 9])
+    assert index.node_ids.tolist() == [6, 9, 5, 7]
+    assert index.source.tolist() == [5, 7] and index.target.tolist() == [6, 5]
+
+
+def test_reciprocal_edges():
+    edges = pd.DataFrame({'source_id': [1, 2, 1, 3, 4], 'target_id': [2, 1, 3, 4, 3], 'weights': [2, 8, 4, 1, 3]})
+    index = EdgeIndex.from_frame(edges)
+    assert index.reverse.tolist() == [1, 0, -1, 4, 3]
+    assert index.is_bidirectional.tolist() == [True, True, False, True, True]
+    assert index.reverse_weight.tolist() == [8, 2, 0, 3, 1]
+    assert np.allclose(index.norm_weight, np.array([2, 8, 4, 1, 3])/8)
+
+
+def test_take_keeps_the_reverse_edges_inside_the_subset():
+    edges = pd.DataFrame({'source_id': [1, 2, 1, 3, 4], 'target_id': [2, 1, 3, 4, 3], 'weights': [2, 8, 4, 1, 3]})
+    index = EdgeIndex.from_frame(edges)
+    subset = index.take(np.array([1, 2, 3, 4]))
+    assert subset.reverse.tolist() == [-1, -1, 3, 2]
+    #the reciprocal status and the normalized weights are the ones of the whole graph
+    assert subset.is_bidirectional.tolist() == [True, False, True, True]
+    assert subset.norm_weight.tolist() == index.norm_weight[1:].tolist()
+    assert subset.ids.tolist() == [1, 2, 3, 4]
@@ -0,0 +1,85 @@
+'''
+The masks of the filters of the 2D and 3D figures, and the widths of the filtered edges.
+'''
+import os
+
+import numpy as np
+import pytest
+
+from filters import FilteredNetwork
+from network_data import load_network
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'small')
+
+
+@pytest.fixture(scope='module')
+def filtered():
+    network = load_network(DATASET)
+    colors = np.array([network.graph.nodes[node]['node_color'] for node in network.edge_index.node_ids], dtype=object)
+    return FilteredNetwork(network.edge_index, network.node_labels, colors,
+                           lambda kind: np.zeros((len(colors), int(kind[0]))))
+
+
+def test_weight_mask_keeps_the_bounds(filtered):
+    #the weights are 1 to 9, relative to the heaviest edge
+    weight = filtered.edge_index.weight
+    assert filtered.weight_mask((0.0, 1.0)).all()
+    assert np.array_equal(filtered.weight_mask((2/9, 5/9)), (weight >= 2) & (weight <= 5))
+    assert np.array_equal(filtered.weight_mask((0.6, 0.65)), np.zeros(len(weight), dtype=bool))
+
+
+def test_color_masks_keep_the_edges_with_both_ends_checked(filtered):
+    index = filtered.edge_index
+    nodes, edges = filtered.color_masks(('red', 'blue'))
+    assert np.array_equal(nodes, np.isin(filtered.node_colors, ['red', 'blue']))
+    assert np.array_equal(edges, nodes[index.source_code] & nodes[index.target_code])
+    assert not filtered.color_masks(())[1].any()
+
+
+def test_direction_masks(filtered):
+    bidirectional = filtered.edge_index.is_bidirectional
+    assert filtered.direction_mask('all').all()
+    assert np.array_equal(filtered.direction_mask('two-way'), bidirectional)
+    assert np.array_equal(filtered.direction_mask('one-way'), ~bidirectional)
+
+
+def test_selection_combines_the_masks(filtered):
+    index = filtered.edge_index
+    filters = filtered.filters([0.3, 1], ['red', 'green'], 'one-way')
+    rows, nodes = filtered.selection(filters)
+    expected = (filtered.weight_mask(filters.weight_range) & filtered.color_masks(filters.colors)[1]
+                & ~index.is_bidirectional)
+    assert rows.tolist() == np.flatnonzero(expected).tolist()
+    assert nodes.tolist() == np.flatnonzero(np.isin(filtered.node_colors, ['red', 'green'])).tolist()
+
+
+def test_default_filters(filtered):
+    assert filtered.is_default(filtered.filters())
+    assert filtered.is_default(filtered.filters([0, 1], list(reversed(filtered.categories)), 'all'))
+    assert not filtered.is_default(filtered.filters([0, 1], None, 'two-way'))
+
+
+@pytest.mark.parametrize('kind', ['2d', '3d'])
+def test_an_edge_has_the_same_width_in_every_filtered_figure(kind):
+    network = load_network(DATASET)
+    index = network.edge_index
+    colors = np.array([network.graph.nodes[node]['node_color'] for node in index.node_ids], dtype=object)
+    pos = np.random.default_rng(0).normal(size=(len(index.node_ids), int(kind[0])))
+    #fewer levels than distinct weights, so the levels are the means of the weights of the buckets
+    filtered = FilteredNetwork(index, network.node_labels, colors, lambda _: pos, n_buckets=3)
+
+    def width(spec, row):
+        start, end = pos[index.source_code[row]], pos[index.target_code[row]]
+        for trace in spec['data']:
+            if trace.get('mode') == 'lines':
+                x = list(trace['x'])
+                for i in range(0, len(x), 3):
+                    if x[i] == start[0] and x[i + 1] == end[0]:
+                        return trace['line']['width']
+        raise AssertionError('edge %d not drawn' % row)
+
+    full = filtered.figure_spec(kind, filtered.filters())
+    for filters in (filtered.filters([0.4, 1]), filtered.filters([0, 0.5]), filtered.filters([0, 1], None, 'one-way')):
+        spec = filtered.figure_spec(kind, filters)
+        for row in filtered.selection(filters)[0]:
+            assert width(spec, row) == width(full, row)
@@ -0,0 +1,94 @@
+'''
+The figures built by the figures module are the figures of the original app.
+
+The golden figures were built by the code of the first version of final_app.py, with one trace per edge and per node
+(see data/make_golden.py). The traces are grouped differently now, so the figures are compared as the sets of the
+drawn segments, markers, middle nodes and arrows with their styles, and the legend entries and layouts.
+'''
+import json
+import os
+
+import pytest
+
+from figures import figure_json, figure_spec_2d, figure_spec_3d
+from network_data import load_network
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def rounded(value):
+    return round(value, 9) if isinstance(value, float) else value
+
+
+def points(trace, axes):
+    '''
+    Returns:
+    -the points of the trace as tuples of coordinates, a None (the break between two lines) as None
+    '''
+    return [None if trace[axes[0]][i] is None else tuple(rounded(float(trace[axis][i])) for axis in axes)
+            for i in range(len(trace[axes[0]]))]
+
+
+def canonical(spec):
+    '''
+    -spec: the spec of a figure, as JSON types
+
+    Returns:
+    -the figure as sorted lists of segments, node markers, middle nodes and arrows, the legend entries and the layout
+    '''
+    axes = ('x', 'y', 'z') if spec['data'][0]['type'] == 'scatter3d' else ('x', 'y')
+    segments, nodes, middles = [], [], []
+    legend = set()
+    for trace in spec['data']:
+        if trace.get('showlegend', True):
+            legend.add((trace.get('legendgroup'), trace.get('name')))
+        if trace['mode'] == 'lines':
+            line = trace['line']
+            style = (rounded(line['width']), line['color'], line.get('shape'), rounded(trace['opacity']), trace['legendgroup'], trace['name'])
+            drawn = points(trace, axes)
+            segments += [(drawn[i], drawn[i + 1]) + style for i in range(0, len(drawn), 3)]
+        elif trace.get('opacity') == 0:
+            texts = trace['hovertext'] if isinstance(trace['hovertext'], list) else [trace['hovertext']]
+            middles += list(zip(points(trace, axes), texts))
+            marker = trace['marker']
+        else:
+            texts = trace['text'] if isinstance(trace['text'], list) else [trace['text']]*len(trace['x'])
+            style = (trace['marker']['symbol'], trace['marker']['size'], trace['marker']['color'], trace['legendgroup'],
+                     trace['name'], trace['hoverinfo'])
+            nodes += [(point, text) + style for point, text in zip(points(trace, axes), texts) if point is not None]
+    layout = dict(spec['layout'])
+    layout.pop('template', None)
+    arrows = sorted(tuple(sorted((key, rounded(value)) for key, value in arrow.items())) for arrow in layout.pop('annotations', []))
+    return {'segments': sorted(segments), 'nodes': sorted(nodes), 'middles': sorted(middles), 'middle_marker': marker,
+            'legend': legend, 'arrows': arrows, 'layout': layout}
+
+
+def positions(golden, network):
+    '''
+    Returns:
+    -the positions of the nodes in the golden figure, read from its node traces
+    '''
+    axes = ('x', 'y', 'z') if golden['data'][0]['type'] == 'scatter3d' else ('x', 'y')
+    node_of_label = dict(zip(network.node_labels, network.edge_index.node_ids))
+    return {node_of_label[trace['text']]: [trace[axis][0] for axis in axes]
+            for trace in golden['data'] if trace['mode'] == 'markers' and trace.get('opacity') != 0}
+
+
+@pytest.fixture(scope='module')
+def network():
+    return load_network(os.path.join(DATA_DIR, 'small'))
+
+
+@pytest.mark.parametrize('kind', ['2d', '3d'])
+def test_figure_matches_the_original_app(network, kind):
+    with open(os.path.join(DATA_DIR, 'golden_%s.json' % kind)) as f:
+        golden = json.load(f)
+    pos = positions(golden, network)
+    if kind == '2d':
+        spec = figure_spec_2d(network, pos, render_mode='svg', hover='embedded', template=False)
+    else:
+        spec = figure_spec_3d(network, pos, hover='embedded', template=False)
+    expected, actual = canonical(golden), canonical(json.loads(figure_json(spec)))
+    assert len(actual['segments']) == len(network.edge_index) == 16
+    for name in expected:
+        assert actual[name] == expected[name], name
@@ -0,0 +1,61 @@
+'''
+The cached layouts: the cache key of the datasets, the warm starts and the removal of the old files.
+'''
+import os
+
+import networkx as nx
+import numpy as np
+
+import layouts
+from layouts import cached_files, cached_layout, dataset_key, remove_old_files, write_layout
+
+
+def path_graph(nodes):
+    graph = nx.DiGraph()
+    nx.add_path(graph, nodes, weights=1.0)
+    return graph
+
+
+def recording(calls):
+    def compute(Gr_dir, initial):
+        calls.append(initial)
+        return {node: np.array([float(node), 0.0]) for node in Gr_dir.nodes}
+    return compute
+
+
+def test_warm_start_only_from_the_same_dataset(tmp_path):
+    calls = []
+    cache_dir = str(tmp_path)
+    cached_layout(path_graph(range(10)), 'force', recording(calls), cache_dir=cache_dir, warm_start=True, dataset='a.xlsx')
+    #another dataset with the same node ids is computed from scratch
+    cached_layout(path_graph(range(9, -1, -1)), 'force', recording(calls), cache_dir=cache_dir, warm_start=True, dataset='b.xlsx')
+    assert calls == [None, None]
+    cached_layout(path_graph(range(11)), 'force', recording(calls), cache_dir=cache_dir, warm_start=True, dataset='a.xlsx')
+    assert set(calls[-1]) == set(range(11))
+    #the unchanged graph reads its cached layout
+    cached_layout(path_graph(range(11)), 'force', recording(calls), cache_dir=cache_dir, warm_start=True, dataset='a.xlsx')
+    assert len(calls) == 3
+
+
+def test_old_files_are_removed_per_dataset(tmp_path):
+    prefixes = {dataset: os.path.join(str(tmp_path), 'force-params-%s-' % dataset_key(dataset)) for dataset in ('a.xlsx', 'b.xlsx')}
+    for n in range(5):
+        write_layout(prefixes['a.xlsx'] + '%d.npz' % n, {0: np.zeros(2)})
+        os.utime(prefixes['a.xlsx'] + '%d.npz' % n, (n, n))
+    write_layout(prefixes['b.xlsx'] + '0.npz', {0: np.zeros(2)})
+    remove_old_files(prefixes['a.xlsx'], keep=2)
+    assert cached_files(prefixes['a.xlsx']) == [prefixes['a.xlsx'] + '3.npz', prefixes['a.xlsx'] + '4.npz']
+    assert cached_files(prefixes['b.xlsx']) == [prefixes['b.xlsx'] + '0.npz']
+
+
+def test_files_removed_by_another_process_are_skipped(tmp_path, monkeypatch):
+    prefix = os.path.join(str(tmp_path), 'force-params-graph-')
+    for n in range(3):
+        write_layout(prefix + '%d.npz' % n, {0: np.zeros(2)})
+    listed = layouts.glob.glob(prefix + '*.npz') + [prefix + 'gone.npz']
+    monkeypatch.setattr(layouts.glob, 'glob', lambda pattern: listed)
+    assert prefix + 'gone.npz' not in cached_files(prefix)
+    remove = os.remove
+    monkeypatch.setattr(layouts.os, 'remove', lambda path: (remove(path), remove(path)))
+    remove_old_files(prefix, keep=1)
+    assert len(os.listdir(str(tmp_path))) == 1
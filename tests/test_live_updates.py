@@ -0,0 +1,118 @@
+'''
+The live updates: the change feed, the versions of the network and the updates sent to the clients.
+'''
+import json
+import os
+
+import pytest
+from dash import Patch
+
+import live_updates
+from layouts import compute_layout
+from live_updates import ChangeFeed, LiveNetwork
+from network_data import load_network
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'small')
+
+
+def append(path, *lines):
+    with open(path, 'a') as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line)) + '\n')
+
+
+@pytest.fixture(scope='module')
+def network():
+    return load_network(DATASET)
+
+
+@pytest.fixture(scope='module')
+def pos(network):
+    return compute_layout(network.graph, 2, 'radial', None)
+
+
+def test_feed_skips_the_bad_lines_and_keeps_the_others(tmp_path):
+    path = str(tmp_path/'changes.jsonl')
+    feed = ChangeFeed(path)
+    assert feed.read() == []
+    append(path, {'op': 'delete', 'source_id': 1, 'target_id': 2}, '{"op": "upsert", "source_id"', '[1, 2]', '',
+           {'op': 'delete', 'node_id': 3})
+    with open(path, 'a') as f:
+        f.write('{"op": "delete", "node_id": 4}') #not complete yet
+    assert feed.read() == [{'op': 'delete', 'source_id': 1, 'target_id': 2}, {'op': 'delete', 'node_id': 3}]
+    assert feed.position == feed.offset == os.path.getsize(path) - len('{"op": "delete", "node_id": 4}')
+    with open(path, 'a') as f:
+        f.write('\n')
+    assert feed.read() == [{'op': 'delete', 'node_id': 4}]
+    assert feed.position == os.path.getsize(path)
+
+
+def test_csv_feed(tmp_path):
+    path = str(tmp_path/'changes.csv')
+    append(path, 'op,source_id,target_id,weights', 'upsert,1,2,3', 'upsert,1,2,3,4,5', 'delete,2,1,')
+    assert ChangeFeed(path).read() == [{'op': 'upsert', 'source_id': '1', 'target_id': '2', 'weights': '3'},
+                                       {'op': 'delete', 'source_id': '2', 'target_id': '1'}]
+
+
+def test_bad_lines_do_not_lose_the_changes_of_the_poll(tmp_path, network, pos):
+    path = str(tmp_path/'changes.jsonl')
+    live = LiveNetwork(network, pos, ChangeFeed(path))
+    append(path, {'op': 'upsert', 'source_id': 950, 'target_id': 951, 'weights': 2}, 'not json', '"text"',
+           {'op': 'upsert', 'source_id': 950}, {'op': 'delete', 'source_id': 966, 'target_id': 950})
+    assert live.poll() == os.path.getsize(path)
+    assert live.graph.has_edge(950, 951) and not live.graph.has_edge(966, 950)
+    assert len(live.edge_index) == len(network.edge_index)
+
+
+def test_versions_are_the_same_in_every_process(tmp_path, network, pos):
+    path = str(tmp_path/'changes.jsonl')
+    first, second = LiveNetwork(network, pos, ChangeFeed(path)), LiveNetwork(network, pos, ChangeFeed(path))
+    append(path, {'op': 'upsert', 'source_id': 950, 'target_id': 966, 'weights': 4})
+    version = first.poll()
+    append(path, {'op': 'upsert', 'source_id': 952, 'target_id': 951, 'weights': 9})
+    assert first.poll() == second.poll() == os.path.getsize(path)
+    #the second process read both changes in one poll, which covers the version of the first one
+    assert second.changed_since(version) >= first.changed_since(version) != set()
+    assert second.changed_since(second.version) == set()
+    assert second.changed_since(None) is None
+    assert second.changed_since(second.version + 1) is None
+
+
+def test_clients_too_far_behind_get_the_whole_figure(tmp_path, network, pos, monkeypatch):
+    monkeypatch.setattr(live_updates, 'LIVE_HISTORY', 2)
+    path = str(tmp_path/'changes.jsonl')
+    live = LiveNetwork(network, pos, ChangeFeed(path))
+    versions = []
+    for weight in (1, 2, 3):
+        append(path, {'op': 'upsert', 'source_id': 950, 'target_id': 966, 'weights': weight})
+        versions.append(live.poll())
+    assert live.changed_since(versions[0]) is not None
+    assert live.changed_since(0) is None
+
+
+def test_update_sends_the_changed_traces(tmp_path, network, pos):
+    path = str(tmp_path/'changes.jsonl')
+    live = LiveNetwork(network, pos, ChangeFeed(path))
+    client = live.figure()
+    version = live.version
+    append(path, {'op': 'upsert', 'source_id': 953, 'target_id': 954, 'weights': 5})
+    live.poll()
+    patch, new_version = live.update(version)
+    assert isinstance(patch, Patch) and new_version == live.version
+    for operation in patch.to_plotly_json()['operations']:
+        assert operation['location'][0] == 'data'
+        client['data'][operation['location'][1]] = operation['params']['value']
+    assert client == live.figure()
+
+
+def test_update_sends_the_whole_figure_when_the_traces_change(tmp_path, network, pos):
+    path = str(tmp_path/'changes.jsonl')
+    live = LiveNetwork(network, pos, ChangeFeed(path))
+    version = live.version
+    #a node with a new color adds a trace, so the positions of the traces change
+    append(path, {'op': 'upsert', 'node_id': 990, 'node_label': 'N990', 'node_color': 'purple'},
+           {'op': 'upsert', 'source_id': 990, 'target_id': 966, 'weights': 3})
+    live.poll()
+    figure, new_version = live.update(version)
+    assert figure == live.figure() and new_version == live.version
+    assert 'nodes-purple' in [trace.get('uid') for trace in figure['data']]
@@ -0,0 +1,85 @@
+'''
+The spans, their Prometheus text and the /metrics routes of the server.
+'''
+import os
+
+import pytest
+from flask import Flask
+
+from metrics import observe, register_metrics_routes, render_prometheus, reset, span
+
+
+@pytest.fixture(autouse=True)
+def empty_histograms():
+    reset()
+    yield
+    reset()
+
+
+def test_histograms_are_cumulative():
+    observe('stage', 0.001, name='read')
+    observe('stage', 0.2, name='read')
+    observe('stage', 100, name='read')
+    text = render_prometheus()
+    assert 'network_app_stage_seconds_bucket{name="read",le="0.005"} 1' in text
+    assert 'network_app_stage_seconds_bucket{name="read",le="0.25"} 2' in text
+    assert 'network_app_stage_seconds_bucket{name="read",le="+Inf"} 3' in text
+    assert 'network_app_stage_seconds_count{name="read"} 3' in text
+    assert '# TYPE network_app_request_seconds histogram' in text
+
+
+def test_span_labels_the_exceptions():
+    with pytest.raises(KeyError):
+        with span('lookup', detail='a "quoted"\nvalue'):
+            raise KeyError('x')
+    assert 'network_app_stage_seconds_count{detail="a \\"quoted\\"\\nvalue",name="lookup",outcome="KeyError"} 1' in render_prometheus()
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = Flask(__name__)
+
+    @server.route('/ok/<int:value>')
+    def ok(value):
+        return str(value)
+
+    @server.route('/fail')
+    def fail():
+        raise RuntimeError('failed')
+
+    register_metrics_routes(server, profiling=True, profile_dir=str(tmp_path))
+    return server
+
+
+def test_requests_are_timed_by_route(server):
+    client = server.test_client()
+    for value in (1, 2):
+        assert client.get('/ok/%d' % value).status_code == 200
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'network_app_request_seconds_count{method="GET",route="/ok/<int:value>",status="200"} 2' in text
+
+
+@pytest.mark.parametrize('mode', ['cpu', 'memory'])
+def test_the_profiler_is_released_when_the_request_raises(server, mode):
+    server.config['PROPAGATE_EXCEPTIONS'] = True
+    client = server.test_client()
+    with pytest.raises(RuntimeError):
+        client.get('/fail', headers={'X-Profile': mode})
+    response = client.get('/ok/1', headers={'X-Profile': mode})
+    assert os.path.exists(response.headers['X-Profile-File'])
+    assert len(os.listdir(os.path.dirname(response.headers['X-Profile-File']))) == 2
+
+
+def test_the_armed_profiler_profiles_the_next_matching_request(server):
+    client = server.test_client()
+    assert client.get('/metrics/profile?mode=cpu&path=/ok').get_json() == {'armed': 'cpu', 'path': '/ok'}
+    assert 'X-Profile-File' not in client.get('/metrics').headers
+    assert client.get('/ok/3').headers['X-Profile-File'].endswith('.prof')
+    assert 'X-Profile-File' not in client.get('/ok/4').headers
+    assert client.get('/metrics/profile?mode=disk').status_code == 404
+
+
+def test_profiling_is_off_by_default():
+    server = Flask(__name__)
+    register_metrics_routes(server)
+    assert server.test_client().get('/metrics/profile').status_code == 404
@@ -0,0 +1,80 @@
+'''
+Reading the datasets: the csv, parquet and arrow tables, the workbooks and their parquet sidecars.
+'''
+import os
+
+import pandas as pd
+import pytest
+
+import network_data
+from network_data import EDGE_SCHEMA, NODE_SCHEMA, read_dataset, read_sidecar, read_table, write_sidecar
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'small')
+
+
+@pytest.fixture(scope='module')
+def tables():
+    return (read_table(os.path.join(DATASET, 'edges.csv'), EDGE_SCHEMA),
+            read_table(os.path.join(DATASET, 'nodes.csv'), NODE_SCHEMA))
+
+
+def write_workbook(path, edges, nodes):
+    with pd.ExcelWriter(path) as writer:
+        edges.to_excel(writer, sheet_name='edges', index=False)
+        nodes.to_excel(writer, sheet_name='nodes', index=False)
+
+
+def test_csv_reads_only_the_columns_of_the_schema(tables, tmp_path):
+    edges = tables[0]
+    assert list(edges.columns) == list(EDGE_SCHEMA)
+    assert edges.dtypes.astype(str).tolist() == ['int64', 'int64', 'float64']
+    path = str(tmp_path/'edges.csv')
+    edges.assign(comment='x').to_csv(path, index=False)
+    pd.testing.assert_frame_equal(read_table(path, EDGE_SCHEMA), edges)
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.arrow', '.feather'])
+def test_parquet_and_arrow_tables_match_the_csv(tables, tmp_path, extension):
+    pytest.importorskip('pyarrow')
+    for frame, schema, name in ((tables[0], EDGE_SCHEMA, 'edges'), (tables[1], NODE_SCHEMA, 'nodes')):
+        path = str(tmp_path/(name + extension))
+        extra = frame.assign(extra=1)
+        extra.to_parquet(path, index=False) if extension == '.parquet' else extra.to_feather(path)
+        pd.testing.assert_frame_equal(read_table(path, schema), frame)
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.parquet'])
+def test_missing_columns_are_reported(tables, tmp_path, extension):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path/('edges' + extension))
+    frame = tables[0].drop(columns='weights')
+    frame.to_csv(path, index=False) if extension == '.csv' else frame.to_parquet(path, index=False)
+    with pytest.raises(ValueError):
+        read_table(path, EDGE_SCHEMA)
+
+
+def test_the_sidecar_is_read_back_and_dropped_when_the_workbook_changes(tables, tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path/'network.xlsx')
+    write_workbook(path, *tables)
+    assert read_sidecar(path) is None
+    write_sidecar(path, *tables)
+    for read, table in zip(read_sidecar(path), tables):
+        pd.testing.assert_frame_equal(read, table)
+    #another version of the workbook doesn't match the hash of the sidecar
+    write_workbook(path, tables[0].iloc[:-1], tables[1])
+    assert read_sidecar(path) is None
+    edges, nodes = read_dataset(path)
+    assert len(edges) == len(tables[0]) - 1
+    assert len(read_sidecar(path)[0]) == len(tables[0]) - 1
+
+
+def test_the_workbook_is_parsed_once(tables, tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path/'network.xlsx')
+    write_workbook(path, *tables)
+    read_dataset(path)
+    monkeypatch.setattr(network_data, 'read_workbook', lambda path: pytest.fail('the sidecar was not used'))
+    edges, nodes = read_dataset(path)
+    pd.testing.assert_frame_equal(edges, tables[0])
+    pd.testing.assert_frame_equal(nodes, tables[1])
@@ -0,0 +1,81 @@
+'''
+The grid index of the viewport culling, against a scan of all the segments.
+'''
+import numpy as np
+import pytest
+
+from viewport import GridIndex
+
+
+def orientation(a, b, c):
+    return np.sign((b[0] - a[0])*(c[1] - a[1]) - (b[1] - a[1])*(c[0] - a[0]))
+
+
+def on_segment(a, b, c):
+    return min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= c[1] <= max(a[1], b[1])
+
+
+def crosses(a, b, c, d):
+    '''
+    Returns:
+    -True if the segments ab and cd have a common point
+    '''
+    o1, o2, o3, o4 = orientation(a, b, c), orientation(a, b, d), orientation(c, d, a), orientation(c, d, b)
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and on_segment(a, b, c)) or (o2 == 0 and on_segment(a, b, d))
+            or (o3 == 0 and on_segment(c, d, a)) or (o4 == 0 and on_segment(c, d, b)))
+
+
+def brute_force(start, end, view):
+    '''
+    Returns:
+    -the positions of the segments with an end inside the range or crossing one of its sides
+    '''
+    x0, x1, y0, y1 = view
+    corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    found = []
+    for i, (a, b) in enumerate(zip(start, end)):
+        inside = any(x0 <= p[0] <= x1 and y0 <= p[1] <= y1 for p in (a, b))
+        if inside or any(crosses(a, b, corners[j], corners[(j + 1) % 4]) for j in range(4)):
+            found.append(i)
+    return found
+
+
+@pytest.fixture(scope='module')
+def segments():
+    rng = np.random.default_rng(0)
+    start = rng.random((600, 2))*10
+    #short edges, long edges across the whole range and points
+    length = np.concatenate([rng.random(300)*0.5, 3 + rng.random(200)*10, np.zeros(100)])
+    angle = rng.random(600)*2*np.pi
+    end = start + length[:, None]*np.column_stack([np.cos(angle), np.sin(angle)])
+    return start, end
+
+
+def test_query_finds_the_segments_of_a_scan(segments):
+    start, end = segments
+    grid = GridIndex(start, end, np.arange(len(start)))
+    rng = np.random.default_rng(1)
+    for size in (0.05, 0.5, 2, 8, 30):
+        for _ in range(20):
+            x0, y0 = rng.random(2)*12 - 1
+            view = (x0, x0 + size, y0, y0 + size*rng.uniform(0.5, 2))
+            assert grid.query(view).tolist() == brute_force(start, end, view), view
+
+
+def test_points_on_the_border_of_the_range():
+    points = np.array([[0.0, 0.0], [1.0, 1.0], [0.5, 1.0], [2.0, 2.0]])
+    grid = GridIndex(points, points, np.ones(len(points)))
+    assert grid.query((0.5, 1.0, 0.5, 1.0)).tolist() == [1, 2]
+
+
+def test_visible_keeps_the_highest_priorities(segments):
+    start, end = segments
+    grid = GridIndex(start, end, np.arange(len(start)))
+    view = (0, 10, 0, 10)
+    found = grid.query(view)
+    shown, cut = grid.visible(view, 50)
+    assert cut and shown.tolist() == sorted(found[-50:].tolist())
+    shown, cut = grid.visible(view, len(start))
+    assert not cut and shown.tolist() == found.tolist()
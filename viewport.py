@@ -0,0 +1,323 @@
+'''
+Viewport culling of the 2-d figure, for large graphs.
+
+Instead of holding every edge in the browser, the 2-d graph sends its visible range (relayoutData) to the
+server, which answers with a figure holding only the edges, nodes and middle nodes inside that range.
+The edges and the nodes are kept in a multi-level grid (GridIndex), every edge in the cells it crosses, so a query
+visits only the cells of the range and the edges that pass through them instead of all the elements. When more than max_edges edges or
+max_nodes nodes are visible the figure is an overview with the heaviest edges and the nodes with the most
+connections, found by scanning the elements in that order, so the size of the answer and the time to build it
+are bounded by the maximum number of elements shown and not by the size of the graph.
+'''
+from collections import namedtuple
+
+import numpy as np
+
+from aggregation import node_colors
+from figures import HOVER_MODE, RENDER_MODE, WEIGHT_BUCKETS, assemble_spec_2d, node_marker_specs, with_template
+from metrics import timed
+
+VIEWPORT_MAX_EDGES = 1500 # above this number of visible edges only the heaviest ones are sent
+VIEWPORT_MAX_NODES = 2000 # above this number of visible nodes only the most connected ones are sent
+VIEWPORT_SVG_EDGES = 200 # in 'auto' render mode, the arrows are svg annotations up to this number of edges sent
+OVERVIEW_SCAN = 4 # the overview scans up to OVERVIEW_SCAN*max elements in priority order before querying the grid
+MAX_SEGMENT_CELLS = 16 # an edge is stored at the finest level of the grid where it crosses about this many cells
+
+#everything that is needed to answer a viewport query: the grids over the edges and the nodes,
+#the positions of the nodes in the order of the index nodes, their colors and the range of the whole figure
+Viewport = namedtuple('Viewport', ['edges', 'nodes', 'coords', 'colors', 'bounds'])
+
+
+def concatenated_ranges(starts, ends):
+    '''
+    -starts, ends: arrays with the beginning and the (exclusive) ending of every range
+
+    Returns:
+    -the concatenation of all the ranges, without a python loop over them
+    '''
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
+
+
+class GridIndex:
+    '''
+    Multi-level grid over segments, a point is a segment of length zero.
+
+    Level l cuts the square covering all the segments in 2^l x 2^l cells. Every segment is stored at the finest
+    level where it crosses at most about MAX_SEGMENT_CELLS cells, once in every cell it crosses, so a long edge is
+    found only in the cells along it and not in the cells of its bounding box. A query visits the cells of the range
+    at every level; the keys of the cells are kept sorted, so the segments of a column of cells are one contiguous
+    slice found with a binary search. The segments of the cells inside the range pass through it, only the ones of
+    the cells on its border are tested.
+
+    Attributes:
+    -start, end: arrays (n, 2) with the two ends of every segment
+    -priority: array with the priority of every segment, the overview keeps the segments with the highest priority
+    -rank: the positions of the segments in decreasing priority
+    -origin, extent: the lower left corner and the side of the square covering all the segments
+    -levels: list with (cells per axis, sorted cell keys, positions of the segments in the order of the keys) per level
+    '''
+
+    def __init__(self, start, end, priority):
+        self.start = np.asarray(start, dtype=float).reshape(-1, 2)
+        self.end = np.asarray(end, dtype=float).reshape(-1, 2)
+        self.priority = np.asarray(priority, dtype=float)
+        self.rank = np.argsort(-self.priority, kind='stable')
+        n = len(self.start)
+        lower, upper = np.minimum(self.start, self.end), np.maximum(self.start, self.end)
+        self.origin = lower.min(axis=0) if n else np.zeros(2)
+        self.extent = max(float((upper.max(axis=0) - self.origin).max()) if n else 0.0, 1e-12)
+        finest = max(int(np.ceil(np.log2(max(n, 1))/2)), 0) #about n cells at the finest level
+        #a segment crosses about 2^l*(|dx| + |dy|)/extent cells of level l
+        length = np.abs(upper - lower).sum(axis=1)
+        with np.errstate(divide='ignore', over='ignore'):
+            level = np.floor(np.log2(MAX_SEGMENT_CELLS*self.extent/length))
+        level = np.clip(np.nan_to_num(level, posinf=finest), 0, finest).astype(int)
+        self.levels = []
+        for l in range(finest + 1):
+            members, keys = self.crossed_cells(np.flatnonzero(level == l), 2**l)
+            order = np.argsort(keys, kind='stable')
+            #a long edge has up to about MAX_SEGMENT_CELLS entries, kept in 32 bits
+            self.levels.append((2**l, keys[order].astype(np.int32), members[order].astype(np.int32)))
+
+    def __len__(self):
+        return len(self.start)
+
+    def cells(self, points, n_cells):
+        '''
+        -points: array (n, 2) with coordinates
+        -n_cells: the number of cells per axis of the level
+
+        Returns:
+        -the column and the row of the cell of every point, clipped to the grid
+        '''
+        cell = np.floor((np.asarray(points, dtype=float) - self.origin)/self.extent*n_cells)
+        return np.clip(cell, 0, n_cells - 1).astype(np.int64)
+
+    def cell_keys(self, points, n_cells):
+        '''
+        -points: array (n, 2) with coordinates
+        -n_cells: the number of cells per axis of the level
+
+        Returns:
+        -the key of the cell of every point, column*n_cells + row
+        '''
+        cell = self.cells(points, n_cells).reshape(-1, 2)
+        return cell[:, 0]*n_cells + cell[:, 1]
+
+    def crossed_cells(self, members, n_cells):
+        '''
+        -members: positions of segments
+        -n_cells: the number of cells per axis of the level
+
+        Returns:
+        -the positions of the segments, repeated once for every cell they cross
+        -the keys of the crossed cells
+        The segments are cut where they cross the lines between the cells, and every piece is in the cell of its middle.
+        '''
+        start, end = self.start[members], self.end[members]
+        owners, params = [np.arange(len(members))]*2, [np.zeros(len(members)), np.ones(len(members))]
+        for axis in (0, 1):
+            a = (start[:, axis] - self.origin[axis])/self.extent*n_cells
+            b = (end[:, axis] - self.origin[axis])/self.extent*n_cells
+            #the lines k strictly between the two ends, in the units of the cells
+            first = np.floor(np.minimum(a, b)).astype(np.int64) + 1
+            count = np.maximum(np.ceil(np.maximum(a, b)).astype(np.int64) - first, 0)
+            owner = np.repeat(np.arange(len(members)), count)
+            lines = concatenated_ranges(first, first + count)
+            owners.append(owner)
+            params.append((lines - a[owner])/(b[owner] - a[owner]))
+        owners, params = np.concatenate(owners), np.concatenate(params)
+        order = np.lexsort((params, owners))
+        owners, params = owners[order], params[order]
+        piece = np.flatnonzero(owners[:-1] == owners[1:])
+        owners = owners[piece]
+        middle = (params[piece] + params[piece + 1])/2
+        points = start[owners] + middle[:, None]*(end[owners] - start[owners])
+        return members[owners], self.cell_keys(points, n_cells)
+
+    def overlaps(self, members, view):
+        '''
+        -members: positions of segments
+        -view: the visible range (x0, x1, y0, y1)
+
+        Returns:
+        -a boolean array, True for the segments that pass through the range
+        '''
+        #the part of every segment inside the range, as the interval [low, high] of its parameter (Liang-Barsky)
+        start, delta = self.start[members], self.end[members] - self.start[members]
+        low, high = np.zeros(len(start)), np.ones(len(start))
+        inside = np.ones(len(start), dtype=bool)
+        for axis, (bottom, top) in enumerate((view[:2], view[2:])):
+            s, d = start[:, axis], delta[:, axis]
+            flat = d == 0
+            inside &= ~flat | ((s >= bottom) & (s <= top))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t0, t1 = (bottom - s)/d, (top - s)/d
+            low = np.where(flat, low, np.maximum(low, np.minimum(t0, t1)))
+            high = np.where(flat, high, np.minimum(high, np.maximum(t0, t1)))
+        return inside & (low <= high)
+
+    def query(self, view):
+        '''
+        -view: the visible range (x0, x1, y0, y1)
+
+        Returns:
+        -the sorted positions of all the segments that pass through the range
+        '''
+        x0, x1, y0, y1 = view
+        margin = self.extent*1e-9 #a segment that ends on the line between two cells is stored in one of them
+        found = []
+        for n_cells, keys, members in self.levels:
+            if len(keys) == 0:
+                continue
+            (ix0, iy0), (ix1, iy1) = self.cells([[x0 - margin, y0 - margin], [x1 + margin, y1 + margin]], n_cells)
+            columns = np.arange(ix0, ix1 + 1)
+            inner = (columns > ix0) & (columns < ix1)
+            #the inner rows of the inner columns, then the rows of the border: the first and last column whole,
+            #the first and last row of the inner columns
+            inside = members[self.cell_ranges(keys, n_cells, columns[inner], iy0 + 1, iy1 - 1)]
+            border = np.concatenate([members[self.cell_ranges(keys, n_cells, np.unique([ix0, ix1]), iy0, iy1)],
+                                     members[self.cell_ranges(keys, n_cells, columns[inner], iy0, iy0)],
+                                     members[self.cell_ranges(keys, n_cells, columns[inner], iy1, iy1)] if iy1 > iy0 else []])
+            border = border.astype(np.int64)
+            found += [inside, border[self.overlaps(border, view)]]
+        #a segment is stored in several cells, np.unique sorts the hits and keeps one of each
+        return np.unique(np.concatenate(found)).astype(np.int64) if found else np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def cell_ranges(keys, n_cells, columns, row0, row1):
+        '''
+        -keys: the sorted cell keys of a level
+        -n_cells: the number of cells per axis of the level
+        -columns: the columns of the cells
+        -row0, row1: the first and the last row of the cells in every column
+
+        Returns:
+        -the positions in keys of the entries of the cells
+        '''
+        if row1 < row0 or not len(columns):
+            return np.zeros(0, dtype=np.int64)
+        #searching values of another type would convert all the keys
+        starts = np.searchsorted(keys, (columns*n_cells + row0).astype(keys.dtype))
+        ends = np.searchsorted(keys, (columns*n_cells + row1).astype(keys.dtype), side='right')
+        return concatenated_ranges(starts, ends)
+
+    def visible(self, view, limit):
+        '''
+        -view: the visible range (x0, x1, y0, y1)
+        -limit: the maximum number of segments returned
+
+        Returns:
+        -the sorted positions of the segments that pass through the range, at most limit of them. When more segments
+        are visible, the ones with the highest priority are kept.
+        -True if segments were left out
+        '''
+        #zoomed out: the first segments in priority order are mostly visible, so the overview is found without the grid
+        head = self.rank[:OVERVIEW_SCAN*limit]
+        head = head[self.overlaps(head, view)]
+        if len(head) > limit:
+            return np.sort(head[:limit]), True
+        found = self.query(view)
+        if len(found) <= limit:
+            return found, False
+        top = np.argpartition(-self.priority[found], limit - 1)[:limit]
+        return np.sort(found[top]), True
+
+
+@timed('build_viewport')
+def build_viewport(network, pos):
+    '''
+    -network: the Network of the dataset
+    -pos: a dictionary with key the node_id and value the array of 2-d positions of the node
+
+    Returns:
+    -the Viewport of the network. The edges are ranked by weight and the nodes by their number of connections.
+    '''
+    edge_index = network.edge_index
+    coords = edge_index.positions(pos)
+    start, end = edge_index.endpoints(coords)
+    degree = (np.bincount(edge_index.source_code, minlength=len(coords))
+              + np.bincount(edge_index.target_code, minlength=len(coords)))
+    edges = GridIndex(start, end, edge_index.weight)
+    nodes = GridIndex(coords, coords, degree)
+    if len(coords):
+        bounds = (coords[:, 0].min(), coords[:, 0].max(), coords[:, 1].min(), coords[:, 1].max())
+    else:
+        bounds = (0.0, 1.0, 0.0, 1.0)
+    return Viewport(edges, nodes, coords, node_colors(network)[0], tuple(float(bound) for bound in bounds))
+
+
+def visible_range(relayout_data, bounds):
+    '''
+    -relayout_data: the relayoutData of the graph, None before the first zoom
+    -bounds: the range (x0, x1, y0, y1) of the whole figure
+
+    Returns:
+    -the visible range (x0, x1, y0, y1). An axis without a range in relayout_data (autorange or not zoomed)
+    uses the range of the whole figure.
+    '''
+    relayout_data = relayout_data or {}
+    view = list(bounds)
+    for i, axis in enumerate(('xaxis', 'yaxis')):
+        if relayout_data.get(axis + '.autorange'):
+            continue
+        axis_range = relayout_data.get(axis + '.range')
+        if axis_range is None and axis + '.range[0]' in relayout_data:
+            axis_range = [relayout_data[axis + '.range[0]'], relayout_data[axis + '.range[1]']]
+        if axis_range is not None:
+            view[2*i], view[2*i + 1] = sorted(float(value) for value in axis_range)
+    return tuple(view)
+
+
+@timed('viewport_figure')
+def create_viewport_figure(network, viewport, view, render_mode=RENDER_MODE, hover=HOVER_MODE,
+                           max_edges=VIEWPORT_MAX_EDGES, max_nodes=VIEWPORT_MAX_NODES, n_buckets=WEIGHT_BUCKETS):
+    '''
+    -network: the Network of the dataset
+    -viewport: the Viewport of the network
+    -view: the visible range (x0, x1, y0, y1)
+    -render_mode: 'svg', 'webgl' or 'auto', chosen from the number of edges sent (see VIEWPORT_SVG_EDGES)
+    -hover: 'callback' or 'embedded', see figures.middle_trace_text
+    -max_edges, max_nodes: the maximum number of edges and nodes in the figure
+    -n_buckets: the maximum number of width/opacity levels of the edges, see figures.weight_buckets
+
+    Returns:
+    -the spec of the 2-d figure with the visible part of the network, serialized by figures.figure_json. The reverse edges of the two-way edges and the visible
+    ends of the edges are always added, so at most 2*max_edges edges and max_nodes + 2*max_edges nodes are sent.
+    The middle nodes are sent only for the edges with the middle inside the range. The widths and colors
+    of the edges are the ones of the full figure. uirevision keeps the zoom of the user when the figure is replaced.
+    '''
+    edge_index = network.edge_index
+    rows, edges_cut = viewport.edges.visible(view, max_edges)
+    n_visible = len(rows)
+    reverse = edge_index.reverse[rows]
+    rows = np.union1d(rows, reverse[reverse >= 0])
+    shown = edge_index.take(rows)
+
+    nodes, nodes_cut = viewport.nodes.visible(view, max_nodes)
+    ends = np.concatenate([shown.source_code, shown.target_code])
+    nodes = np.union1d(nodes, ends[viewport.nodes.overlaps(ends, view)])
+
+    midpoints = shown.midpoints(viewport.coords)
+    x0, x1, y0, y1 = view
+    middle_rows = np.flatnonzero((midpoints[:, 0] >= x0) & (midpoints[:, 0] <= x1) & (midpoints[:, 1] >= y0) & (midpoints[:, 1] <= y1))
+    middle = shown.take(middle_rows)
+
+    if render_mode == 'auto':
+        render_mode = 'svg' if len(shown) <= VIEWPORT_SVG_EDGES else 'webgl' #one annotation per edge is slow to build and draw
+    node_specs = node_marker_specs(viewport.coords[nodes], np.asarray(network.node_labels, dtype=object)[nodes],
+                                   viewport.colors[nodes], render_mode=render_mode)
+    spec = assemble_spec_2d(shown, network.node_labels, viewport.coords, node_specs,
+                            render_mode=render_mode, hover=hover, middle_index=middle, n_buckets=n_buckets)
+    title = 'Network 2-d visualization'
+    if edges_cut or nodes_cut:
+        #the reverse edges added to the heaviest ones are not counted
+        title += ': overview with the %d heaviest of the visible edges, zoom in for all of them' % n_visible
+    spec['layout'].update(title={'text': title}, uirevision='viewport')
+    return with_template(spec)
+